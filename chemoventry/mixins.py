@@ -0,0 +1,222 @@
+import hashlib
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified validation for ``list`` and ``retrieve``.
+
+    The validator is one aggregate query over the filtered queryset: the
+    row count and the latest of ``last_modified_fields`` (which may follow
+    relations the serializer renders, e.g. ``location__updated_at``),
+    together with the full request path, so filters and pagination cursors
+    get their own ETags. ``If-None-Match``/``If-Modified-Since`` are answered
+    with 304 before the page is loaded or serialized.
+
+    Deleting a row need not change the latest modification time, so views
+    can return the time of the latest deletion from ``get_last_deleted()``.
+    """
+
+    last_modified_fields = ('updated_at',)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional_response(
+            request, queryset, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+            include_deletions=True,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.get_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return self._conditional_response(
+            request, queryset, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+    def get_last_deleted(self):
+        return None
+
+    def _conditional_response(self, request, queryset, get_response, include_deletions=False):
+        validators = queryset.order_by().aggregate(
+            count=Count('pk'),
+            **{f'modified_{index}': Max(field) for index, field in enumerate(self.last_modified_fields)}
+        )
+        count = validators.pop('count')
+        timestamps = [value for value in validators.values() if value is not None]
+        if include_deletions:
+            timestamps.append(self.get_last_deleted())
+            timestamps = [value for value in timestamps if value is not None]
+        elif not count:
+            return get_response()  # a 404
+
+        modified = max(timestamps) if timestamps else None
+        digest = hashlib.md5(
+            f'{request.get_full_path()}|{count}|{modified and modified.isoformat()}'.encode(),
+            usedforsecurity=False,
+        ).hexdigest()
+        etag = quote_etag(digest)
+        # HTTP dates have one-second resolution
+        last_modified = int(modified.timestamp()) if modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # Let clients keep the response but revalidate before using it
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class QueryOptimizerMixin:
+    """
+    Derive ``select_related``/``prefetch_related``/``only()`` for a view's
+    queryset from the fields its serializer renders.
+
+    Dotted ``source=`` paths through forward relations become
+    ``select_related``, to-many relations become ``prefetch_related`` and,
+    for read requests, only the columns the serializer needs are loaded.
+
+    ``SerializerMethodField``s are opaque, so a serializer can list the model
+    attributes they read in ``Meta.method_field_sources``, e.g.
+    ``{'unit': ['chemical_state']}``. Without a hint (or when a source is not
+    a model field) every column of the affected model is loaded.
+
+    Fields the paginator orders by are always loaded as well, since the
+    cursor is built from them.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        return optimize_queryset(
+            queryset,
+            self.get_serializer_class(),
+            defer_columns=self.request.method in SAFE_METHODS,
+            extra_fields=[field.lstrip('-') for field in ordering],
+        )
+
+
+def optimize_queryset(queryset, serializer_class, defer_columns=True, extra_fields=()):
+    plan = _get_plan(serializer_class, queryset.model)
+    if plan.select_related:
+        queryset = queryset.select_related(*plan.select_related)
+    if plan.prefetch_related:
+        queryset = queryset.prefetch_related(*plan.prefetch_related)
+    if defer_columns:
+        queryset = queryset.only(*plan.only, *extra_fields)
+    return queryset
+
+
+class _QueryPlan:
+    def __init__(self, model):
+        self.select_related = set()
+        self.prefetch_related = set()
+        # Relation path prefix -> (model, loaded field names or None for all).
+        self.columns = {'': (model, {model._meta.pk.name})}
+
+    @property
+    def only(self):
+        only = []
+        for prefix, (model, names) in self.columns.items():
+            if names is None:
+                names = [field.name for field in model._meta.concrete_fields]
+            only.extend(prefix + name for name in names)
+        return sorted(only)
+
+    def load_all(self, prefix):
+        model, _ = self.columns[prefix]
+        self.columns[prefix] = (model, None)
+
+    def load(self, prefix, name):
+        names = self.columns[prefix][1]
+        if names is not None:
+            names.add(name)
+
+    def join(self, prefix, related_model):
+        self.columns.setdefault(prefix, (related_model, {related_model._meta.pk.name}))
+
+
+_plans = {}
+
+
+def _get_plan(serializer_class, model):
+    key = (serializer_class, model)
+    if key not in _plans:
+        plan = _QueryPlan(model)
+        _add_serializer(plan, serializer_class(), model, '')
+        _plans[key] = plan
+    return _plans[key]
+
+
+def _add_serializer(plan, serializer, model, prefix):
+    hints = getattr(getattr(serializer, 'Meta', None), 'method_field_sources', {})
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            if name not in hints:
+                plan.load_all(prefix)
+                continue
+            for source in hints[name]:
+                _add_source(plan, source.split('.'), model, prefix)
+        elif isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+            plan.prefetch_related.add(prefix + '__'.join(field.source_attrs))
+            _add_source(plan, field.source_attrs[:-1], model, prefix)
+        elif isinstance(field, serializers.BaseSerializer):
+            related_model, related_prefix = _add_source(
+                plan, field.source_attrs, model, prefix, follow_relation=True
+            )
+            if related_model is not None:
+                _add_serializer(plan, field, related_model, related_prefix)
+        else:
+            _add_source(plan, field.source_attrs, model, prefix)
+
+
+def _add_source(plan, attrs, model, prefix, follow_relation=False):
+    """
+    Record what is needed to read the attribute path ``attrs`` starting at
+    ``model``. A trailing foreign key only needs its column unless
+    ``follow_relation`` is set (nested serializers). Returns the model and
+    prefix reached by the path, or ``(None, None)`` when it ends elsewhere.
+    """
+    for index, attr in enumerate(attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # A property or plain attribute; it may read any column.
+            plan.load_all(prefix)
+            return None, None
+
+        if not field.is_relation:
+            plan.load(prefix, attr)
+            return None, None
+
+        if field.many_to_many or field.one_to_many:
+            plan.prefetch_related.add(prefix + attr)
+            return None, None
+
+        if field.concrete:
+            plan.load(prefix, attr)
+        if index == len(attrs) - 1 and field.concrete and not follow_relation:
+            # Only the foreign key value is rendered.
+            return None, None
+
+        plan.select_related.add(prefix + attr)
+        model = field.related_model
+        prefix = prefix + attr + '__'
+        plan.join(prefix, model)
+
+    return model, prefix
@@ -0,0 +1,24 @@
+"""
+Content negotiation for download endpoints.
+
+Report and export endpoints take ``?format=`` to choose the file they
+produce (pdf/excel, csv/ndjson). DRF reads the same parameter
+(``URL_FORMAT_OVERRIDE``) to pick a renderer and answers 404 when none
+matches, so those views negotiate without it. Everywhere else ``?format=``
+keeps its DRF meaning.
+"""
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.settings import api_settings
+
+
+class _ExportNegotiationSettings:
+    """``api_settings`` without the renderer override parameter."""
+
+    URL_FORMAT_OVERRIDE = None
+
+    def __getattr__(self, name):
+        return getattr(api_settings, name)
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    settings = _ExportNegotiationSettings()
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -37,7 +38,7 @@ ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS').split(',')
 CORS_ALLOW_ALL_ORIGINS = os.environ.get('DEBUG', 'True').lower() == 'true'  # Only for development
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = os.environ.get('CORS_ALLOWED_ORIGINS').split(',')
-CORS_EXPOSE_HEADERS = ['Content-Disposition']  # Needed for file downloads
+CORS_EXPOSE_HEADERS = ['Content-Disposition', 'ETag', 'Last-Modified', 'Idempotent-Replayed', 'Retry-After']  # Needed for file downloads, revalidation, retries and rate limits
 CORS_ALLOW_METHODS = [
     "DELETE",
     "GET",
@@ -52,6 +53,9 @@ CORS_ALLOW_HEADERS = [
     "authorization",
     "content-type",
     "dnt",
+    "idempotency-key",
+    "if-modified-since",
+    "if-none-match",
     "origin",
     "user-agent",
     "x-csrftoken",
@@ -73,6 +77,7 @@ INSTALLED_APPS = [
     "drf_spectacular",
     "rest_framework_simplejwt",
     "corsheaders",
+    "django_filters",
 
     #locqal party
     "users",
@@ -128,13 +133,52 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Tests use a file rather than shared-cache memory so concurrent
+            # writers wait on the lock instead of failing with "table is locked"
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
         }
     }
 
+# Cache
+# Shared by every worker process so that invalidation in one is seen by all.
+# Set REDIS_URL to use Redis; otherwise a file-based cache is used.
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        },
+        'throttle': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+            'KEY_PREFIX': 'throttle',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'chemoventry_cache')),
+        },
+        # Rate limit counters (chemoventry.throttling), kept apart so that
+        # they don't count towards the default cache's MAX_ENTRIES. The file
+        # cache's incr is a read and a write, so concurrent requests can lose
+        # counts and the limits are approximate; set REDIS_URL for exact ones.
+        'throttle': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get(
+                'THROTTLE_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'chemoventry_throttle')
+            ),
+        },
+    }
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.environ.get('JWT_ACCESS_TOKEN_LIFETIME_MINUTES', 60))),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.environ.get('JWT_REFRESH_TOKEN_LIFETIME_DAYS', 7))),
     'ROTATE_REFRESH_TOKENS': True,
+    # Enforced by users.blacklist rather than the token_blacklist app
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': os.environ.get('JWT_SECRET_KEY', SECRET_KEY),
@@ -150,10 +194,69 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',  
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ],
+    # Sliding-window limits per user (per IP when anonymous); views opt into
+    # stricter ones with a throttle_scope.
+    'DEFAULT_THROTTLE_CLASSES': [
+        'chemoventry.throttling.AnonRateThrottle',
+        'chemoventry.throttling.UserRateThrottle',
+        'chemoventry.throttling.ScopedRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': os.environ.get('THROTTLE_ANON_RATE', '100/hour'),
+        'user': os.environ.get('THROTTLE_USER_RATE', '1000/hour'),
+        'auth': os.environ.get('THROTTLE_AUTH_RATE', '20/hour'),
+        'reports': os.environ.get('THROTTLE_REPORTS_RATE', '60/hour'),
+    },
+    # Anonymous clients are limited by IP. Render's load balancer is one
+    # proxy hop that appends the client address to X-Forwarded-For, so only
+    # that last entry is trusted; anything before it is client supplied.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
 }
 
+# Background report jobs (?async=1 on the report endpoints). Queued jobs are
+# picked up by this many threads in each web process; set it to 0 to leave
+# them to `manage.py run_report_workers`.
+REPORT_JOB_LOCAL_WORKERS = int(os.environ.get('REPORT_JOB_LOCAL_WORKERS', 2))
+# A job running for longer is assumed to have lost its worker and is run again.
+REPORT_JOB_TIMEOUT_MINUTES = int(os.environ.get('REPORT_JOB_TIMEOUT_MINUTES', 30))
+
+# Dashboard overview cache. Entries are fresh for DASHBOARD_CACHE_TTL seconds
+# and until inventory data changes; after that they are still served for up
+# to DASHBOARD_CACHE_MAX_STALE seconds while one worker recomputes them.
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 300))
+DASHBOARD_CACHE_MAX_STALE = int(os.environ.get('DASHBOARD_CACHE_MAX_STALE', 3600))
+
+# Facet counts on the chemical list (?facets=) are cached per filter
+# combination for this many seconds, or until inventory data changes.
+CHEMICAL_FACET_CACHE_TTL = int(os.environ.get('CHEMICAL_FACET_CACHE_TTL', 300))
+
+# Idempotency-Key on write requests: a key's stored response is replayed for
+# IDEMPOTENCY_KEY_TTL_HOURS. A key whose request never finished is released
+# after IDEMPOTENCY_PROCESSING_TIMEOUT seconds so the client can retry.
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+IDEMPOTENCY_PROCESSING_TIMEOUT = int(os.environ.get('IDEMPOTENCY_PROCESSING_TIMEOUT', 600))
+
+# Authenticated users are cached per process for AUTH_USER_CACHE_TTL seconds
+# (see users.authentication). Each use checks the user's stamp in the shared
+# cache, so changes to a user, revocations included, take effect once they
+# commit.
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 30))
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', 10000))
+
+# Each process picks up refresh tokens revoked by others (users.blacklist)
+# every REVOKED_TOKEN_SYNC_INTERVAL seconds.
+REVOKED_TOKEN_SYNC_INTERVAL = int(os.environ.get('REVOKED_TOKEN_SYNC_INTERVAL', 5))
+
+# Bulk user provisioning hashes passwords in this many processes per web
+# worker. Capped by default, since every web worker may start its own pool.
+USER_PROVISIONING_WORKERS = int(os.environ.get('USER_PROVISIONING_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Tombstones of deleted chemicals are kept this long for /api/chemical/changes/;
+# clients with an older sync token get a full resync.
+CHEMICAL_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('CHEMICAL_TOMBSTONE_RETENTION_DAYS', 90))
+
 # API Documentation
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Chemoventy API',
@@ -172,8 +275,10 @@ SPECTACULAR_SETTINGS = {
     - Statistics and Analytics
     
     ## Rate Limiting
-    - API requests are limited to 100 per hour for authenticated users
-    - Authentication endpoints are limited to 5 attempts per hour
+    - API requests are limited to 1000 per hour per user, and 100 per hour per IP address without authentication
+    - Login and registration are limited to 20 attempts per hour per IP address
+    - Report generation is limited to 60 reports per hour per user
+    - Requests over the limit get 429 Too Many Requests with a `Retry-After` header (seconds)
     
     ## File Upload
     - Supported formats: JPG, PNG
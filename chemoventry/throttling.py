@@ -0,0 +1,124 @@
+"""
+Sliding-window rate limits.
+
+Each throttle counts requests per fixed window of its rate's period (e.g.
+an hour) with ``cache.incr`` and estimates the last full period as the
+current window's count plus the previous window's, weighted by how much
+of it still overlaps. That smooths out bursts at window boundaries at the
+cost of two counters per client, instead of DRF's list of timestamps.
+
+Counters live in the ``throttle`` cache, which every worker shares. Only
+Redis increments atomically; with the file-based fallback two requests
+racing on a counter can both write the same count, so the limits are
+approximate (they can only let slightly more requests through).
+
+Rates are set per scope in ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']``; a
+rejected request gets 429 with a ``Retry-After`` header. Anonymous clients
+are identified by ``get_ident``, which trusts the last
+``REST_FRAMEWORK['NUM_PROXIES']`` entries of ``X-Forwarded-For``.
+"""
+import math
+
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """Base class; subclasses set ``scope`` and ``get_cache_key``."""
+
+    cache = caches['throttle']
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        current_key, previous_key = f'{self.key}:{window}', f'{self.key}:{window - 1}'
+        counts = self.cache.get_many([current_key, previous_key])
+        self.current = counts.get(current_key, 0)
+        self.previous = counts.get(previous_key, 0)
+        self.elapsed = self.now - window * self.duration
+
+        if self._estimate(self.previous, self.current, self.elapsed) >= self.num_requests:
+            return self.throttle_failure()
+
+        # The previous window is still read during the next one
+        if not self.cache.add(current_key, 1, timeout=2 * self.duration):
+            try:
+                self.cache.incr(current_key)
+            except ValueError:
+                # Expired in between
+                self.cache.add(current_key, 1, timeout=2 * self.duration)
+        return self.throttle_success()
+
+    def throttle_success(self):
+        return True
+
+    def _estimate(self, previous, current, elapsed):
+        return previous * (1 - elapsed / self.duration) + current
+
+    def wait(self):
+        """Seconds until the estimate drops below the limit again."""
+        previous, current, elapsed = self.previous, self.current, self.elapsed
+        wait = 0
+        if current >= self.num_requests:
+            # Only the next window can help: this one becomes its previous
+            wait = self.duration - elapsed
+            previous, current, elapsed = current, 0, 0
+        if previous:
+            # previous * (1 - t / duration) + current < num_requests
+            until = self.duration * (1 - (self.num_requests - current) / previous)
+            wait += max(until - elapsed, 0)
+        return max(math.ceil(wait), 1)
+
+
+class AnonRateThrottle(SlidingWindowRateThrottle):
+    """Limits anonymous requests per IP address."""
+
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class UserRateThrottle(SlidingWindowRateThrottle):
+    """Limits requests per user, or per IP address when anonymous."""
+
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class ReportRateThrottle(UserRateThrottle):
+    """Report generation per user."""
+
+    scope = 'reports'
+
+
+class ScopedRateThrottle(UserRateThrottle):
+    """Per user (or IP) limit for views that set a ``throttle_scope``."""
+
+    scope_attr = 'throttle_scope'
+
+    def __init__(self):
+        # The rate depends on the view, so it is resolved in allow_request
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
@@ -23,11 +23,13 @@ from drf_spectacular.views import (
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
-from rest_framework_simplejwt.views import TokenRefreshView
-from users.views import CustomTokenObtainPairView
+from users.views import CustomTokenObtainPairView, CustomTokenRefreshView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 # Import our new report views
-from inventory.reports import inventory_report, usage_report, expiry_report, low_stock_report
+from inventory.reports import (
+    inventory_report, usage_report, expiry_report, low_stock_report,
+    report_job_status, report_job_download,
+)
 
 # Main URL patterns
 urlpatterns = [
@@ -35,7 +37,7 @@ urlpatterns = [
     
     # Auth endpoints
     path('api/users/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/users/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/users/token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
 
     # Main API URLs
     path('api/users/', include('users.urls')),
@@ -51,6 +53,8 @@ urlpatterns = [
     path('api/reports/usage/', usage_report, name='usage_report'),
     path('api/reports/expiry/', expiry_report, name='expiry_report'),
     path('api/reports/low-stock/', low_stock_report, name='low_stock_report'),
+    path('api/reports/jobs/<uuid:job_id>/', report_job_status, name='report_job_status'),
+    path('api/reports/jobs/<uuid:job_id>/download/', report_job_download, name='report_job_download'),
 ]
 
 # Serve media files in development
@@ -0,0 +1,117 @@
+"""
+Point-in-time stock levels.
+
+A chemical's quantity at time T is its latest ``ChemicalBalanceCheckpoint``
+at or before T, with the activities recorded after that checkpoint (up to T)
+applied in order. Each chemical gets a checkpoint when it is created and
+whenever its quantity is edited directly. ``manage.py
+create_balance_checkpoints`` adds periodic ones, so a replay only ever
+covers the activity since the last run; queued report jobs also store the
+balances that took a long replay.
+"""
+from datetime import timedelta
+
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import ChemicalActivity, ChemicalBalanceCheckpoint, Chemicals
+
+# Activities are timestamped before their transaction commits, so the last
+# few minutes may still change; checkpoints are only written behind this lag.
+CHECKPOINT_LAG = timedelta(minutes=5)
+
+# A reconstruction that replays at least this many activities for a
+# chemical saves its result as a checkpoint (see ``balances_at``).
+REPLAY_CHECKPOINT_THRESHOLD = 100
+
+
+def balances_at(as_of, chemicals=None, save_checkpoints=False):
+    """
+    Return ``{chemical_id: quantity}`` at ``as_of`` for the chemicals (a
+    queryset, default all) that existed then. The quantity is ``None`` when
+    no checkpoint precedes ``as_of``, which only happens for chemicals
+    created before checkpoints were recorded.
+
+    With ``save_checkpoints``, balances that took a long replay are stored
+    as checkpoints so later requests for nearby times stay cheap.
+    """
+    if chemicals is None:
+        chemicals = Chemicals.objects.all()
+    chemicals = chemicals.filter(created_at__lte=as_of).order_by()
+
+    latest_checkpoint = ChemicalBalanceCheckpoint.objects.filter(
+        chemical=OuterRef('pk'), as_of__lte=as_of,
+    ).order_by('-as_of')
+    anchors = chemicals.annotate(
+        anchor_at=Subquery(latest_checkpoint.values('as_of')[:1]),
+        anchor_quantity=Subquery(latest_checkpoint.values('quantity')[:1]),
+    ).values_list('pk', 'anchor_at', 'anchor_quantity')
+
+    balances = {}
+    anchored = {}
+    for chemical_id, anchor_at, anchor_quantity in anchors:
+        balances[chemical_id] = anchor_quantity
+        if anchor_at is not None:
+            anchored[chemical_id] = anchor_at
+
+    if not anchored:
+        return balances
+
+    # The earliest anchor bounds the scan on the timestamp index; the
+    # per-chemical anchor then drops activities already in a checkpoint.
+    replayed = dict.fromkeys(anchored, 0)
+    activities = ChemicalActivity.objects.filter(
+        chemical__in=chemicals.values('pk'),
+        timestamp__gt=min(anchored.values()),
+        timestamp__lte=as_of,
+    ).alias(
+        anchor_at=Subquery(
+            ChemicalBalanceCheckpoint.objects.filter(
+                chemical=OuterRef('chemical'), as_of__lte=as_of,
+            ).order_by('-as_of').values('as_of')[:1]
+        ),
+    ).filter(
+        timestamp__gt=F('anchor_at'),
+    ).order_by('timestamp').values_list('chemical_id', 'action', 'quantity')
+
+    for chemical_id, action, quantity in activities.iterator(chunk_size=2000):
+        balances[chemical_id] = ChemicalActivity.apply_to_quantity(balances[chemical_id], action, quantity)
+        replayed[chemical_id] += 1
+
+    if save_checkpoints and as_of <= timezone.now() - CHECKPOINT_LAG:
+        write_checkpoints(as_of, {
+            chemical_id: balances[chemical_id]
+            for chemical_id, count in replayed.items()
+            if count >= REPLAY_CHECKPOINT_THRESHOLD
+        })
+    return balances
+
+
+def write_checkpoints(as_of, balances):
+    """Store ``{chemical_id: quantity}`` as checkpoints at ``as_of``."""
+    checkpoints = [
+        ChemicalBalanceCheckpoint(chemical_id=chemical_id, as_of=as_of, quantity=quantity)
+        for chemical_id, quantity in balances.items()
+        if quantity is not None
+    ]
+    ChemicalBalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=1000, ignore_conflicts=True)
+    return len(checkpoints)
+
+
+def create_checkpoints(as_of=None):
+    """
+    Checkpoint every chemical at ``as_of`` (default: now minus
+    ``CHECKPOINT_LAG``). Returns the time used and the number written.
+    """
+    latest = timezone.now() - CHECKPOINT_LAG
+    if as_of is None or as_of > latest:
+        as_of = latest
+    return as_of, write_checkpoints(as_of, balances_at(as_of))
+
+
+def checkpoint_chemical(chemical):
+    """Checkpoint a chemical whose quantity was set directly, not through an activity."""
+    ChemicalBalanceCheckpoint.objects.update_or_create(
+        chemical=chemical, as_of=chemical.updated_at,
+        defaults={'quantity': chemical.quantity},
+    )
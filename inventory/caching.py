@@ -0,0 +1,178 @@
+"""
+Cached inventory aggregates.
+
+Cached values are tagged with a data version, a random token replaced after
+every committed change to chemicals, locations or activities (see
+``inventory.signals``). A cached value is fresh while its version is current
+and it is younger than its TTL. Stale values are still served, while a
+single worker recomputes them in the background.
+
+Data cached in process memory instead is checked against a ``CacheVersion``
+row, which is replaced in the same transaction as each change, so every
+process notices a change as soon as it commits.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils.timezone import now as time_now
+
+from .models import CacheVersion
+
+logger = logging.getLogger(__name__)
+
+DATA_VERSION_KEY = 'inventory:data-version'
+STATS_KEY_PREFIX = 'inventory:cache-stats:'
+LAST_DELETED_KEY_PREFIX = 'inventory:last-deleted:'
+STATS = ('hits', 'stale', 'misses', 'refreshes')
+
+# How long a recompute may take before another worker is allowed to start one
+REFRESH_LOCK_TIMEOUT = 60
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_data_version():
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(DATA_VERSION_KEY, version, timeout=None):
+            version = cache.get(DATA_VERSION_KEY, version)
+    return version
+
+
+def bump_data_version(using=None):
+    """Invalidate cached aggregates once the current transaction commits."""
+    transaction.on_commit(_set_new_version, using=using)
+
+
+def _set_new_version():
+    cache.set(DATA_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_version(name):
+    """Current ``CacheVersion`` of ``name``, ``None`` before its first change."""
+    try:
+        return CacheVersion.objects.values_list('version', flat=True).get(name=name)
+    except CacheVersion.DoesNotExist:
+        return None
+
+
+def bump_version(name, using=None):
+    """
+    Replace the ``CacheVersion`` of ``name`` within the current transaction,
+    so other processes see the new version together with the change it
+    stands for.
+    """
+    versions = CacheVersion.objects.using(using).filter(name=name)
+    if versions.update(version=uuid.uuid4(), updated_at=time_now()):
+        return
+    try:
+        with transaction.atomic(using=using):
+            CacheVersion.objects.using(using).create(name=name)
+    except IntegrityError:
+        # Created concurrently
+        versions.update(version=uuid.uuid4(), updated_at=time_now())
+
+
+def record_deletion(model, using=None):
+    """Remember when rows of ``model`` were last deleted (for list validators)."""
+    key = LAST_DELETED_KEY_PREFIX + model._meta.label_lower
+    transaction.on_commit(lambda: cache.set(key, time.time(), timeout=None), using=using)
+
+
+def get_last_deletion(model):
+    deleted_at = cache.get(LAST_DELETED_KEY_PREFIX + model._meta.label_lower)
+    return datetime.fromtimestamp(deleted_at, tz=timezone.utc) if deleted_at is not None else None
+
+
+def get_or_refresh(key, compute, ttl, max_stale):
+    """
+    Return the cached value for ``key``, calling ``compute()`` to produce it
+    when there is none. A stale value is returned as is and refreshed in the
+    background.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        _count('misses')
+        return _compute_and_store(key, compute, max_stale)
+
+    if entry['version'] == get_data_version() and time.time() - entry['computed_at'] < ttl:
+        _count('hits')
+    else:
+        _count('stale')
+        _refresh_in_background(key, compute, max_stale)
+    return entry['value']
+
+
+def get_or_compute(key, compute, ttl):
+    """
+    Return ``compute()``, cached for ``ttl`` seconds or until the data
+    version changes, whichever comes first. Unlike ``get_or_refresh`` a
+    stale value is never served.
+    """
+    versioned_key = f'{key}:{get_data_version()}'
+    value = cache.get(versioned_key)
+    if value is None:
+        value = compute()
+        cache.set(versioned_key, value, timeout=ttl)
+    return value
+
+
+def cache_stats():
+    counts = cache.get_many([STATS_KEY_PREFIX + name for name in STATS])
+    stats = {name: counts.get(STATS_KEY_PREFIX + name, 0) for name in STATS}
+    requests = stats['hits'] + stats['stale'] + stats['misses']
+    stats['hit_ratio'] = (stats['hits'] + stats['stale']) / requests if requests else 0
+    return stats
+
+
+def _count(name):
+    key = STATS_KEY_PREFIX + name
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def _compute_and_store(key, compute, max_stale):
+    # Read the version first: a change committed while computing leaves the
+    # entry tagged with the old version, so it is refreshed again.
+    version = get_data_version()
+    value = compute()
+    cache.set(key, {'value': value, 'version': version, 'computed_at': time.time()}, timeout=max_stale)
+    return value
+
+
+def _refresh_in_background(key, compute, max_stale):
+    lock_key = f'{key}:refreshing'
+    if not cache.add(lock_key, 1, timeout=REFRESH_LOCK_TIMEOUT):
+        return  # another worker is already on it
+    _get_executor().submit(_refresh, key, compute, max_stale, lock_key)
+
+
+def _refresh(key, compute, max_stale, lock_key):
+    try:
+        close_old_connections()
+        _count('refreshes')
+        _compute_and_store(key, compute, max_stale)
+    except Exception:
+        logger.exception("Refreshing cached value %s failed", key)
+    finally:
+        cache.delete(lock_key)
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-refresh')
+    return _executor
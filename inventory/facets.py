@@ -0,0 +1,72 @@
+"""
+Facet counts for the chemical list.
+
+``GET /api/chemical/?facets=chemical_type,location`` (or ``?facets=all``)
+adds the number of matching chemicals per value of each facet to the list
+response, computed with one grouped aggregate per facet over the filtered
+queryset. Results are cached per filter combination until inventory data
+changes (see ``inventory.caching.get_or_compute``).
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count
+
+from .caching import get_or_compute
+
+# facet -> fields grouped on; the first is the value, the rest are labels
+FACETS = {
+    'chemical_type': ('chemical_type',),
+    'chemical_state': ('chemical_state',),
+    'reactivity_group': ('reactivity_group',),
+    'location': ('location', 'location__name'),
+}
+
+# Query parameters that page through results without changing them
+NON_FILTER_PARAMS = {'cursor', 'page_size', 'facets'}
+
+
+class InvalidFacet(ValueError):
+    pass
+
+
+def parse_facets(value):
+    """Return the facet names requested by a ``facets`` parameter."""
+    if not value:
+        return []
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    if names == ['all']:
+        return list(FACETS)
+    unknown = [name for name in names if name not in FACETS]
+    if unknown:
+        raise InvalidFacet(f"Unknown facet(s): {', '.join(unknown)}. Choose from: {', '.join(FACETS)}")
+    return list(dict.fromkeys(names))
+
+
+def chemical_facets(queryset, query_params, names):
+    """Return ``{facet: [{'value', 'count'}, ...]}`` for the filtered ``queryset``."""
+    filters = sorted(
+        (key, values) for key, values in query_params.lists() if key not in NON_FILTER_PARAMS
+    )
+    signature = hashlib.md5(repr(filters).encode(), usedforsecurity=False).hexdigest()
+    return {
+        name: get_or_compute(
+            f'inventory:chemical-facets:{name}:{signature}',
+            lambda name=name: _count_facet(queryset, name),
+            settings.CHEMICAL_FACET_CACHE_TTL,
+        )
+        for name in names
+    }
+
+
+def _count_facet(queryset, name):
+    value_field, *label_fields = FACETS[name]
+    rows = queryset.order_by().values(*FACETS[name]).annotate(count=Count('pk')).order_by('-count', value_field)
+    return [
+        {
+            'value': row[value_field],
+            **{field.split('__')[-1]: row[field] for field in label_fields},
+            'count': row['count'],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,167 @@
+"""
+Idempotency keys for write requests.
+
+A client that may retry a POST/PUT/PATCH/DELETE sends an ``Idempotency-Key``
+header (any unique string, e.g. a UUID). The first request with a key
+claims it by inserting an ``IdempotencyKey`` row (the unique index makes
+that atomic) and its response is stored on the row. Retries with the same
+key get the stored response back, marked ``Idempotent-Replayed: true``,
+without the view running again. A retry while the first request is still
+running gets 409, and reusing a key for a different request gets 422.
+
+Views list actions whose responses must not be stored, such as ones that
+issue credentials, in ``idempotency_exempt_actions``; those run as if no
+key had been sent.
+
+Keys are scoped to the user and kept for ``IDEMPOTENCY_KEY_TTL_HOURS``;
+``manage.py prune_idempotency_keys`` deletes expired ones. Server errors
+are not stored, so the request can be retried under the same key.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+IDEMPOTENT_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class IdempotencyConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed.'
+    default_code = 'idempotency_conflict'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+class _Replay(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class IdempotencyMixin:
+    """
+    Honour ``Idempotency-Key`` on a view's write requests. Must come before
+    the other view mixins so its ``finalize_response`` sees the final
+    response.
+    """
+
+    idempotency_exempt_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        self.idempotency_record = None
+        super().initial(request, *args, **kwargs)
+
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if getattr(self, 'action', None) in self.idempotency_exempt_actions:
+            return
+        if key and request.method in IDEMPOTENT_METHODS and request.user.is_authenticated:
+            self.idempotency_record = claim_key(request, key)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _Replay):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Unhandled errors become a 500; let the client retry
+            self._release_idempotency_key()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        record = getattr(self, 'idempotency_record', None)
+        if record is None:
+            return response
+
+        if response.status_code >= 500 or not isinstance(response, Response):
+            self._release_idempotency_key()
+        else:
+            record.response_status = response.status_code
+            record.response_body = json.loads(json.dumps(response.data, cls=JSONEncoder))
+            record.save(update_fields=['response_status', 'response_body'])
+        self.idempotency_record = None
+        return response
+
+    def _release_idempotency_key(self):
+        record = getattr(self, 'idempotency_record', None)
+        if record is not None:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            self.idempotency_record = None
+
+
+def claim_key(request, key):
+    """
+    Claim ``key`` for this request and return its new ``IdempotencyKey``,
+    or raise ``_Replay`` with the response stored for an earlier request.
+    """
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        raise ValidationError({IDEMPOTENCY_HEADER: ['Ensure this header has no more than 255 characters.']})
+    fingerprint = request_fingerprint(request)
+
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(user=request.user, key=key, fingerprint=fingerprint)
+        except IntegrityError:
+            pass
+
+        existing = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if existing is None:
+            continue  # released in the meantime
+        if _is_expired(existing):
+            IdempotencyKey.objects.filter(pk=existing.pk, created_at=existing.created_at).delete()
+            continue
+        if existing.fingerprint != fingerprint:
+            raise IdempotencyKeyReused()
+        if existing.response_status is None:
+            raise IdempotencyConflict()
+
+        response = Response(existing.response_body, status=existing.response_status)
+        response[REPLAYED_HEADER] = 'true'
+        raise _Replay(response)
+    raise IdempotencyConflict()
+
+
+def request_fingerprint(request):
+    """
+    Hash of the method, path and body, so a key can't be replayed for a
+    different request. File uploads are streamed rather than read into
+    memory, so only their method and path count.
+    """
+    digest = hashlib.sha256(f'{request.method} {request.get_full_path()}'.encode())
+    if not request.content_type.startswith('multipart/'):
+        digest.update(request._request.body)
+    return digest.hexdigest()
+
+
+def _is_expired(record):
+    now = timezone.now()
+    if record.created_at < now - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS):
+        return True
+    # A request that never finished (e.g. the worker was killed)
+    return (
+        record.response_status is None
+        and record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_PROCESSING_TIMEOUT)
+    )
+
+
+def prune_keys():
+    """Delete keys past their TTL. Returns the number deleted."""
+    cutoff = timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,115 @@
+"""
+Bulk import of chemicals from CSV or NDJSON.
+
+Rows are read from the file one at a time and validated with the rules of
+``ChemicalSerializer``, except that the location is given by name. Valid
+rows are inserted with ``bulk_create`` in batches of ``IMPORT_BATCH_SIZE``
+inside one transaction; invalid rows are reported and skipped. Only a batch
+and the error report are held in memory.
+
+``bulk_create`` bypasses ``Chemicals.save`` and the model signals, so the
+opening balance checkpoints and the cache invalidation are done here.
+"""
+import csv
+import io
+import json
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .caching import bump_data_version
+from .locations import get_location_registry
+from .models import ChemicalBalanceCheckpoint, Chemicals
+from .serializers import ChemicalImportSerializer
+
+IMPORT_FORMATS = ['csv', 'ndjson']
+IMPORT_BATCH_SIZE = 1000
+
+# Rows beyond this many failures are still counted, but not described
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def guess_import_format(filename, content_type=None):
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        return 'ndjson'
+    if filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if filename.lower().endswith('.csv') or content_type == 'text/csv':
+        return 'csv'
+    return None
+
+
+def read_rows(stream, file_format):
+    """
+    Yield ``(row_number, row)`` for each record of a binary ``stream``.
+    ``row`` is ``None`` for an NDJSON line that is not a JSON object.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'csv':
+            for number, row in enumerate(csv.DictReader(text), start=1):
+                row.pop(None, None)  # values beyond the header
+                yield number, row
+        else:
+            number = 0
+            for line in text:
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ImportFileError(f"Could not read the file: {e}")
+    finally:
+        # Leave the underlying file open for the caller
+        text.detach()
+
+
+def import_chemicals(rows, user, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validate and insert ``(row_number, row)`` pairs as chemicals created by
+    ``user``. Returns ``{'created', 'failed', 'errors'}``, where ``errors``
+    lists the first ``MAX_REPORTED_ERRORS`` failures by row number.
+    """
+    locations = get_location_registry().ids
+    # One serializer validates every row, so its fields are only built once
+    serializer = ChemicalImportSerializer(context={'locations': locations})
+    result = {'created': 0, 'failed': 0, 'errors': []}
+
+    batch = []
+    with transaction.atomic():
+        for number, row in rows:
+            try:
+                if row is None:
+                    raise serializers.ValidationError({'non_field_errors': ['Row is not a JSON object.']})
+                batch.append(Chemicals(created_by=user, **serializer.run_validation(row)))
+            except serializers.ValidationError as e:
+                result['failed'] += 1
+                if len(result['errors']) < MAX_REPORTED_ERRORS:
+                    result['errors'].append({'row': number, 'errors': e.detail})
+                continue
+
+            if len(batch) >= batch_size:
+                result['created'] += _insert(batch)
+                batch = []
+        if batch:
+            result['created'] += _insert(batch)
+        if result['created']:
+            bump_data_version()
+    return result
+
+
+def _insert(chemicals):
+    Chemicals.objects.bulk_create(chemicals)
+    ChemicalBalanceCheckpoint.objects.bulk_create([
+        ChemicalBalanceCheckpoint(chemical=chemical, as_of=chemical.created_at, quantity=chemical.quantity)
+        for chemical in chemicals
+    ])
+    return len(chemicals)
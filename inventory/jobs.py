@@ -0,0 +1,144 @@
+"""
+Database-backed queue for report generation.
+
+Jobs are rows in ``ReportJob``. A worker owns a job once it has flipped its
+status from pending to running with a conditional UPDATE, so any number of
+workers (threads in the web process, or ``manage.py run_report_workers``)
+can poll the same table without an external broker.
+
+Running a job is a lease of ``REPORT_JOB_TIMEOUT_MINUTES``: a job still
+running after that is taken to have lost its worker and can be claimed
+again, so jobs of a process that died are picked up by the next claim.
+"""
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def enqueue_report(report_type, export_format, params, user):
+    job = ReportJob.objects.create(
+        report_type=report_type,
+        export_format=export_format,
+        parameters=params,
+        requested_by=user,
+    )
+    transaction.on_commit(lambda: _submit_local(job.pk))
+    return job
+
+
+def _claimable(now):
+    """Pending jobs, and running ones whose lease has expired."""
+    return Q(status=ReportJob.PENDING) | Q(
+        status=ReportJob.RUNNING, started_at__lt=now - default_stale_timeout()
+    )
+
+
+def claim_job(job_id):
+    """Atomically move a claimable job to running. Returns True if we own it."""
+    now = timezone.now()
+    return ReportJob.objects.filter(_claimable(now), pk=job_id).update(
+        status=ReportJob.RUNNING,
+        started_at=now,
+    ) == 1
+
+
+def claim_next_job():
+    claimable = ReportJob.objects.filter(_claimable(timezone.now())).order_by('created_at')
+    for job_id in claimable.values_list('id', flat=True)[:10]:
+        if claim_job(job_id):
+            return job_id
+    return None
+
+
+def run_job(job_id):
+    """Generate the report for a job this worker has claimed."""
+    from . import reports
+
+    job = ReportJob.objects.get(pk=job_id)
+    try:
+        report = reports.build_report(job.report_type, job.parameters)
+        filename = reports.report_filename(report, job.export_format)
+        with tempfile.TemporaryFile() as output:
+            reports.write_report(output, report, job.export_format)
+            output.seek(0)
+            job.file.save(filename, File(output), save=False)
+        job.filename = filename
+        job.status = ReportJob.COMPLETED
+    except Exception as e:
+        logger.exception("Report job %s failed", job_id)
+        job.status = ReportJob.FAILED
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save()
+    return job
+
+
+def requeue_stale_jobs(timeout):
+    """Put jobs back in the queue whose worker died while running them."""
+    return ReportJob.objects.filter(
+        status=ReportJob.RUNNING,
+        started_at__lt=timezone.now() - timeout,
+    ).update(status=ReportJob.PENDING, started_at=None)
+
+
+def work(stop_event, poll_interval=2.0, exit_when_idle=False):
+    """Claim and run jobs until ``stop_event`` is set."""
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            job_id = claim_next_job()
+            if job_id is None:
+                if exit_when_idle:
+                    return
+                stop_event.wait(poll_interval)
+                continue
+            run_job(job_id)
+    finally:
+        connection.close()
+
+
+def _submit_local(job_id):
+    executor = _get_executor()
+    if executor is not None:
+        executor.submit(_run_local, job_id)
+
+
+def _run_local(job_id):
+    try:
+        close_old_connections()
+        if claim_job(job_id):
+            run_job(job_id)
+    except Exception:
+        logger.exception("Local report worker failed on job %s", job_id)
+    finally:
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    workers = getattr(settings, 'REPORT_JOB_LOCAL_WORKERS', 0)
+    if workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-job')
+    return _executor
+
+
+def default_stale_timeout():
+    return timedelta(minutes=getattr(settings, 'REPORT_JOB_TIMEOUT_MINUTES', 30))
@@ -0,0 +1,143 @@
+"""
+Location hierarchy helpers.
+
+Each location stores its materialized path (``Locations.path``), so the
+subtree under a location is one range over the path index
+(``Locations.subtree_filter``) and ancestors can be read off the path
+without walking the tree. ``Locations.save`` keeps paths current when a
+location is created or moved; ``detach_subtree`` does so when one is
+deleted.
+
+``get_location_registry`` keeps every location's name in process memory,
+so hot paths can show names without joining ``Locations``. The registry is
+reloaded when the ``locations`` ``CacheVersion`` changes, which every
+location write increments.
+"""
+import threading
+from collections import Counter, namedtuple
+
+from django.db.models import Count, F
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from .caching import bump_version, get_version
+from .models import Locations, path_range
+
+REGISTRY_VERSION = 'locations'
+
+LocationRegistry = namedtuple('LocationRegistry', ['version', 'names', 'ids'])
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_location_registry():
+    """
+    Return the ``LocationRegistry`` (``names``: id -> name, ``ids``: name ->
+    id). Costs one primary-key lookup of the version; fetch it once per
+    request or report rather than per row.
+    """
+    global _registry
+    # Read the version first: a change committed while loading leaves the
+    # registry tagged with the old version, so it is loaded again next time.
+    version = get_version(REGISTRY_VERSION)
+    registry = _registry
+    if registry is not None and registry.version == version:
+        return registry
+
+    with _registry_lock:
+        if _registry is not None and _registry.version == version:
+            return _registry
+        names = dict(Locations.objects.values_list('id', 'name'))
+        _registry = LocationRegistry(version, names, {name: location_id for location_id, name in names.items()})
+        return _registry
+
+
+def subtree_chemical_counts():
+    """
+    Return every location, in tree order, with the number of chemicals
+    stored in it and in its whole subtree. One grouped query; the subtree
+    totals are summed up each location's path.
+    """
+    locations = list(
+        Locations.objects.annotate(chemicals_count=Count('chemicals')).order_by('path').values(
+            'id', 'name', 'parent_id', 'depth', 'path', 'chemicals_count',
+        )
+    )
+
+    totals = Counter()
+    for location in locations:
+        for ancestor in location['path'].split(Locations.PATH_SEPARATOR)[:-1]:
+            totals[ancestor] += location['chemicals_count']
+
+    return [
+        {
+            'id': location['id'],
+            'name': location['name'],
+            'parent': location['parent_id'],
+            'depth': location['depth'],
+            'chemicals': location['chemicals_count'],
+            'subtree_chemicals': totals[location['id'].hex],
+        }
+        for location in locations
+    ]
+
+
+def detach_subtree(location, using=None):
+    """
+    Make the children of a location being deleted roots, as the
+    ``SET_NULL`` on ``parent`` does, by dropping its path from every
+    descendant's path.
+    """
+    Locations.objects.using(using).filter(path_range(location.path)).exclude(pk=location.pk).update(
+        path=Substr('path', len(location.path) + 1),
+        depth=F('depth') - (location.depth + 1),
+        updated_at=timezone.now(),
+    )
+
+
+def rebuild_paths():
+    """
+    Recompute every path and depth from ``parent``, a level at a time.
+    Only needed after the hierarchy was changed without ``save()``.
+    Returns the number of locations updated.
+    """
+    parents = dict(Locations.objects.values_list('id', 'parent_id'))
+    children = {}
+    for location_id, parent_id in parents.items():
+        children.setdefault(parent_id, []).append(location_id)
+
+    paths = {}
+    roots = [location_id for location_id, parent_id in parents.items() if parent_id is None]
+    while True:
+        level = roots
+        for location_id in level:
+            paths[location_id] = location_id.hex + Locations.PATH_SEPARATOR
+        while level:
+            level = [child for parent_id in level for child in children.get(parent_id, [])]
+            for location_id in level:
+                paths[location_id] = paths[parents[location_id]] + location_id.hex + Locations.PATH_SEPARATOR
+
+        # Whatever is left hangs off a parent cycle; break the cycle by
+        # making one of its locations a root.
+        unreached = parents.keys() - paths.keys()
+        if not unreached:
+            break
+        root, seen = next(iter(unreached)), set()
+        while root not in seen:
+            seen.add(root)
+            root = parents[root]
+        parents[root] = None
+        roots = [root]
+
+    updated = []
+    for location in Locations.objects.only('id', 'parent_id', 'path', 'depth'):
+        path = paths[location.id]
+        depth = path.count(Locations.PATH_SEPARATOR) - 1
+        if (location.path, location.depth, location.parent_id) != (path, depth, parents[location.id]):
+            location.path, location.depth, location.parent_id = path, depth, parents[location.id]
+            updated.append(location)
+    Locations.objects.bulk_update(updated, ['path', 'depth', 'parent'], batch_size=500)
+    if updated:
+        bump_version(REGISTRY_VERSION)
+    return len(updated)
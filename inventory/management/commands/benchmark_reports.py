@@ -0,0 +1,65 @@
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from inventory.reports import write_excel_report, write_pdf_report
+
+HEADERS = ['Date & Time', 'Chemical', 'Action', 'Quantity', 'Location', 'User', 'Notes']
+WRITERS = {'pdf': write_pdf_report, 'excel': write_excel_report}
+
+
+def synthetic_rows(count):
+    """Rows shaped like the usage report, generated lazily."""
+    start = date(2024, 1, 1)
+    for index in range(count):
+        yield [
+            (start + timedelta(minutes=index)).strftime('%Y-%m-%d %H:%M'),
+            f'Chemical {index % 500}',
+            'Used',
+            f'{index % 97 + 1}.0 L',
+            f'Cabinet {index % 40}',
+            'Lab Attendant',
+            'N/A' if index % 3 else 'Weekly titration',
+        ]
+
+
+class Command(BaseCommand):
+    help = "Measure report rendering time and peak Python memory for synthetic reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Row counts to render (default: 1000 10000 100000)')
+        parser.add_argument('--format', choices=sorted(WRITERS), nargs='+', default=['pdf', 'excel'],
+                            dest='formats', help='Formats to render (default: both)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'format':<8}{'rows':>10}{'seconds':>10}{'peak MiB':>10}{'size MiB':>10}")
+        for export_format in options['formats']:
+            for count in options['rows']:
+                seconds, peak, size = self.measure(WRITERS[export_format], count)
+                self.stdout.write(
+                    f"{export_format:<8}{count:>10}{seconds:>10.2f}{peak / 2**20:>10.1f}{size / 2**20:>10.1f}"
+                )
+        self.stdout.write(self.style.SUCCESS(
+            "Peak memory is traced Python allocations, measured in a second, traced run"
+        ))
+
+    def measure(self, write, count):
+        with tempfile.TemporaryFile() as output:
+            started = time.perf_counter()
+            write(output, 'Benchmark Report', HEADERS, synthetic_rows(count), '2024-01-01', '2024-12-31')
+            seconds = time.perf_counter() - started
+            size = output.tell()
+
+        # tracemalloc slows rendering down considerably, so time and memory
+        # are taken from separate runs
+        with tempfile.TemporaryFile() as output:
+            tracemalloc.start()
+            try:
+                write(output, 'Benchmark Report', HEADERS, synthetic_rows(count), '2024-01-01', '2024-12-31')
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        return seconds, peak, size
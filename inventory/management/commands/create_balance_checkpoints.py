@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from inventory.balances import create_checkpoints
+
+
+class Command(BaseCommand):
+    help = "Record a balance checkpoint for every chemical (run periodically, e.g. nightly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--at',
+            help='Checkpoint time (YYYY-MM-DD or YYYY-MM-DDTHH:MM); default is a few minutes ago',
+        )
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['at']:
+            try:
+                as_of = datetime.fromisoformat(options['at'])
+            except ValueError:
+                raise CommandError("Invalid time format. Use YYYY-MM-DD or YYYY-MM-DDTHH:MM.")
+            if timezone.is_naive(as_of):
+                as_of = timezone.make_aware(as_of)
+
+        as_of, written = create_checkpoints(as_of)
+        self.stdout.write(self.style.SUCCESS(f"Recorded {written} balance checkpoint(s) as of {as_of.isoformat()}"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.imports import IMPORT_FORMATS, ImportFileError, guess_import_format, import_chemicals, read_rows
+from users.models import Users
+
+
+class Command(BaseCommand):
+    help = "Import chemicals from a CSV or NDJSON file (locations are given by name)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file to import')
+        parser.add_argument('--user', required=True, help='Email of the user recorded as creator')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, dest='file_format',
+                            help='File format (default: from the file extension)')
+
+    def handle(self, *args, **options):
+        try:
+            user = Users.objects.get(email=options['user'])
+        except Users.DoesNotExist:
+            raise CommandError(f"No user with email {options['user']}")
+
+        file_format = options['file_format'] or guess_import_format(options['path'])
+        if file_format is None:
+            raise CommandError("Cannot tell the file format from its extension; pass --format")
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = import_chemicals(read_rows(stream, file_format), user)
+        except (OSError, ImportFileError) as e:
+            raise CommandError(str(e))
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        if result['failed'] > len(result['errors']):
+            self.stderr.write(f"... and {result['failed'] - len(result['errors'])} more invalid row(s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} chemical(s), skipped {result['failed']} invalid row(s)"
+        ))
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from inventory.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = "Delete chemical deletion tombstones older than CHEMICAL_TOMBSTONE_RETENTION_DAYS (run periodically)"
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} tombstone(s) older than {settings.CHEMICAL_TOMBSTONE_RETENTION_DAYS} days"
+        ))
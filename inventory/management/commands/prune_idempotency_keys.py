@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from inventory.idempotency import prune_keys
+
+
+class Command(BaseCommand):
+    help = "Delete Idempotency-Key records older than IDEMPOTENCY_KEY_TTL_HOURS (run periodically)"
+
+    def handle(self, *args, **options):
+        deleted = prune_keys()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} idempotency key(s) older than {settings.IDEMPOTENCY_KEY_TTL_HOURS} hours"
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from inventory.locations import rebuild_paths
+
+
+class Command(BaseCommand):
+    help = "Recompute location paths and depths from their parents"
+
+    def handle(self, *args, **options):
+        updated = rebuild_paths()
+        self.stdout.write(self.style.SUCCESS(f"Location paths rebuilt ({updated} location(s) updated)"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from inventory.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the chemical full-text search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database alias to rebuild the index on (default: "default")',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        with transaction.atomic(using=connection.alias):
+            indexed = rebuild_search_index(connection)
+        self.stdout.write(self.style.SUCCESS(
+            f"Search index rebuilt on {connection.vendor} ({indexed} chemicals)"
+        ))
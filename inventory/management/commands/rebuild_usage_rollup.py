@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from inventory.rollups import rebuild_usage_rollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily chemical usage rollup from recorded activities"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Only rebuild days from this date (YYYY-MM-DD) onwards; default is the full history',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid date format. Use YYYY-MM-DD.")
+
+        written = rebuild_usage_rollup(since)
+        scope = f"from {since}" if since else "for all activity"
+        self.stdout.write(self.style.SUCCESS(f"Usage rollup rebuilt {scope} ({written} rows)"))
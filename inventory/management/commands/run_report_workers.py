@@ -0,0 +1,42 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from inventory.jobs import default_stale_timeout, requeue_stale_jobs, work
+
+
+class Command(BaseCommand):
+    help = "Run a pool of workers that generate queued reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of worker threads (default: 2)')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty (default: 2)')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling forever')
+
+    def handle(self, *args, **options):
+        # Claiming takes over expired leases as well; this only reports them
+        requeued = requeue_stale_jobs(default_stale_timeout())
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale report job(s)"))
+
+        stop_event = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stop_event.set())
+
+        threads = [
+            threading.Thread(
+                target=work,
+                args=(stop_event, options['poll_interval'], options['once']),
+                name=f'report-worker-{index}',
+            )
+            for index in range(max(options['workers'], 1))
+        ]
+        self.stdout.write(self.style.SUCCESS(f"Starting {len(threads)} report worker(s)"))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stdout.write(self.style.SUCCESS("Report workers stopped"))
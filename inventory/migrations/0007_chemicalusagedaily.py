@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:29
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+import uuid
+
+
+def backfill_usage_rollup(apps, schema_editor):
+    ChemicalActivity = apps.get_model('inventory', 'ChemicalActivity')
+    ChemicalUsageDaily = apps.get_model('inventory', 'ChemicalUsageDaily')
+    rows = ChemicalActivity.objects.using(schema_editor.connection.alias).annotate(
+        day=TruncDate('timestamp'),
+    ).values(
+        'chemical_id', 'chemical__location_id', 'action', 'day',
+    ).annotate(
+        total=Sum('quantity'),
+        events=Count('id'),
+    ).order_by()
+    ChemicalUsageDaily.objects.using(schema_editor.connection.alias).bulk_create([
+        ChemicalUsageDaily(
+            chemical_id=row['chemical_id'],
+            location_id=row['chemical__location_id'],
+            action=row['action'],
+            day=row['day'],
+            quantity=row['total'] or 0,
+            events=row['events'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChemicalUsageDaily',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, unique=True)),
+                ('action', models.CharField(choices=[('added', 'Added'), ('updated', 'Updated'), ('removed', 'Removed'), ('used', 'Used'), ('restocked', 'Restocked')], max_length=20)),
+                ('day', models.DateField()),
+                ('quantity', models.FloatField(default=0, help_text="Sum of the activities' quantities")),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('chemical', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_days', to='inventory.chemicals')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_days', to='inventory.locations')),
+            ],
+            options={
+                'verbose_name_plural': 'Chemical Usage Daily',
+                'indexes': [models.Index(fields=['day', 'action'], name='inventory_c_day_79158d_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chemicalusagedaily',
+            constraint=models.UniqueConstraint(fields=('chemical', 'location', 'action', 'day'), name='unique_chemical_usage_day'),
+        ),
+        migrations.RunPython(backfill_usage_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def backfill_opening_checkpoints(apps, schema_editor):
+    """
+    Give every existing chemical a first checkpoint. Without an 'updated'
+    activity the opening quantity is the current one minus every recorded
+    change. An 'updated' activity overwrote whatever came before it, so for
+    those chemicals the first one becomes the checkpoint and earlier stock
+    is unknown.
+    """
+    db = schema_editor.connection.alias
+    Chemicals = apps.get_model('inventory', 'Chemicals')
+    ChemicalActivity = apps.get_model('inventory', 'ChemicalActivity')
+    ChemicalBalanceCheckpoint = apps.get_model('inventory', 'ChemicalBalanceCheckpoint')
+
+    # chemical id -> [net change since creation, first 'updated' activity]
+    history = {}
+    activities = ChemicalActivity.objects.using(db).order_by('timestamp').values_list(
+        'chemical_id', 'action', 'quantity', 'timestamp',
+    )
+    for chemical_id, action, quantity, timestamp in activities.iterator():
+        entry = history.setdefault(chemical_id, [0, None])
+        if entry[1] is not None:
+            continue
+        if action in ['added', 'restocked']:
+            entry[0] += abs(quantity)
+        elif action in ['removed', 'used']:
+            entry[0] -= abs(quantity)
+        elif action == 'updated':
+            entry[1] = (timestamp, quantity)
+
+    checkpoints = []
+    for chemical_id, quantity, created_at in Chemicals.objects.using(db).values_list('id', 'quantity', 'created_at').iterator():
+        change, first_update = history.get(chemical_id, (0, None))
+        if first_update is None:
+            as_of, opening = created_at, quantity - change
+        else:
+            as_of, opening = first_update
+        checkpoints.append(ChemicalBalanceCheckpoint(chemical_id=chemical_id, as_of=as_of, quantity=opening))
+    ChemicalBalanceCheckpoint.objects.using(db).bulk_create(checkpoints, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_chemicalusagedaily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChemicalBalanceCheckpoint',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, unique=True)),
+                ('as_of', models.DateTimeField()),
+                ('quantity', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chemical', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='inventory.chemicals')),
+            ],
+            options={
+                'ordering': ['-as_of'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chemicalbalancecheckpoint',
+            constraint=models.UniqueConstraint(fields=('chemical', 'as_of'), name='unique_chemical_checkpoint'),
+        ),
+        migrations.RunPython(backfill_opening_checkpoints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_chemicalbalancecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locations',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:36
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_locations_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChemicalDeletion',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, unique=True)),
+                ('chemical_id', models.UUIDField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['deleted_at'],
+                'indexes': [models.Index(fields=['deleted_at'], name='inventory_c_deleted_b79d64_idx')],
+            },
+        ),
+    ]
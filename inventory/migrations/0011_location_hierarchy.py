@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_paths(apps, schema_editor):
+    """Every existing location becomes a root."""
+    Locations = apps.get_model('inventory', 'Locations')
+    locations = list(Locations.objects.using(schema_editor.connection.alias).only('id'))
+    for location in locations:
+        location.path = location.id.hex + '/'
+    Locations.objects.using(schema_editor.connection.alias).bulk_update(locations, ['path'], batch_size=500)
+
+
+def use_binary_path_collation(apps, schema_editor):
+    # Subtree queries are ranges over path, which need byte-wise ordering;
+    # PostgreSQL's default collation may ignore the separators. SQLite
+    # compares bytes already.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE inventory_locations ALTER COLUMN path TYPE varchar(330) COLLATE "C"'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_chemicaldeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locations',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='locations',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='inventory.locations'),
+        ),
+        migrations.AddField(
+            model_name='locations',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=330),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.RunPython(use_binary_path_collation, migrations.RunPython.noop),
+    ]
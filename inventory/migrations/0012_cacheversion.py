@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:50
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_location_hierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, unique=True)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('version', models.UUIDField(default=uuid.uuid4)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chemicals',
+            index=models.Index(fields=['updated_at', 'id'], name='inventory_c_updated_a8be51_idx'),
+        ),
+    ]
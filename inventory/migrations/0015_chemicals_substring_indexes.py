@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def install_substring_indexes(apps, schema_editor):
+    from inventory.search import install_substring_indexes
+    install_substring_indexes(schema_editor.connection)
+
+
+def uninstall_substring_indexes(apps, schema_editor):
+    from inventory.search import uninstall_substring_indexes
+    uninstall_substring_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_chemicals_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_substring_indexes, uninstall_substring_indexes),
+    ]
@@ -1,11 +1,67 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 import uuid
 from users.models import Users
 from chemoventry import settings
 
 class Locations(models.Model):
+    """
+    A storage location, optionally inside another (site > building > room >
+    cabinet > shelf). ``path`` is the materialized path of ancestor ids,
+    root first, each followed by ``PATH_SEPARATOR``; a subtree is the range
+    of paths starting with its root's path, so it is one indexed range
+    query (see ``inventory.locations``).
+    """
+    PATH_SEPARATOR = '/'
+    PATH_SEGMENT_LENGTH = 33  # uuid hex + separator
+    MAX_DEPTH = 10
+
     id = models.UUIDField(unique=True, primary_key=True, default=uuid.uuid4)
     name = models.CharField(max_length=225, unique=True)
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='children')
+    path = models.CharField(max_length=PATH_SEGMENT_LENGTH * MAX_DEPTH, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    def subtree_filter(self, prefix=''):
+        """``Q`` for this location and its descendants; ``prefix`` is e.g. ``'location__'``."""
+        return path_range(self.path, prefix)
+
+    def save(self, *args, **kwargs):
+        old_path, old_depth = self.path, self.depth
+        parent_path = self.parent.path if self.parent_id else ''
+        if self.id.hex in parent_path.split(self.PATH_SEPARATOR):
+            raise ValueError("A location cannot be moved inside itself")
+        self.path = parent_path + self.id.hex + self.PATH_SEPARATOR
+        self.depth = self.path.count(self.PATH_SEPARATOR) - 1
+
+        if self._state.adding or not old_path or old_path == self.path:
+            super().save(*args, **kwargs)
+            return
+
+        # Moved: rewrite the paths of the whole subtree in one statement
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
+            Locations.objects.filter(path_range(old_path)).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (self.depth - old_depth),
+                updated_at=timezone.now(),
+            )
+
+
+def path_range(path, prefix=''):
+    """
+    ``Q`` for the paths starting with ``path``, written as a range so it can
+    use the index: every such path sorts before ``path`` with its trailing
+    separator replaced by the next character.
+    """
+    upper = path[:-1] + chr(ord(Locations.PATH_SEPARATOR) + 1)
+    return Q(**{f'{prefix}path__gte': path, f'{prefix}path__lt': upper})
 
 class Chemicals(models.Model):
     id = models.UUIDField(unique=True, primary_key=True, default=uuid.uuid4)
@@ -52,11 +108,24 @@ class Chemicals(models.Model):
             models.Index(fields=['chemical_type']),
             models.Index(fields=['-created_at']),
             models.Index(fields=['expires']),
+            # /api/chemical/changes/ pages by (updated_at, id)
+            models.Index(fields=['updated_at', 'id']),
         ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+
+        # Record the opening balance so stock at any later time can be
+        # reconstructed from checkpoints and the activity ledger
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
+            ChemicalBalanceCheckpoint.objects.create(chemical=self, as_of=self.created_at, quantity=self.quantity)
+
 class ChemicalActivity(models.Model):
     ACTION_CHOICES = [
         ('added', 'Added'),
@@ -88,14 +157,220 @@ class ChemicalActivity(models.Model):
         return f"{self.action} {self.chemical.name} by {self.user.get_full_name()}"
 
     def save(self, *args, **kwargs):
-        # Update chemical quantity based on activity
-        if self.action in ['added', 'restocked']:
-            self.chemical.quantity += abs(self.quantity)
-        elif self.action in ['removed', 'used']:
-            self.chemical.quantity -= abs(self.quantity)
-        elif self.action == 'updated':
+        from . import rollups
+
+        if not self._state.adding:
+            # The ledger entry was applied when the activity was recorded
+            super().save(*args, **kwargs)
+            return
+
+        # Update chemical quantity based on activity. The new quantity is
+        # computed by the database so concurrent activities on the same
+        # chemical can't overwrite each other.
+        quantity = self.apply_to_quantity(F('quantity'), self.action, self.quantity)
+
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
+            self.chemical.quantity = quantity
+            self.chemical.save(update_fields=['quantity', 'updated_at'])
+            self.chemical.refresh_from_db(fields=['quantity'])
+            rollups.record_usage([self], {self.chemical_id: self.chemical.location_id})
+
+    @staticmethod
+    def apply_to_quantity(quantity, action, amount):
+        """Return ``quantity`` (a number or expression) after an activity."""
+        if action in ['added', 'restocked']:
+            return quantity + abs(amount)
+        if action in ['removed', 'used']:
+            return quantity - abs(amount)
+        if action == 'updated':
             # For updates, quantity represents the new total
-            self.chemical.quantity = self.quantity
-        
-        self.chemical.save()
-        super().save(*args, **kwargs)
\ No newline at end of file
+            return amount
+        return quantity
+
+    @classmethod
+    def bulk_record(cls, activities, batch_size=500):
+        """
+        Insert unsaved activities and apply them to their chemicals, all in
+        one transaction. Activities are applied in order, and each chemical
+        gets a single UPDATE with its net change. Returns the ids of the
+        chemicals that changed.
+        """
+        from . import caching, rollups
+
+        # chemical id -> (new total set by an 'updated' activity or None, delta)
+        changes = {}
+        for activity in activities:
+            total, delta = changes.get(activity.chemical_id, (None, 0))
+            if activity.action == 'updated':
+                total, delta = activity.quantity, 0
+            else:
+                delta = cls.apply_to_quantity(delta, activity.action, activity.quantity)
+            changes[activity.chemical_id] = (total, delta)
+
+        now = timezone.now()
+        # Every query runs on the database written to, so the reads are part
+        # of the transaction even when reads are routed elsewhere
+        using = router.db_for_write(cls)
+        chemicals = Chemicals.objects.db_manager(using)
+        with transaction.atomic(using=using):
+            cls.objects.db_manager(using).bulk_create(activities, batch_size=batch_size)
+            locations = dict(chemicals.filter(pk__in=changes).values_list('pk', 'location_id'))
+            rollups.record_usage(activities, locations)
+            # bulk_create() and update() send no signals
+            caching.bump_data_version(using=using)
+            # Update in a fixed order so concurrent batches lock rows alike
+            for chemical_id in sorted(changes, key=str):
+                total, delta = changes[chemical_id]
+                quantity = F('quantity') if total is None else Value(total, output_field=models.FloatField())
+                chemicals.filter(pk=chemical_id).update(quantity=quantity + delta, updated_at=now)
+        return list(changes)
+
+class ChemicalUsageDaily(models.Model):
+    """
+    Activity totals per chemical, location, action and (local) day, kept up
+    to date as activities are recorded. See ``inventory.rollups``.
+    """
+    id = models.UUIDField(unique=True, primary_key=True, default=uuid.uuid4)
+    chemical = models.ForeignKey(Chemicals, on_delete=models.CASCADE, related_name='usage_days')
+    location = models.ForeignKey(Locations, on_delete=models.CASCADE, related_name='usage_days')
+    action = models.CharField(max_length=20, choices=ChemicalActivity.ACTION_CHOICES)
+    day = models.DateField()
+    quantity = models.FloatField(default=0, help_text="Sum of the activities' quantities")
+    events = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chemical', 'location', 'action', 'day'],
+                name='unique_chemical_usage_day',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'action']),
+        ]
+        verbose_name_plural = 'Chemical Usage Daily'
+
+    def __str__(self):
+        return f"{self.action} {self.quantity} on {self.day}"
+
+class ChemicalBalanceCheckpoint(models.Model):
+    """
+    A chemical's quantity at a point in time. Stock at any other time is the
+    nearest earlier checkpoint plus the activities recorded since. See
+    ``inventory.balances``.
+    """
+    id = models.UUIDField(unique=True, primary_key=True, default=uuid.uuid4)
+    chemical = models.ForeignKey(Chemicals, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    as_of = models.DateTimeField()
+    quantity = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-as_of']
+        constraints = [
+            models.UniqueConstraint(fields=['chemical', 'as_of'], name='unique_chemical_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"{self.chemical_id} {self.quantity} at {self.as_of}"
+
+class ChemicalDeletion(models.Model):
+    """Tombstone for a deleted chemical, read by the delta-sync endpoint."""
+    id = models.UUIDField(unique=True, primary_key=True, default=uuid.uuid4)
+    chemical_id = models.UUIDField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(fields=['deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.chemical_id} deleted at {self.deleted_at}"
+
+class CacheVersion(models.Model):
+    """
+    Version stamp of a data set cached in each process, replaced in the
+    same transaction as every change to that data (see
+    ``inventory.caching.bump_version``). Versions are random rather than
+    counted, so a rolled-back change can never share a version with a
+    later one.
+    """
+    id = models.UUIDField(unique=True, primary_key=True, default=uuid.uuid4)
+    name = models.CharField(max_length=100, unique=True)
+    version = models.UUIDField(default=uuid.uuid4)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} {self.version}"
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied ``Idempotency-Key`` and the response it produced
+    (``response_status`` is null while the request is being processed).
+    See ``inventory.idempotency``.
+    """
+    id = models.UUIDField(unique=True, primary_key=True, default=uuid.uuid4)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return self.key
+
+class ReportJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+    REPORT_TYPE_CHOICES = [
+        ('inventory', 'Inventory'),
+        ('usage', 'Usage'),
+        ('expiry', 'Expiry'),
+        ('low-stock', 'Low Stock'),
+    ]
+    FORMAT_CHOICES = [
+        ('pdf', 'PDF'),
+        ('excel', 'Excel'),
+    ]
+
+    id = models.UUIDField(unique=True, primary_key=True, default=uuid.uuid4)
+    report_type = models.CharField(max_length=20, choices=REPORT_TYPE_CHOICES)
+    export_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='pdf')
+    parameters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    file = models.FileField(upload_to='reports/', blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='report_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.report_type} report ({self.status})"
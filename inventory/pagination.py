@@ -0,0 +1,178 @@
+import base64
+import json
+from datetime import date, datetime
+from uuid import UUID
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+from .search import SEARCH_RANK
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset (seek) pagination over a unique, multi-column ordering.
+
+    DRF's CursorPagination only keys on the first ordering field and falls
+    back to an OFFSET when several rows share the same value. Here the cursor
+    stores the full position of the boundary row and the next page is
+    fetched with a row-value comparison on every ordering field, so page N
+    costs the same as page 1 and ties are resolved by the trailing field.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        cursor = self.decode_cursor(request)
+        position, reverse = cursor if cursor is not None else (None, False)
+        if position is not None:
+            position = self._coerce_position(queryset, position)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(_invert(field) for field in ordering)
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(_seek_filter(ordering, position))
+
+        # Fetch one extra row to know whether another page follows.
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        # Relevance-ranked search results page by rank first; the regular
+        # ordering then breaks ties between equally ranked rows.
+        if SEARCH_RANK in queryset.query.annotations:
+            ordering = ('-' + SEARCH_RANK,) + ordering
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor((position, False))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor((position, True))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = payload['p']
+            reverse = bool(payload.get('r', False))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def _coerce_position(self, queryset, position):
+        """
+        Convert the cursor's values to the types of their ordering fields,
+        so an edited cursor is a 404 rather than a database error.
+        """
+        try:
+            values = []
+            for field, value in zip(self.ordering, position):
+                if isinstance(value, (dict, list)):
+                    raise TypeError("Cursor values are scalars")
+                model_field = _get_field(queryset, field.lstrip('-'))
+                value = model_field.to_python(value)
+                if value is None:
+                    raise ValueError("Ordering fields are not nullable")
+                model_field.get_prep_value(value)
+                values.append(value)
+        except (DjangoValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def encode_cursor(self, cursor):
+        position, reverse = cursor
+        payload = {'p': position}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        return [
+            _to_cursor_value(getattr(instance, field.lstrip('-')))
+            for field in ordering
+        ]
+
+
+class LocationPagination(KeysetPagination):
+    ordering = ('name', 'id')
+
+
+def _get_field(queryset, name):
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _invert(field):
+    return field[1:] if field.startswith('-') else '-' + field
+
+
+def _seek_filter(ordering, position):
+    """
+    Build the row-value comparison ``(a, b, c) > (x, y, z)`` as the
+    equivalent ``a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)``,
+    honouring the direction of each ordering field.
+    """
+    condition = None
+    equal = Q()
+    for field, value in zip(ordering, position):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        clause = equal & Q(**{f'{name}__{lookup}': value})
+        condition = clause if condition is None else condition | clause
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _to_cursor_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
@@ -1,24 +1,39 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import get_object_or_404
 from django.db.models import Sum, Count, Q, F
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
 from openpyxl.drawing.image import Image as XLImage
 from io import BytesIO
+from collections import namedtuple
+from itertools import chain, islice
 import os
-from .models import Chemicals, ChemicalActivity, Locations
+import tempfile
+import uuid
+from .balances import balances_at
+from .jobs import enqueue_report
+from .locations import get_location_registry
+from .models import Chemicals, ChemicalActivity, Locations, ReportJob
+from .serializers import ReportJobSerializer
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
+from chemoventry.negotiation import ExportContentNegotiation
+from chemoventry.throttling import ReportRateThrottle, UserRateThrottle
+
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
 # Constants for styling
 PDF_TITLE_STYLE = ParagraphStyle(
@@ -44,144 +59,577 @@ def get_report_header(title, start_date, end_date):
     
     return elements
 
-# Common PDF generation function with improved styling
-def generate_pdf_report(title, headers, rows, start_date, end_date):
-    buffer = BytesIO()
-    
-    # Use landscape for wider tables
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(letter), 
-                           leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
-    
+# Table styling shared by every chunk of a PDF report
+PDF_TABLE_STYLE = TableStyle([
+    # Header styling
+    ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+
+    # Data rows styling
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+
+    # Alternating row colors
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+
+    # Grid
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('BOX', (0, 0), (-1, -1), 1, colors.black),
+])
+
+PDF_WIDTH_SAMPLE_ROWS = 200
+PDF_CELL_PADDING = 12
+
+
+class _StreamingDocTemplate(SimpleDocTemplate):
+    """
+    Lays out flowables as an iterator produces them, so only the table
+    chunk being placed is held in memory.
+    """
+
+    def build(self, flowables, **kwargs):
+        self._pending = iter(flowables)
+        self._queue = list(islice(self._pending, 2))
+        super().build(self._queue, **kwargs)
+
+    def handle_flowable(self, flowables):
+        # build() stops once its list is empty, so keep the next one queued.
+        # Flowables held back at a page start come through here as well.
+        if flowables is self._queue and len(flowables) < 2:
+            flowables.extend(islice(self._pending, 2 - len(flowables)))
+        super().handle_flowable(flowables)
+
+
+def _pdf_column_widths(headers, sample, available_width):
+    widths = [stringWidth(str(header), 'Helvetica-Bold', 12) for header in headers]
+    for row in sample:
+        for col, value in enumerate(row[:len(widths)]):
+            widths[col] = max(widths[col], stringWidth(str(value), 'Helvetica', 10))
+    widths = [width + PDF_CELL_PADDING for width in widths]
+    total = sum(widths)
+    if total > available_width:
+        widths = [width * available_width / total for width in widths]
+    return widths
+
+
+def _pdf_row_heights(headers, col_widths, available_width):
+    """
+    Measure the header row, a one-line data row and each further line of a
+    data row by laying out small tables in the report's style.
+    """
+    def height(*rows):
+        table = LongTable([headers, *rows], colWidths=col_widths, style=PDF_TABLE_STYLE)
+        return table.wrap(available_width, float('inf'))[1]
+
+    header = height()
+    one_line = height([''] * len(headers)) - header
+    two_lines = height(['\n'] * len(headers)) - header
+    return header, one_line, two_lines - one_line
+
+
+def _pdf_table_chunks(headers, rows, col_widths, row_heights, first_page_height, page_height):
+    """Yield a table per page, each holding as many rows as fit in the space left."""
+    header_height, row_height, line_height = row_heights
+    available, used, chunk = first_page_height, header_height, []
+    for row in rows:
+        height = row_height + line_height * max(str(value).count('\n') for value in row)
+        if chunk and used + height > available:
+            yield LongTable([headers] + chunk, colWidths=col_widths, repeatRows=1, style=PDF_TABLE_STYLE)
+            available, used, chunk = page_height, header_height, []
+        chunk.append(row)
+        used += height
+    if chunk:
+        yield LongTable([headers] + chunk, colWidths=col_widths, repeatRows=1, style=PDF_TABLE_STYLE)
+
+
+def _pdf_elements(doc, title, headers, rows, start_date, end_date):
     # Start with header elements
     elements = get_report_header(title, start_date, end_date)
-    
-    # Create the table with data
-    if rows:
-        table = Table([headers] + rows, repeatRows=1)
-        table.setStyle(TableStyle([
-            # Header styling
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            
-            # Data rows styling
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            
-            # Alternating row colors
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-            
-            # Grid
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-    else:
+
+    rows = iter(rows)
+    sample = list(islice(rows, PDF_WIDTH_SAMPLE_ROWS))
+    if not sample:
         # Add a message if no data
         styles = getSampleStyleSheet()
-        elements.append(Paragraph("No data available for the selected period.", styles['Normal']))
-    
-    # Build PDF
-    doc.build(elements)
-    pdf = buffer.getvalue()
-    buffer.close()
-    
-    # Create response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{title.replace(" ", "_")}.pdf"'
-    response.write(pdf)
-    
-    return response
+        yield from elements
+        yield Paragraph("No data available for the selected period.", styles['Normal'])
+        return
 
-# Excel generation with improved styling and formatting
-def generate_excel_report(title, headers, rows, start_date, end_date):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = title[:31]  # Excel sheet names limited to 31 chars
-    
-    # Add title and date range
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(headers))
-    title_cell = ws.cell(row=1, column=1, value=title)
-    title_cell.font = Font(size=16, bold=True)
-    title_cell.alignment = Alignment(horizontal='center')
-    
-    date_range = f"Period: {start_date} to {end_date}"
-    ws.merge_cells(start_row=2, start_column=1, end_row=2, end_column=len(headers))
-    date_cell = ws.cell(row=2, column=2, value=date_range)
-    date_cell.alignment = Alignment(horizontal='center')
-    
-    # Style for headers
-    header_fill = PatternFill(start_color='1F4E78', end_color='1F4E78', fill_type='solid')
-    header_font = Font(color='FFFFFF', bold=True, size=12)
-    header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    header_border = Border(
-        left=Side(border_style='thin', color='000000'),
-        right=Side(border_style='thin', color='000000'),
-        top=Side(border_style='thin', color='000000'),
-        bottom=Side(border_style='thin', color='000000')
+    # Frames pad their content by 6pt on each side
+    frame_width, frame_height = doc.width - 12, doc.height - 12
+    header_height = sum(
+        element.wrap(frame_width, frame_height)[1] + element.getSpaceBefore() + element.getSpaceAfter()
+        for element in elements
     )
-    
-    # Write headers
-    header_row = 4  # Start at row 4 to leave space for title
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=header_row, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-        cell.border = header_border
-    
-    # Data styling
-    data_alignment = Alignment(vertical='center', wrap_text=True)
-    data_border = Border(
-        left=Side(border_style='thin', color='000000'),
-        right=Side(border_style='thin', color='000000'),
-        top=Side(border_style='thin', color='000000'),
-        bottom=Side(border_style='thin', color='000000')
+    col_widths = _pdf_column_widths(headers, sample, frame_width)
+    row_heights = _pdf_row_heights(headers, col_widths, frame_width)
+    # One row of slack on the first page absorbs rounding in the header height
+    first_page_height = frame_height - header_height - row_heights[1]
+
+    yield from elements
+    yield from _pdf_table_chunks(
+        headers, chain(sample, rows), col_widths, row_heights, first_page_height, frame_height
     )
-    
+
+
+# Common PDF generation function with improved styling
+def write_pdf_report(output, title, headers, rows, start_date, end_date):
+    # Use landscape for wider tables
+    doc = _StreamingDocTemplate(output, pagesize=landscape(letter),
+                                leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
+
+    # Build PDF one page-sized table at a time
+    doc.build(_pdf_elements(doc, title, headers, rows, start_date, end_date))
+
+
+def generate_pdf_report(title, headers, rows, start_date, end_date):
+    return _spooled_report_response(
+        write_pdf_report,
+        f'{title.replace(" ", "_")}.pdf',
+        'application/pdf',
+        title, headers, rows, start_date, end_date,
+    )
+
+
+def _spooled_report_response(write, filename, content_type, *report):
+    # Spool to a temporary file; FileResponse streams it and closes it
+    output = tempfile.TemporaryFile()
+    try:
+        write(output, *report)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+
+    return FileResponse(output, as_attachment=True, filename=filename, content_type=content_type)
+
+# Excel generation with improved styling and formatting.
+# The workbook is written in openpyxl's write-only mode: rows are streamed to
+# disk as they are appended, so memory does not grow with the row count.
+EXCEL_HEADER_ROW = 4
+# Column widths have to be known before the first row is written, so they
+# are estimated from the first rows of the report.
+EXCEL_WIDTH_SAMPLE_ROWS = 200
+EXCEL_MAX_COLUMN_WIDTH = 40
+
+_THIN_SIDE = Side(border_style='thin', color='000000')
+_THIN_BORDER = Border(left=_THIN_SIDE, right=_THIN_SIDE, top=_THIN_SIDE, bottom=_THIN_SIDE)
+
+
+def _excel_styles():
+    title = NamedStyle(name='report_title')
+    title.font = Font(size=16, bold=True)
+    title.alignment = Alignment(horizontal='center')
+
+    period = NamedStyle(name='report_period')
+    period.alignment = Alignment(horizontal='center')
+
+    header = NamedStyle(name='report_header')
+    header.fill = PatternFill(start_color='1F4E78', end_color='1F4E78', fill_type='solid')
+    header.font = Font(color='FFFFFF', bold=True, size=12)
+    header.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    header.border = _THIN_BORDER
+
+    data = NamedStyle(name='report_data')
+    data.alignment = Alignment(vertical='center', wrap_text=True)
+    data.border = _THIN_BORDER
+
+    data_alt = NamedStyle(name='report_data_alt')
+    data_alt.alignment = Alignment(vertical='center', wrap_text=True)
+    data_alt.border = _THIN_BORDER
+    data_alt.fill = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')
+
+    return [title, period, header, data, data_alt]
+
+
+def _excel_column_widths(headers, sample):
+    widths = [len(header) for header in headers]
+    for row in sample:
+        for col, value in enumerate(row[:len(widths)]):
+            widths[col] = max(widths[col], len(str(value)) if value is not None else 0)
+    return [min(width + 4, EXCEL_MAX_COLUMN_WIDTH) for width in widths]
+
+
+def _styled_row(ws, values, style):
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        cells.append(cell)
+    return cells
+
+
+def write_excel_report(output, title, headers, rows, start_date, end_date):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title[:31])  # Excel sheet names limited to 31 chars
+    for style in _excel_styles():
+        wb.add_named_style(style)
+
+    rows = iter(rows)
+    sample = list(islice(rows, EXCEL_WIDTH_SAMPLE_ROWS))
+    for col, width in enumerate(_excel_column_widths(headers, sample), 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+
+    # Title and date range, merged across the table
+    last_column = get_column_letter(len(headers))
+    ws.merged_cells.add(f'A1:{last_column}1')
+    ws.merged_cells.add(f'A2:{last_column}2')
+    ws.append(_styled_row(ws, [title], 'report_title'))
+    ws.append(_styled_row(ws, [f"Period: {start_date} to {end_date}"], 'report_period'))
+    ws.append([])
+
+    ws.append(_styled_row(ws, headers, 'report_header'))
+
     # Write data with alternating row colors
-    alt_fill = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')
-    
-    for row_idx, row in enumerate(rows, header_row + 1):
-        for col_idx, value in enumerate(row, 1):
-            cell = ws.cell(row=row_idx, column=col_idx, value=value)
-            cell.alignment = data_alignment
-            cell.border = data_border
-            
-            # Apply alternating row colors
-            if row_idx % 2 == 1:
-                cell.fill = alt_fill
-    
-    # Auto-adjust column widths
-    for col in range(1, len(headers) + 1):
-        column_cells = [ws.cell(row=i, column=col).value for i in range(4, len(rows) + header_row + 1)]
-        column_cells = [str(cell) if cell is not None else '' for cell in column_cells]
-        max_length = max([len(headers[col-1])] + [len(str(cell)) for cell in column_cells])
-        adjusted_width = max_length + 4  # Add padding
-        ws.column_dimensions[get_column_letter(col)].width = min(adjusted_width, 40)  # Cap width at 40
-    
+    for row_idx, row in enumerate(chain(sample, rows), EXCEL_HEADER_ROW + 1):
+        ws.append(_styled_row(ws, row, 'report_data_alt' if row_idx % 2 == 1 else 'report_data'))
+
     # Freeze header row
     ws.freeze_panes = 'A5'
-    
-    # Save to buffer
-    buffer = BytesIO()
-    wb.save(buffer)
-    
-    # Create response
-    response = HttpResponse(
-        buffer.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    wb.save(output)
+
+
+def generate_excel_report(title, headers, rows, start_date, end_date):
+    return _spooled_report_response(
+        write_excel_report,
+        f'{title.replace(" ", "_")}.xlsx',
+        EXCEL_CONTENT_TYPE,
+        title, headers, rows, start_date, end_date,
     )
-    response['Content-Disposition'] = f'attachment; filename="{title.replace(" ", "_")}.xlsx"'
-    
-    return response
+
+class ReportParameterError(ValueError):
+    pass
+
+
+# ``rows`` is an iterable that streams from the database; it can be consumed once.
+Report = namedtuple('Report', ['title', 'headers', 'rows', 'start_date', 'end_date'])
+
+REPORT_CHUNK_SIZE = 2000
+
+
+def _parse_date_range(query_params):
+    start_date = query_params.get('start_date')
+    end_date = query_params.get('end_date')
+
+    if not all([start_date, end_date]):
+        raise ReportParameterError("Missing required parameters: start_date and end_date")
+
+    try:
+        datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.strptime(end_date, '%Y-%m-%d')
+    except ValueError:
+        raise ReportParameterError("Invalid date format. Use YYYY-MM-DD.")
+
+    return {'start_date': start_date, 'end_date': end_date}
+
+
+def _parse_id(query_params, name):
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        raise ReportParameterError(f"Invalid {name}. Use a UUID.")
+
+
+def parse_inventory_params(query_params):
+    params = _parse_date_range(query_params)
+    params['location'] = _parse_id(query_params, 'location')
+    return params
+
+
+def build_inventory_report(params, save_checkpoints=False):
+    """
+    With ``save_checkpoints`` (report jobs), opening and closing balances
+    that took a long replay are stored as checkpoints; requests only read.
+    """
+    # Stock is reported as it stood at the start and end of the period
+    period_start = timezone.make_aware(datetime.combine(
+        datetime.strptime(params['start_date'], '%Y-%m-%d').date(), time.min
+    ))
+    period_end = timezone.make_aware(datetime.combine(
+        datetime.strptime(params['end_date'], '%Y-%m-%d').date(), time.max
+    ))
+
+    # Build query for chemicals that existed by the end of the period
+    query = Chemicals.objects.filter(created_at__lte=period_end).select_related('created_by')
+
+    # Apply location filter if provided; it covers the whole subtree
+    if params.get('location'):
+        location = Locations.objects.filter(pk=params['location']).only('path').first()
+        query = query.filter(location.subtree_filter('location__')) if location else query.none()
+
+    opening = balances_at(period_start, query, save_checkpoints=save_checkpoints)
+    if period_end >= timezone.now():
+        closing = None  # the current quantity
+    else:
+        closing = balances_at(period_end, query, save_checkpoints=save_checkpoints)
+
+    # Prepare the report data
+    headers = ['Chemical Name', 'Formula', 'Location', 'Opening Stock', 'Closing Stock', 'State', 'Type', 'Hazard Info', 'Expiry Date', 'Last Updated']
+    rows = _inventory_rows(query, opening, closing)
+
+    return Report('Chemical Inventory Report', headers, rows, params['start_date'], params['end_date'])
+
+
+def _format_stock(quantity, unit_suffix):
+    return f"{quantity} {unit_suffix}" if quantity is not None else 'N/A'
+
+
+def _inventory_rows(query, opening, closing):
+    location_names = get_location_registry().names
+    for chemical in query.iterator(chunk_size=REPORT_CHUNK_SIZE):
+        unit_suffix = "L" if chemical.chemical_state == "Liquid" else "g"
+        closing_quantity = chemical.quantity if closing is None else closing.get(chemical.pk)
+        yield [
+            chemical.name,
+            chemical.molecular_formula,
+            location_names.get(chemical.location_id, 'N/A'),
+            _format_stock(opening.get(chemical.pk), unit_suffix),
+            _format_stock(closing_quantity, unit_suffix),
+            chemical.chemical_state,
+            chemical.chemical_type,
+            chemical.hazard_information[:50] + '...' if len(chemical.hazard_information) > 50 else chemical.hazard_information,
+            chemical.expires.strftime('%Y-%m-%d') if chemical.expires else 'N/A',
+            chemical.updated_at.strftime('%Y-%m-%d') if chemical.updated_at else 'N/A'
+        ]
+
+
+def parse_usage_params(query_params):
+    params = _parse_date_range(query_params)
+    params['chemical_id'] = _parse_id(query_params, 'chemical_id')
+    params['user_id'] = _parse_id(query_params, 'user_id')
+    return params
+
+
+def build_usage_report(params):
+    start_date_obj = datetime.strptime(params['start_date'], '%Y-%m-%d').date()
+    end_date_obj = datetime.strptime(params['end_date'], '%Y-%m-%d').date()
+    # Adjust end_date to include the entire day
+    end_date_obj = datetime.combine(end_date_obj, datetime.max.time())
+
+    # Build query for chemical activities
+    query = ChemicalActivity.objects.filter(
+        timestamp__range=[start_date_obj, end_date_obj]
+    ).select_related('chemical', 'user').order_by('-timestamp')  # Newest first
+
+    # Apply filters if provided
+    if params.get('chemical_id'):
+        query = query.filter(chemical_id=params['chemical_id'])
+
+    if params.get('user_id'):
+        query = query.filter(user_id=params['user_id'])
+
+    # Prepare the report data
+    headers = ['Date & Time', 'Chemical', 'Action', 'Quantity', 'Location', 'User', 'Notes']
+    rows = _usage_rows(query)
+
+    return Report('Chemical Usage Report', headers, rows, params['start_date'], params['end_date'])
+
+
+def _usage_rows(query):
+    location_names = get_location_registry().names
+    for activity in query.iterator(chunk_size=REPORT_CHUNK_SIZE):
+        unit_suffix = "L" if activity.chemical.chemical_state == "Liquid" else "g"
+        yield [
+            activity.timestamp.strftime('%Y-%m-%d %H:%M'),
+            activity.chemical.name,
+            activity.action.title(),
+            f"{abs(activity.quantity)} {unit_suffix}",
+            location_names.get(activity.chemical.location_id, 'N/A'),
+            activity.user.get_full_name(),
+            activity.notes if activity.notes else 'N/A'
+        ]
+
+
+def parse_expiry_params(query_params):
+    days_ahead = query_params.get('days', '90')
+
+    try:
+        days_ahead = int(days_ahead)
+    except ValueError:
+        raise ReportParameterError("Days parameter must be a valid number")
+    if days_ahead <= 0:
+        raise ReportParameterError("Days parameter must be a positive number")
+
+    return {'days': days_ahead}
+
+
+def build_expiry_report(params):
+    days_ahead = params['days']
+
+    # Calculate date range
+    today = timezone.now().date()
+    expiry_cutoff = today + timedelta(days=days_ahead)
+
+    # Build query for chemicals expiring soon
+    query = Chemicals.objects.filter(
+        expires__range=[today, expiry_cutoff]
+    ).select_related('created_by').order_by('expires')  # Fewest days left first
+
+    # Prepare the report data
+    headers = ['Chemical Name', 'Location', 'Quantity', 'Expiry Date', 'Days Left', 'Added By', 'Creation Date']
+    rows = _expiry_rows(query, today)
+
+    title = f'Chemicals Expiring Within {days_ahead} Days'
+    return Report(title, headers, rows, today.strftime('%Y-%m-%d'), expiry_cutoff.strftime('%Y-%m-%d'))
+
+
+def _expiry_rows(query, today):
+    location_names = get_location_registry().names
+    for chemical in query.iterator(chunk_size=REPORT_CHUNK_SIZE):
+        unit_suffix = "L" if chemical.chemical_state == "Liquid" else "g"
+        days_left = (chemical.expires - today).days
+
+        yield [
+            chemical.name,
+            location_names.get(chemical.location_id, 'N/A'),
+            f"{chemical.quantity} {unit_suffix}",
+            chemical.expires.strftime('%Y-%m-%d'),
+            str(days_left),
+            chemical.created_by.get_full_name(),
+            chemical.created_at.strftime('%Y-%m-%d')
+        ]
+
+
+def parse_low_stock_params(query_params):
+    threshold = query_params.get('threshold', '100')
+
+    try:
+        threshold = float(threshold)
+    except ValueError:
+        raise ReportParameterError("Threshold parameter must be a valid number")
+    if threshold <= 0:
+        raise ReportParameterError("Threshold parameter must be a positive number")
+
+    return {'threshold': threshold}
+
+
+def build_low_stock_report(params):
+    threshold = params['threshold']
+
+    # Build query for chemicals with low stock
+    query = Chemicals.objects.filter(
+        quantity__lte=threshold
+    ).order_by('quantity')  # Lowest stock first
+
+    # Prepare the report data
+    headers = ['Chemical Name', 'Formula', 'Location', 'Current Stock', 'State', 'Expiry Date']
+    rows = _low_stock_rows(query)
+
+    today = timezone.now().date()
+
+    title = f'Chemicals Below Stock Threshold ({threshold})'
+    return Report(title, headers, rows, today.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))
+
+
+def _low_stock_rows(query):
+    location_names = get_location_registry().names
+    for chemical in query.iterator(chunk_size=REPORT_CHUNK_SIZE):
+        unit_suffix = "L" if chemical.chemical_state == "Liquid" else "g"
+
+        yield [
+            chemical.name,
+            chemical.molecular_formula,
+            location_names.get(chemical.location_id, 'N/A'),
+            f"{chemical.quantity} {unit_suffix}",
+            chemical.chemical_state,
+            chemical.expires.strftime('%Y-%m-%d') if chemical.expires else 'N/A'
+        ]
+
+
+# report_type -> (parameter parser, report builder)
+REPORT_TYPES = {
+    'inventory': (parse_inventory_params, build_inventory_report),
+    'usage': (parse_usage_params, build_usage_report),
+    'expiry': (parse_expiry_params, build_expiry_report),
+    'low-stock': (parse_low_stock_params, build_low_stock_report),
+}
+
+
+def build_report(report_type, params):
+    """Build a report for a job. Jobs run off the request path, so they may write checkpoints."""
+    if report_type == 'inventory':
+        return build_inventory_report(params, save_checkpoints=True)
+    _, build = REPORT_TYPES[report_type]
+    return build(params)
+
+
+def get_export_format(query_params):
+    return 'pdf' if query_params.get('format', 'pdf').lower() == 'pdf' else 'excel'
+
+
+def report_filename(report, export_format):
+    extension = 'pdf' if export_format == 'pdf' else 'xlsx'
+    return f'{report.title.replace(" ", "_")}.{extension}'
+
+
+def write_report(output, report, export_format):
+    if export_format == 'pdf':
+        write_pdf_report(output, *report)
+    else:
+        write_excel_report(output, *report)
+
+
+def render_report(report, export_format):
+    if export_format == 'pdf':
+        return generate_pdf_report(*report)
+    return generate_excel_report(*report)
+
+
+def _report_response(request, report_type):
+    parse, build = REPORT_TYPES[report_type]
+    export_format = get_export_format(request.query_params)
+
+    try:
+        params = parse(request.query_params)
+    except ReportParameterError as e:
+        return Response({"error": str(e)}, status=400)
+
+    if request.query_params.get('async', '').lower() in ('1', 'true', 'yes'):
+        job = enqueue_report(report_type, export_format, params, request.user)
+        return Response(ReportJobSerializer(job, context={'request': request}).data, status=202)
+
+    try:
+        return render_report(build(params), export_format)
+    except Exception as e:
+        import traceback
+        print(f"Error generating {report_type} report: {str(e)}")
+        print(traceback.format_exc())
+        return Response({"error": f"Error generating report: {str(e)}"}, status=500)
+
+
+def export_format_param(view):
+    """
+    Let ``?format=`` select the export type of a report view (pdf/excel)
+    rather than one of DRF's renderers, which would answer 404.
+    """
+    view.cls.content_negotiation_class = ExportContentNegotiation
+    return view
+
+
+ASYNC_PARAMETER = OpenApiParameter(
+    'async', OpenApiTypes.BOOL,
+    description='Queue the report and return a job (202) instead of the file'
+)
+
+REPORT_RESPONSES = {
+    200: {'type': 'string', 'format': 'binary'},
+    202: ReportJobSerializer,
+    400: {'description': 'Invalid parameters'},
+    500: {'description': 'Server error'}
+}
+
 
 @extend_schema(
     tags=['Reports'],
@@ -194,72 +642,20 @@ def generate_excel_report(title, headers, rows, start_date, end_date):
         OpenApiParameter('end_date', OpenApiTypes.DATE, 
                         description='End date for report range'),
         OpenApiParameter('location', OpenApiTypes.STR, 
-                        description='Filter by location ID (optional)'),
+                        description='Filter by location ID, including the locations below it (optional)'),
+        ASYNC_PARAMETER,
     ],
-    responses={
-        200: {'type': 'string', 'format': 'binary'},
-        400: {'description': 'Invalid parameters'},
-        500: {'description': 'Server error'}
-    }
+    responses=REPORT_RESPONSES
 )
+@export_format_param
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([UserRateThrottle, ReportRateThrottle])
 def inventory_report(request):
     """
     Generate a comprehensive inventory report with current stock levels.
     """
-    start_date = request.query_params.get('start_date')
-    end_date = request.query_params.get('end_date')
-    export_format = request.query_params.get('format', 'pdf')
-    location_id = request.query_params.get('location')
-    
-    # Validate parameters
-    if not all([start_date, end_date]):
-        return Response({"error": "Missing required parameters: start_date and end_date"}, status=400)
-    
-    try:
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-    except ValueError:
-        return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
-    
-    try:
-        # Build query for chemicals
-        query = Chemicals.objects.all().select_related('location', 'created_by')
-        
-        # Apply location filter if provided
-        if location_id:
-            query = query.filter(location_id=location_id)
-        
-        # Prepare the report data
-        headers = ['Chemical Name', 'Formula', 'Location', 'Quantity', 'State', 'Type', 'Hazard Info', 'Expiry Date', 'Last Updated']
-        rows = []
-        
-        for chemical in query:
-            unit_suffix = "L" if chemical.chemical_state == "Liquid" else "g"
-            rows.append([
-                chemical.name,
-                chemical.molecular_formula,
-                chemical.location.name,
-                f"{chemical.quantity} {unit_suffix}",
-                chemical.chemical_state,
-                chemical.chemical_type,
-                chemical.hazard_information[:50] + '...' if len(chemical.hazard_information) > 50 else chemical.hazard_information,
-                chemical.expires.strftime('%Y-%m-%d') if chemical.expires else 'N/A',
-                chemical.updated_at.strftime('%Y-%m-%d') if chemical.updated_at else 'N/A'
-            ])
-        
-        # Generate report based on format
-        title = 'Chemical Inventory Report'
-        if export_format.lower() == 'pdf':
-            return generate_pdf_report(title, headers, rows, start_date, end_date)
-        else:
-            return generate_excel_report(title, headers, rows, start_date, end_date)
-    except Exception as e:
-        import traceback
-        print(f"Error generating inventory report: {str(e)}")
-        print(traceback.format_exc())
-        return Response({"error": f"Error generating report: {str(e)}"}, status=500)
+    return _report_response(request, 'inventory')
 
 @extend_schema(
     tags=['Reports'],
@@ -275,80 +671,19 @@ def inventory_report(request):
                         description='Filter by chemical ID (optional)'),
         OpenApiParameter('user_id', OpenApiTypes.STR, 
                         description='Filter by user ID (optional)'),
+        ASYNC_PARAMETER,
     ],
-    responses={
-        200: {'type': 'string', 'format': 'binary'},
-        400: {'description': 'Invalid parameters'},
-        500: {'description': 'Server error'}
-    }
+    responses=REPORT_RESPONSES
 )
+@export_format_param
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([UserRateThrottle, ReportRateThrottle])
 def usage_report(request):
     """
     Generate a detailed usage report showing all chemical activities.
     """
-    start_date = request.query_params.get('start_date')
-    end_date = request.query_params.get('end_date')
-    export_format = request.query_params.get('format', 'pdf')
-    chemical_id = request.query_params.get('chemical_id')
-    user_id = request.query_params.get('user_id')
-    
-    # Validate parameters
-    if not all([start_date, end_date]):
-        return Response({"error": "Missing required parameters: start_date and end_date"}, status=400)
-    
-    try:
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-        # Adjust end_date to include the entire day
-        end_date_obj = datetime.combine(end_date_obj, datetime.max.time())
-    except ValueError:
-        return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
-    
-    try:
-        # Build query for chemical activities
-        query = ChemicalActivity.objects.filter(
-            timestamp__range=[start_date_obj, end_date_obj]
-        ).select_related('chemical', 'user', 'chemical__location')
-        
-        # Apply filters if provided
-        if chemical_id:
-            query = query.filter(chemical_id=chemical_id)
-        
-        if user_id:
-            query = query.filter(user_id=user_id)
-        
-        # Prepare the report data
-        headers = ['Date & Time', 'Chemical', 'Action', 'Quantity', 'Location', 'User', 'Notes']
-        rows = []
-        
-        for activity in query:
-            unit_suffix = "L" if activity.chemical.chemical_state == "Liquid" else "g"
-            rows.append([
-                activity.timestamp.strftime('%Y-%m-%d %H:%M'),
-                activity.chemical.name,
-                activity.action.title(),
-                f"{abs(activity.quantity)} {unit_suffix}",
-                activity.chemical.location.name,
-                activity.user.get_full_name(),
-                activity.notes if activity.notes else 'N/A'
-            ])
-        
-        # Sort by date (newest first)
-        rows.sort(key=lambda x: x[0], reverse=True)
-        
-        # Generate report based on format
-        title = 'Chemical Usage Report'
-        if export_format.lower() == 'pdf':
-            return generate_pdf_report(title, headers, rows, start_date, end_date)
-        else:
-            return generate_excel_report(title, headers, rows, start_date, end_date)
-    except Exception as e:
-        import traceback
-        print(f"Error generating usage report: {str(e)}")
-        print(traceback.format_exc())
-        return Response({"error": f"Error generating report: {str(e)}"}, status=500)
+    return _report_response(request, 'usage')
 
 @extend_schema(
     tags=['Reports'],
@@ -358,71 +693,19 @@ def usage_report(request):
                         description='Report format (pdf or excel)'),
         OpenApiParameter('days', OpenApiTypes.INT, 
                         description='Number of days to look ahead (default: 90)'),
+        ASYNC_PARAMETER,
     ],
-    responses={
-        200: {'type': 'string', 'format': 'binary'},
-        400: {'description': 'Invalid parameters'},
-        500: {'description': 'Server error'}
-    }
+    responses=REPORT_RESPONSES
 )
+@export_format_param
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([UserRateThrottle, ReportRateThrottle])
 def expiry_report(request):
     """
     Generate a report of chemicals that will expire soon.
     """
-    export_format = request.query_params.get('format', 'pdf')
-    days_ahead = request.query_params.get('days', '90')
-    
-    try:
-        days_ahead = int(days_ahead)
-        if days_ahead <= 0:
-            return Response({"error": "Days parameter must be a positive number"}, status=400)
-    except ValueError:
-        return Response({"error": "Days parameter must be a valid number"}, status=400)
-    
-    try:
-        # Calculate date range
-        today = timezone.now().date()
-        expiry_cutoff = today + timedelta(days=days_ahead)
-        
-        # Build query for chemicals expiring soon
-        query = Chemicals.objects.filter(
-            expires__range=[today, expiry_cutoff]
-        ).select_related('location', 'created_by')
-        
-        # Prepare the report data
-        headers = ['Chemical Name', 'Location', 'Quantity', 'Expiry Date', 'Days Left', 'Added By', 'Creation Date']
-        rows = []
-        
-        for chemical in query:
-            unit_suffix = "L" if chemical.chemical_state == "Liquid" else "g"
-            days_left = (chemical.expires - today).days
-            
-            rows.append([
-                chemical.name,
-                chemical.location.name,
-                f"{chemical.quantity} {unit_suffix}",
-                chemical.expires.strftime('%Y-%m-%d'),
-                str(days_left),
-                chemical.created_by.get_full_name(),
-                chemical.created_at.strftime('%Y-%m-%d')
-            ])
-        
-        # Sort by days_left (ascending)
-        rows.sort(key=lambda x: int(x[4]))
-        
-        # Generate report based on format
-        title = f'Chemicals Expiring Within {days_ahead} Days'
-        if export_format.lower() == 'pdf':
-            return generate_pdf_report(title, headers, rows, today.strftime('%Y-%m-%d'), expiry_cutoff.strftime('%Y-%m-%d'))
-        else:
-            return generate_excel_report(title, headers, rows, today.strftime('%Y-%m-%d'), expiry_cutoff.strftime('%Y-%m-%d'))
-    except Exception as e:
-        import traceback
-        print(f"Error generating expiry report: {str(e)}")
-        print(traceback.format_exc())
-        return Response({"error": f"Error generating report: {str(e)}"}, status=500)
+    return _report_response(request, 'expiry')
 
 @extend_schema(
     tags=['Reports'],
@@ -432,64 +715,55 @@ def expiry_report(request):
                         description='Report format (pdf or excel)'),
         OpenApiParameter('threshold', OpenApiTypes.FLOAT, 
                         description='Quantity threshold for low stock (default: 100)'),
+        ASYNC_PARAMETER,
     ],
-    responses={
-        200: {'type': 'string', 'format': 'binary'},
-        400: {'description': 'Invalid parameters'},
-        500: {'description': 'Server error'}
-    }
+    responses=REPORT_RESPONSES
 )
+@export_format_param
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([UserRateThrottle, ReportRateThrottle])
 def low_stock_report(request):
     """
     Generate a report of chemicals with low stock levels.
     """
-    export_format = request.query_params.get('format', 'pdf')
-    threshold = request.query_params.get('threshold', '100')
-    
-    try:
-        threshold = float(threshold)
-        if threshold <= 0:
-            return Response({"error": "Threshold parameter must be a positive number"}, status=400)
-    except ValueError:
-        return Response({"error": "Threshold parameter must be a valid number"}, status=400)
-    
-    try:
-        # Build query for chemicals with low stock
-        query = Chemicals.objects.filter(
-            quantity__lte=threshold
-        ).select_related('location')
-        
-        # Prepare the report data
-        headers = ['Chemical Name', 'Formula', 'Location', 'Current Stock', 'State', 'Expiry Date']
-        rows = []
-        
-        today = timezone.now().date()
-        
-        for chemical in query:
-            unit_suffix = "L" if chemical.chemical_state == "Liquid" else "g"
-            
-            rows.append([
-                chemical.name,
-                chemical.molecular_formula,
-                chemical.location.name,
-                f"{chemical.quantity} {unit_suffix}",
-                chemical.chemical_state,
-                chemical.expires.strftime('%Y-%m-%d') if chemical.expires else 'N/A'
-            ])
-        
-        # Sort by current stock (ascending)
-        rows.sort(key=lambda x: float(x[3].split()[0]))
-        
-        # Generate report based on format
-        title = f'Chemicals Below Stock Threshold ({threshold})'
-        if export_format.lower() == 'pdf':
-            return generate_pdf_report(title, headers, rows, today.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))
-        else:
-            return generate_excel_report(title, headers, rows, today.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))
-    except Exception as e:
-        import traceback
-        print(f"Error generating low stock report: {str(e)}")
-        print(traceback.format_exc())
-        return Response({"error": f"Error generating report: {str(e)}"}, status=500) 
\ No newline at end of file
+    return _report_response(request, 'low-stock')
+
+
+def _get_visible_job(request, job_id):
+    job = get_object_or_404(ReportJob, pk=job_id)
+    if job.requested_by_id != request.user.id and request.user.role != 'admin':
+        raise Http404
+    return job
+
+
+@extend_schema(
+    tags=['Reports'],
+    description='Get the status of a queued report',
+    responses={200: ReportJobSerializer, 404: {'description': 'Job not found'}}
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def report_job_status(request, job_id):
+    job = _get_visible_job(request, job_id)
+    return Response(ReportJobSerializer(job, context={'request': request}).data)
+
+
+@extend_schema(
+    tags=['Reports'],
+    description='Download the file produced by a completed report job',
+    responses={
+        200: {'type': 'string', 'format': 'binary'},
+        404: {'description': 'Job not found'},
+        409: {'description': 'Report is not ready yet'}
+    }
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def report_job_download(request, job_id):
+    job = _get_visible_job(request, job_id)
+    if job.status != ReportJob.COMPLETED or not job.file:
+        return Response({"error": f"Report is not ready (status: {job.status})"}, status=409)
+
+    content_type = 'application/pdf' if job.export_format == 'pdf' else EXCEL_CONTENT_TYPE
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename, content_type=content_type)
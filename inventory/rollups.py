@@ -0,0 +1,143 @@
+"""
+Daily activity rollup.
+
+``ChemicalUsageDaily`` holds one row per (chemical, location, action, day)
+with the summed quantity and number of activities, so aggregates over long
+periods read a row per day instead of a row per activity. Days are local
+dates in the current time zone, matching ``TruncDate``/``TruncMonth``.
+
+Rows are incremented when activities are recorded through
+``ChemicalActivity.save`` or ``ChemicalActivity.bulk_record``. Activities
+written any other way (``QuerySet.update()``, raw SQL, fixtures) need a
+``manage.py rebuild_usage_rollup``.
+"""
+from collections import defaultdict
+from datetime import datetime, time
+from itertools import islice
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .caching import bump_data_version
+from .models import ChemicalActivity, ChemicalUsageDaily
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def record_usage(activities, locations):
+    """
+    Add saved ``activities`` to the rollup. ``locations`` maps each
+    chemical id to the location the activity is attributed to.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for activity in activities:
+        key = (
+            activity.chemical_id,
+            locations[activity.chemical_id],
+            activity.action,
+            timezone.localdate(activity.timestamp),
+        )
+        totals[key][0] += activity.quantity
+        totals[key][1] += 1
+    if not totals:
+        return
+
+    connection = connections[router.db_for_write(ChemicalUsageDaily)]
+    if connection.vendor in ('postgresql', 'sqlite'):
+        _upsert(connection, totals)
+    else:
+        for key, (quantity, events) in totals.items():
+            _increment(key, quantity, events)
+
+
+def _upsert(connection, totals):
+    # Both backends support INSERT ... ON CONFLICT with the "excluded" row,
+    # which lets the increment happen atomically in one statement.
+    meta = ChemicalUsageDaily._meta
+    fields = [meta.get_field(name) for name in ('id', 'chemical', 'location', 'action', 'day', 'quantity', 'events')]
+    table = connection.ops.quote_name(meta.db_table)
+    columns = [connection.ops.quote_name(field.column) for field in fields]
+    quantity, events = columns[-2:]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(columns[1:5])}) DO UPDATE SET "
+        f"{quantity} = {table}.{quantity} + excluded.{quantity}, "
+        f"{events} = {table}.{events} + excluded.{events}"
+    )
+
+    params = []
+    for key, values in totals.items():
+        row = ChemicalUsageDaily(
+            chemical_id=key[0], location_id=key[1], action=key[2], day=key[3],
+            quantity=values[0], events=values[1],
+        )
+        params.append([
+            field.get_db_prep_save(getattr(row, field.attname), connection) for field in fields
+        ])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _increment(key, quantity, events):
+    chemical_id, location_id, action, day = key
+    rows = ChemicalUsageDaily.objects.filter(
+        chemical_id=chemical_id, location_id=location_id, action=action, day=day,
+    )
+    if rows.update(quantity=F('quantity') + quantity, events=F('events') + events):
+        return
+    try:
+        with transaction.atomic():
+            rows.create(quantity=quantity, events=events)
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(quantity=F('quantity') + quantity, events=F('events') + events)
+
+
+def rebuild_usage_rollup(since=None):
+    """
+    Recompute the rollup from ``ChemicalActivity``, from the date ``since``
+    onwards or entirely. Activities are attributed to their chemical's
+    current location. Returns the number of rollup rows written.
+    """
+    activities = ChemicalActivity.objects.all()
+    rollups = ChemicalUsageDaily.objects.all()
+    if since is not None:
+        activities = activities.filter(
+            timestamp__gte=timezone.make_aware(datetime.combine(since, time.min))
+        )
+        rollups = rollups.filter(day__gte=since)
+
+    rows = activities.annotate(
+        day=TruncDate('timestamp'),
+    ).values(
+        'chemical_id', 'chemical__location_id', 'action', 'day',
+    ).annotate(
+        total=Sum('quantity'),
+        events=Count('id'),
+    ).order_by()
+
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        rows = rows.iterator(chunk_size=REBUILD_BATCH_SIZE)
+        while True:
+            batch = list(islice(rows, REBUILD_BATCH_SIZE))
+            if not batch:
+                break
+            ChemicalUsageDaily.objects.bulk_create([
+                ChemicalUsageDaily(
+                    chemical_id=row['chemical_id'],
+                    location_id=row['chemical__location_id'],
+                    action=row['action'],
+                    day=row['day'],
+                    quantity=row['total'] or 0,
+                    events=row['events'],
+                )
+                for row in batch
+            ])
+            written += len(batch)
+        bump_data_version()
+    return written
@@ -0,0 +1,257 @@
+"""
+Full-text search over chemicals.
+
+The index covers name, molecular_formula, hazard_information and description
+and lives entirely in the database, so it stays in sync with every write path
+(``save()``, ``bulk_create()``, ``QuerySet.update()`` and cascading deletes):
+
+- PostgreSQL: a generated ``tsvector`` column on ``inventory_chemicals`` with
+  a GIN index.
+- SQLite: an FTS5 shadow table maintained by triggers.
+
+Name and molecular formula are matched by substring when the index finds
+nothing, so formula fragments like "SO4" still match. On PostgreSQL that
+is served by ``pg_trgm`` GIN indexes on both columns; elsewhere it scans.
+Other backends fall back to the previous ``icontains`` scan.
+"""
+import re
+
+from django.db import OperationalError, connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+SEARCH_RANK = 'search_rank'
+
+CHEMICALS_TABLE = 'inventory_chemicals'
+FTS_TABLE = 'inventory_chemicals_fts'
+SEARCH_CONFIG = 'simple'
+
+SEARCH_COLUMNS = ['name', 'molecular_formula', 'hazard_information', 'description']
+
+_POSTGRES_INSTALL = [
+    f"""
+    ALTER TABLE {CHEMICALS_TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(molecular_formula, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(hazard_information, '')), 'B') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS {CHEMICALS_TABLE}_search_gin
+    ON {CHEMICALS_TABLE} USING GIN (search_vector)
+    """,
+]
+
+_POSTGRES_UNINSTALL = [
+    f"DROP INDEX IF EXISTS {CHEMICALS_TABLE}_search_gin",
+    f"ALTER TABLE {CHEMICALS_TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+SUBSTRING_COLUMNS = ['name', 'molecular_formula']
+
+_POSTGRES_SUBSTRING_INSTALL = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+    f"""
+    CREATE INDEX IF NOT EXISTS {CHEMICALS_TABLE}_{column}_trgm
+    ON {CHEMICALS_TABLE} USING GIN ({column} gin_trgm_ops)
+    """
+    for column in SUBSTRING_COLUMNS
+]
+
+_POSTGRES_SUBSTRING_UNINSTALL = [
+    f"DROP INDEX IF EXISTS {CHEMICALS_TABLE}_{column}_trgm" for column in SUBSTRING_COLUMNS
+]
+
+_FTS_COLUMNS = ', '.join(SEARCH_COLUMNS)
+_FTS_NEW_VALUES = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+_FTS_CHANGED = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in SEARCH_COLUMNS)
+
+_SQLITE_INSTALL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        chemical_id UNINDEXED, {_FTS_COLUMNS},
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {CHEMICALS_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE} (chemical_id, {_FTS_COLUMNS}) VALUES (new.id, {_FTS_NEW_VALUES});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {CHEMICALS_TABLE} BEGIN
+        DELETE FROM {FTS_TABLE} WHERE chemical_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {CHEMICALS_TABLE}
+    WHEN old.id IS NOT new.id OR {_FTS_CHANGED} BEGIN
+        DELETE FROM {FTS_TABLE} WHERE chemical_id = old.id;
+        INSERT INTO {FTS_TABLE} (chemical_id, {_FTS_COLUMNS}) VALUES (new.id, {_FTS_NEW_VALUES});
+    END
+    """,
+]
+
+_SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# bm25() column weights, mirroring the A/A/B/C weights used on PostgreSQL.
+# The first entry is the unindexed chemical_id column.
+_SQLITE_WEIGHTS = '0.0, 10.0, 10.0, 4.0, 1.0'
+
+_fts_tables = {}
+
+
+def sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(probe)')
+        except OperationalError:
+            return False
+        cursor.execute('DROP TABLE temp.fts5_probe')
+    return True
+
+
+def install_search_index(connection):
+    """Create the search column/table and the objects that keep it in sync."""
+    if connection.vendor == 'postgresql':
+        statements = _POSTGRES_INSTALL + _POSTGRES_SUBSTRING_INSTALL
+    elif connection.vendor == 'sqlite' and sqlite_has_fts5(connection):
+        statements = _SQLITE_INSTALL
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    _fts_tables.pop(connection.alias, None)
+
+
+def install_substring_indexes(connection):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for statement in _POSTGRES_SUBSTRING_INSTALL:
+                cursor.execute(statement)
+
+
+def uninstall_substring_indexes(connection):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for statement in _POSTGRES_SUBSTRING_UNINSTALL:
+                cursor.execute(statement)
+
+
+def uninstall_search_index(connection):
+    if connection.vendor == 'postgresql':
+        statements = _POSTGRES_SUBSTRING_UNINSTALL + _POSTGRES_UNINSTALL
+    elif connection.vendor == 'sqlite':
+        statements = _SQLITE_UNINSTALL
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    _fts_tables.pop(connection.alias, None)
+
+
+def rebuild_search_index(connection):
+    """
+    Re-create the index objects and repopulate the index from the chemicals
+    table. Returns the number of indexed rows.
+    """
+    install_search_index(connection)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'REINDEX INDEX {CHEMICALS_TABLE}_search_gin')
+        elif _has_fts_table(connection):
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (chemical_id, {_FTS_COLUMNS}) '
+                f'SELECT id, {_FTS_COLUMNS} FROM {CHEMICALS_TABLE}'
+            )
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {CHEMICALS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def search_chemicals(queryset, value):
+    """
+    Restrict ``queryset`` to chemicals matching ``value`` and annotate it
+    with a ``search_rank`` where higher means more relevant.
+
+    A chemical matches when the index finds every term (prefix matches
+    included). Only when it finds none of the chemicals in ``queryset``
+    (e.g. for "SO4") are they matched by every term appearing anywhere in
+    their name or molecular formula instead; so is a query with no word
+    characters (e.g. "-"). Those matches all rank 0.
+    """
+    connection = connections[queryset.db]
+    terms = re.findall(r'\w+', value.lower())
+    if not terms:
+        if not value.strip():
+            return queryset.none()
+        return _substring_search(connection, queryset, [value.strip()])
+
+    if connection.vendor == 'postgresql':
+        query = ' & '.join(f'{term}:*' for term in terms)
+        tsquery = f"to_tsquery('{SEARCH_CONFIG}', %s)"
+        matches = queryset.filter(
+            RawSQL(f'{CHEMICALS_TABLE}.search_vector @@ {tsquery}', (query,), output_field=BooleanField())
+        )
+        rank = RawSQL(f'ts_rank({CHEMICALS_TABLE}.search_vector, {tsquery})', (query,), output_field=FloatField())
+    elif connection.vendor == 'sqlite' and _has_fts_table(connection):
+        query = ' '.join(f'"{term}"*' for term in terms)
+        # Joined rather than looked up per row: the FTS table drives the
+        # query, each match finds its chemical by primary key, and bm25()
+        # is computed for the row being joined
+        matches = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.chemical_id = {CHEMICALS_TABLE}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[query],
+        )
+        rank = RawSQL(f'-bm25({FTS_TABLE}, {_SQLITE_WEIGHTS})', (), output_field=FloatField())
+    else:
+        condition = Q()
+        for term in terms:
+            term_condition = Q()
+            for column in SEARCH_COLUMNS:
+                term_condition |= Q(**{f'{column}__icontains': term})
+            condition &= term_condition
+        return queryset.filter(condition)
+
+    if not matches.exists():
+        return _substring_search(connection, queryset, terms)
+
+    # The rank goes into pagination cursors and is compared again on the
+    # next page, so it must survive a round trip through JSON: ts_rank()
+    # returns a float4, which is widened to a float8 here.
+    matches = matches.annotate(**{SEARCH_RANK: Cast(rank, FloatField())})
+    return matches.order_by(f'-{SEARCH_RANK}', '-created_at', '-id')
+
+
+def _substring_search(connection, queryset, terms):
+    condition = Q()
+    for term in terms:
+        if connection.vendor == 'postgresql':
+            # ILIKE on the bare columns, which the trigram indexes serve
+            pattern = '%' + re.sub(r'([\\%_])', r'\\\1', term) + '%'
+            condition &= Q(RawSQL(
+                ' OR '.join(f'{CHEMICALS_TABLE}.{column} ILIKE %s' for column in SUBSTRING_COLUMNS),
+                (pattern,) * len(SUBSTRING_COLUMNS),
+                output_field=BooleanField(),
+            ))
+        else:
+            condition &= Q(name__icontains=term) | Q(molecular_formula__icontains=term)
+    queryset = queryset.filter(condition).annotate(**{SEARCH_RANK: Value(0.0, output_field=FloatField())})
+    return queryset.order_by(f'-{SEARCH_RANK}', '-created_at', '-id')
+
+
+def _has_fts_table(connection):
+    if connection.alias not in _fts_tables:
+        _fts_tables[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[connection.alias]
@@ -1,15 +1,47 @@
+from django.db.models import Max
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Chemicals, Locations
+from .locations import get_location_registry
+from .models import Chemicals, ChemicalActivity, Locations, ReportJob
 
 
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Locations
-        fields = ['id', 'name']
+        fields = ['id', 'name', 'parent', 'depth']
+        read_only_fields = ['depth']
 
+    def validate_parent(self, parent):
+        if parent is None:
+            return parent
 
-class ChemicalListSerializer(serializers.ModelSerializer):
-    location_name = serializers.CharField(source='location.name', read_only=True)
+        location = self.instance
+        if location is not None and location.id.hex in parent.path.split(Locations.PATH_SEPARATOR):
+            raise serializers.ValidationError('A location cannot be moved inside itself.')
+
+        # The deepest location of the subtree being placed under parent
+        subtree_height = 0
+        if location is not None:
+            deepest = Locations.objects.filter(location.subtree_filter()).aggregate(Max('depth'))['depth__max']
+            subtree_height = deepest - location.depth
+        if parent.depth + 1 + subtree_height >= Locations.MAX_DEPTH:
+            raise serializers.ValidationError(f'Locations can be nested at most {Locations.MAX_DEPTH} levels deep.')
+        return parent
+
+
+class LocationNameMixin:
+    """Renders ``location_name`` from the location registry instead of a join."""
+
+    def get_location_name(self, obj):
+        # The registry is fetched once per serialization, not per row
+        registry = self.context.get('location_registry')
+        if registry is None:
+            registry = self.context['location_registry'] = get_location_registry()
+        return registry.names.get(obj.location_id)
+
+
+class ChemicalListSerializer(LocationNameMixin, serializers.ModelSerializer):
+    location_name = serializers.SerializerMethodField()
     unit = serializers.SerializerMethodField()
 
     class Meta:
@@ -27,15 +59,16 @@ class ChemicalListSerializer(serializers.ModelSerializer):
             'location_name',
             'expires'
         ]
+        method_field_sources = {'unit': ['chemical_state'], 'location_name': ['location']}
 
     def get_unit(self, obj):
         return 'L' if obj.chemical_state == 'Liquid' else 'g'
 
 
-class ChemicalSerializer(serializers.ModelSerializer):
-    location_name = serializers.CharField(source='location.name', read_only=True)
+class ChemicalSerializer(LocationNameMixin, serializers.ModelSerializer):
+    location_name = serializers.SerializerMethodField()
     unit = serializers.SerializerMethodField()
-    created_by_name = serializers.CharField(source='created_by.username', read_only=True)
+    created_by_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Chemicals
@@ -60,6 +93,97 @@ class ChemicalSerializer(serializers.ModelSerializer):
             'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'created_by']
+        method_field_sources = {
+            'unit': ['chemical_state'],
+            'location_name': ['location'],
+            'created_by_name': ['created_by.first_name', 'created_by.last_name'],
+        }
 
     def get_unit(self, obj):
         return 'L' if obj.chemical_state == 'Liquid' else 'g'
+
+    def get_created_by_name(self, obj):
+        return obj.created_by.get_full_name() if obj.created_by_id else None
+
+
+class ChemicalImportSerializer(ChemicalSerializer):
+    """Validates one imported row; the location is given by name."""
+    location = serializers.CharField(source='location_id', max_length=225)
+
+    def validate_location(self, value):
+        # Resolved from the location registry's name -> id map
+        try:
+            return self.context['locations'][value]
+        except KeyError:
+            raise serializers.ValidationError(f'Unknown location "{value}".')
+
+
+class BulkChemicalActivityListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        attrs = super().to_internal_value(data)
+        # Look up every referenced chemical with one query. Checked here
+        # rather than in validate(), which would nest the per-item errors
+        # under non_field_errors.
+        chemical_ids = {item['chemical_id'] for item in attrs}
+        existing = set(Chemicals.objects.filter(pk__in=chemical_ids).values_list('pk', flat=True))
+
+        errors = [
+            {} if item['chemical_id'] in existing
+            else {'chemical': [f'Invalid pk "{item["chemical_id"]}" - object does not exist.']}
+            for item in attrs
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def create(self, validated_data):
+        activities = [ChemicalActivity(**item) for item in validated_data]
+        ChemicalActivity.bulk_record(activities)
+        return activities
+
+
+class ChemicalActivitySerializer(serializers.ModelSerializer):
+    # A plain UUID so a batch is validated with one query rather than one per item
+    chemical = serializers.UUIDField(source='chemical_id')
+
+    class Meta:
+        model = ChemicalActivity
+        fields = ['id', 'chemical', 'action', 'quantity', 'notes', 'user', 'timestamp']
+        read_only_fields = ['id', 'user', 'timestamp']
+        list_serializer_class = BulkChemicalActivityListSerializer
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    format = serializers.CharField(source='export_format', read_only=True)
+    status_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id',
+            'report_type',
+            'format',
+            'parameters',
+            'status',
+            'error',
+            'created_at',
+            'started_at',
+            'finished_at',
+            'status_url',
+            'download_url'
+        ]
+        read_only_fields = fields
+
+    def get_status_url(self, obj):
+        return self._build_url('report_job_status', obj)
+
+    def get_download_url(self, obj):
+        if obj.status != ReportJob.COMPLETED:
+            return None
+        return self._build_url('report_job_download', obj)
+
+    def _build_url(self, name, obj):
+        url = reverse(name, kwargs={'job_id': obj.id})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
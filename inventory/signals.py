@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .caching import bump_data_version, bump_version, record_deletion
+from .locations import REGISTRY_VERSION, detach_subtree
+from .models import ChemicalActivity, ChemicalDeletion, Chemicals, Locations
+
+
+@receiver(post_save, sender=Chemicals)
+@receiver(post_delete, sender=Chemicals)
+@receiver(post_save, sender=Locations)
+@receiver(post_delete, sender=Locations)
+@receiver(post_save, sender=ChemicalActivity)
+@receiver(post_delete, sender=ChemicalActivity)
+def invalidate_inventory_caches(sender, using, **kwargs):
+    bump_data_version(using=using)
+
+
+@receiver(post_delete, sender=Chemicals)
+@receiver(post_delete, sender=Locations)
+def remember_deletion(sender, using, **kwargs):
+    record_deletion(sender, using=using)
+
+
+@receiver(post_delete, sender=Chemicals)
+def record_chemical_tombstone(sender, instance, using, **kwargs):
+    ChemicalDeletion.objects.using(using).create(chemical_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Locations)
+def detach_sublocations(sender, instance, using, **kwargs):
+    detach_subtree(instance, using=using)
+
+
+@receiver(post_save, sender=Locations)
+@receiver(post_delete, sender=Locations)
+def invalidate_location_registry(sender, using, **kwargs):
+    bump_version(REGISTRY_VERSION, using=using)
@@ -0,0 +1,113 @@
+"""
+Delta sync for chemicals.
+
+A sync token records how far a client has read: the (updated_at, id)
+position of the last chemical it received and the time up to which it has
+seen deletions. ``get_changes`` returns the chemicals updated after that
+position, in (updated_at, id) order, and the ``ChemicalDeletion``
+tombstones recorded since, so a sync reads only what changed.
+
+``updated_at`` is set before the saving transaction commits, so a change
+can become visible with a timestamp slightly in the past. Once a client is
+caught up, its token is therefore moved back by ``SYNC_TOKEN_OVERLAP`` and
+the next sync re-reads that window; clients apply changes by id, so repeats
+are harmless.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChemicalDeletion, Chemicals
+from .pagination import _seek_filter, _to_cursor_value
+
+SYNC_ORDERING = ('updated_at', 'id')
+SYNC_TOKEN_OVERLAP = timedelta(minutes=1)
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def tombstone_retention():
+    return timedelta(days=settings.CHEMICAL_TOMBSTONE_RETENTION_DAYS)
+
+
+def get_changes(token, limit, queryset=None):
+    """
+    Return ``(chemicals, deleted, next_token, has_more, reset)`` for the
+    changes after ``token`` (``None`` for a full sync). At most ``limit``
+    chemicals are returned; ``has_more`` tells the client to call again
+    with ``next_token`` straight away. ``reset`` is set when the token is
+    older than the tombstone retention, in which case a full sync is
+    returned and the client should drop anything it did not receive.
+    """
+    now = timezone.now()
+    position, deleted_since = decode_sync_token(token) if token else (None, None)
+    reset = deleted_since is not None and deleted_since < now - tombstone_retention()
+    if reset:
+        position, deleted_since = None, None
+
+    chemicals = (queryset if queryset is not None else Chemicals.objects.all()).order_by(*SYNC_ORDERING)
+    if position is not None and position[1] is None:
+        chemicals = chemicals.filter(updated_at__gte=position[0])
+    elif position is not None:
+        chemicals = chemicals.filter(_seek_filter(SYNC_ORDERING, position))
+    chemicals = list(chemicals[:limit + 1])
+    has_more = len(chemicals) > limit
+    chemicals = chemicals[:limit]
+
+    # A full sync returns every live chemical, so it needs no tombstones
+    deleted = []
+    if deleted_since is not None:
+        deleted = list(
+            ChemicalDeletion.objects.filter(deleted_at__gt=deleted_since)
+            .order_by('deleted_at')
+            .values('chemical_id', 'deleted_at')
+        )
+
+    horizon = now - SYNC_TOKEN_OVERLAP
+    if has_more:
+        position = [_to_cursor_value(getattr(chemicals[-1], field)) for field in SYNC_ORDERING]
+    else:
+        position = [horizon.isoformat(), None]
+    next_token = encode_sync_token(position, horizon)
+    return chemicals, deleted, next_token, has_more, reset
+
+
+def encode_sync_token(position, deleted_since):
+    payload = {'c': position, 'd': deleted_since.isoformat()}
+    return base64.urlsafe_b64encode(
+        json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    ).decode('ascii')
+
+
+def decode_sync_token(token):
+    """
+    Return the chemical position and deletion time stored in ``token``. A
+    position without an id covers every chemical updated at or after its
+    time.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        updated_at, chemical_id = payload['c']
+        deleted_since = datetime.fromisoformat(payload['d'])
+        if timezone.is_naive(datetime.fromisoformat(updated_at)) or timezone.is_naive(deleted_since):
+            raise ValueError
+        if chemical_id is not None:
+            chemical_id = str(UUID(chemical_id))
+    except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+        raise InvalidSyncToken("Invalid sync token")
+    return [updated_at, chemical_id], deleted_since
+
+
+def prune_tombstones(before=None):
+    """Delete tombstones older than the retention period. Returns the count."""
+    if before is None:
+        before = timezone.now() - tombstone_retention()
+    deleted, _ = ChemicalDeletion.objects.filter(deleted_at__lt=before).delete()
+    return deleted
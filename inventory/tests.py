@@ -1,3 +1,772 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import re
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+from users.models import Users
+from .jobs import claim_job, claim_next_job, requeue_stale_jobs, run_job
+from .reports import _StreamingDocTemplate, _pdf_elements, build_report, parse_inventory_params, write_pdf_report
+from .models import Chemicals, ChemicalActivity, Locations, ReportJob
+from .caching import cache_stats
+from .locations import subtree_chemical_counts
+from .rollups import rebuild_usage_rollup
+from .search import search_chemicals
+from .views import ChemicalFilter
+
+
+def make_user(**kwargs):
+    fields = {
+        'email': 'admin@chemoventry.com',
+        'password': 'admin123',
+        'first_name': 'John',
+        'last_name': 'Admin',
+        'role': 'admin',
+    }
+    fields.update(kwargs)
+    return Users.objects.create_user(**fields)
+
+
+class AdminAPITestCase(TestCase):
+    """An API client authenticated as an admin user (``self.user``)."""
+
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+def make_chemical(user, location, **kwargs):
+    fields = {
+        'name': 'Sodium Chloride',
+        'quantity': 500,
+        'description': 'Table salt',
+        'vendor': 'Sigma-Aldrich',
+        'hazard_information': 'May cause mild eye irritation',
+        'molecular_formula': 'NaCl',
+        'reactivity_group': 'Other',
+        'chemical_type': 'Inorganic',
+        'chemical_state': 'Solid',
+        'location': location,
+        'expires': date(2100, 1, 1),
+        'created_by': user,
+    }
+    fields.update(kwargs)
+    return Chemicals.objects.create(**fields)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardOverviewTests(AdminAPITestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.location = Locations.objects.create(name='Cabinet A-1')
+
+    def record(self, chemical, action, quantity, when):
+        activity = ChemicalActivity.objects.create(
+            chemical=chemical, action=action, quantity=quantity, user=self.user
+        )
+        # timestamp is auto_now_add, so backdate it after the insert and
+        # recompute the daily rollup, which QuerySet.update() bypasses
+        ChemicalActivity.objects.filter(pk=activity.pk).update(timestamp=when)
+        rebuild_usage_rollup()
+
+    def test_overview_statistics(self):
+        today = timezone.localdate()
+        this_month = timezone.make_aware(datetime.combine(today.replace(day=1), time(12)))
+        last_month = timezone.make_aware(
+            datetime.combine((today.replace(day=1) - timedelta(days=1)).replace(day=1), time(12))
+        )
+
+        salt = make_chemical(self.user, self.location)
+        acid = make_chemical(self.user, self.location, name='Sulfuric Acid', quantity=50,
+                             chemical_state='Liquid')
+        make_chemical(self.user, self.location, name='Expired', expires=today - timedelta(days=1))
+
+        self.record(salt, 'used', 30, this_month)
+        self.record(acid, 'removed', 10, this_month)
+        self.record(salt, 'used', 20, last_month)
+        self.record(salt, 'restocked', 100, this_month)
+
+        response = self.client.get('/api/dashboard/overview/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_chemicals'], 3)
+        self.assertEqual(response.data['expired_chemicals'], 1)
+        self.assertEqual(response.data['low_stock_alerts'], 1)
+        self.assertEqual(response.data['monthly_usage'], 40)
+        self.assertEqual(response.data['monthly_usage_change'], 100)
+        self.assertEqual(len(response.data['recent_activity']), 4)
+
+        trends = response.data['usage_trends']
+        self.assertEqual(len(trends), 6)
+        self.assertEqual(trends[-1], {'month': today.strftime('%b'), 'usage': 40.0})
+        self.assertEqual(trends[-2]['usage'], 20.0)
+        self.assertEqual(sum(month['usage'] for month in trends), 60.0)
+
+    def test_overview_query_count(self):
+        chemical = make_chemical(self.user, self.location)
+        for _ in range(10):
+            self.record(chemical, 'used', 1, timezone.now())
+
+        # One conditional aggregate over chemicals, one TruncMonth GROUP BY
+        # over the daily rollup, the recent-activity feed and the per-location
+        # counts.
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/dashboard/overview/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_overview_is_cached(self):
+        make_chemical(self.user, self.location)
+
+        first = self.client.get('/api/dashboard/overview/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/dashboard/overview/')
+
+        self.assertEqual(first.data, second.data)
+        stats = cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_change_serves_stale_overview_while_refreshing(self):
+        make_chemical(self.user, self.location)
+        self.client.get('/api/dashboard/overview/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_chemical(self.user, self.location, name='Ethanol')
+
+        with patch('inventory.caching._refresh_in_background') as refresh:
+            response = self.client.get('/api/dashboard/overview/')
+        self.assertEqual(response.data['total_chemicals'], 1)
+        refresh.assert_called_once()
+        self.assertEqual(cache_stats()['stale'], 1)
+
+        cache.clear()
+        self.assertEqual(self.client.get('/api/dashboard/overview/').data['total_chemicals'], 2)
+
+
+class ChemicalActivityLedgerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = make_user(email='labtech@chemoventry.com', first_name='Lab', last_name='Technician', role='attendant')
+        self.location = Locations.objects.create(name='Cabinet A-1')
+        self.chemical = make_chemical(self.user, self.location, quantity=1000)
+
+    def test_activity_updates_quantity(self):
+        activity = ChemicalActivity.objects.create(
+            chemical=self.chemical, action='used', quantity=-30, user=self.user
+        )
+        self.assertEqual(activity.chemical.quantity, 970)
+
+        activity.notes = 'Titration'
+        activity.save()
+        self.chemical.refresh_from_db()
+        self.assertEqual(self.chemical.quantity, 970)
+
+        ChemicalActivity.objects.create(chemical=self.chemical, action='updated', quantity=250, user=self.user)
+        self.chemical.refresh_from_db()
+        self.assertEqual(self.chemical.quantity, 250)
+
+    def test_concurrent_activities(self):
+        def record(index):
+            try:
+                # Each worker loads its own copy, as separate requests would
+                chemical = Chemicals.objects.get(pk=self.chemical.pk)
+                action = 'restocked' if index % 4 == 0 else 'used'
+                ChemicalActivity.objects.create(chemical=chemical, action=action, quantity=2, user=self.user)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(record, range(400)))
+
+        # 100 restocks of 2 and 300 uses of 2
+        self.chemical.refresh_from_db()
+        self.assertEqual(self.chemical.quantity, 1000 + 100 * 2 - 300 * 2)
+        self.assertEqual(ChemicalActivity.objects.count(), 400)
+
+
+class BulkActivityTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        location = Locations.objects.create(name='Cabinet A-1')
+        self.acetone = make_chemical(self.user, location, name='Acetone', quantity=1000)
+        self.ethanol = make_chemical(self.user, location, name='Ethanol', quantity=1000)
+
+    def post(self, activities):
+        return self.client.post('/api/chemical/activities/bulk/', activities, format='json')
+
+    def test_batch_is_applied_in_order(self):
+        response = self.post([
+            {'chemical': str(self.acetone.pk), 'action': 'used', 'quantity': 10},
+            {'chemical': str(self.ethanol.pk), 'action': 'used', 'quantity': 10},
+            {'chemical': str(self.acetone.pk), 'action': 'updated', 'quantity': 70},
+            {'chemical': str(self.acetone.pk), 'action': 'restocked', 'quantity': 5},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.acetone.refresh_from_db()
+        self.ethanol.refresh_from_db()
+        self.assertEqual((self.acetone.quantity, self.ethanol.quantity), (75, 990))
+        self.assertEqual(ChemicalActivity.objects.count(), 4)
+
+    def test_errors_are_reported_per_item(self):
+        missing = uuid.uuid4()
+        response = self.post([
+            {'chemical': str(self.acetone.pk), 'action': 'used', 'quantity': 10},
+            {'chemical': str(missing), 'action': 'used', 'quantity': 10},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [{}, {'chemical': [f'Invalid pk "{missing}" - object does not exist.']}])
+        self.assertFalse(ChemicalActivity.objects.exists())
+
+
+class ChemicalChangesTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.location = Locations.objects.create(name='Cabinet A-1')
+
+    def sync(self, token=None, limit=None):
+        params = {}
+        if token:
+            params['since'] = token
+        if limit:
+            params['limit'] = limit
+        response = self.client.get('/api/chemical/changes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def age(self, chemical, minutes):
+        Chemicals.objects.filter(pk=chemical.pk).update(
+            updated_at=timezone.now() - timedelta(minutes=minutes)
+        )
+
+    def test_sync_returns_only_changes(self):
+        kept = make_chemical(self.user, self.location, name='Acetone')
+        edited = make_chemical(self.user, self.location, name='Ethanol')
+        deleted = make_chemical(self.user, self.location, name='Methanol')
+        for chemical in (kept, edited, deleted):
+            self.age(chemical, 10)
+
+        first = self.sync(limit=2)
+        self.assertTrue(first['has_more'])
+        second = self.sync(first['token'], limit=2)
+        self.assertFalse(second['has_more'])
+        received = [row['name'] for row in first['changes'] + second['changes']]
+        self.assertCountEqual(received, ['Acetone', 'Ethanol', 'Methanol'])
+
+        edited.quantity = 250
+        edited.save()
+        deleted_id = deleted.id
+        deleted.delete()
+
+        delta = self.sync(second['token'])
+        self.assertEqual([row['name'] for row in delta['changes']], ['Ethanol'])
+        self.assertEqual([row['id'] for row in delta['deleted']], [deleted_id])
+        self.assertFalse(delta['reset'])
+
+    def test_pages_use_the_updated_at_index(self):
+        plan = Chemicals.objects.order_by('updated_at', 'id').filter(updated_at__gte=timezone.now()).explain()
+        self.assertIn('inventory_c_updated_a8be51_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_invalid_token(self):
+        response = self.client.get('/api/chemical/changes/', {'since': 'not-a-token'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChemicalImportTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        Locations.objects.create(name='Cabinet A-1')
+
+    def upload(self, name, content):
+        return self.client.post(
+            '/api/chemical/import/', {'file': SimpleUploadedFile(name, content.encode())}, format='multipart'
+        )
+
+    def test_csv_import_skips_invalid_rows(self):
+        content = (
+            'name,quantity,description,vendor,hazard_information,molecular_formula,'
+            'reactivity_group,chemical_type,chemical_state,location,expires\n'
+            'Acetone,2.5,Solvent,Merck,Flammable,C3H6O,Other,Organic,Liquid,Cabinet A-1,2030-01-01\n'
+            'Ethanol,abc,Solvent,Merck,Flammable,C2H6O,Other,Organic,Liquid,Cabinet A-1,2030-01-01\n'
+            'Methanol,1,Solvent,Merck,Toxic,CH4O,Other,Organic,Liquid,Cabinet Z-9,2030-01-01\n'
+        )
+        response = self.upload('chemicals.csv', content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.assertIn('quantity', response.data['errors'][0]['errors'])
+        self.assertIn('location', response.data['errors'][1]['errors'])
+
+        chemical = Chemicals.objects.get()
+        self.assertEqual(chemical.created_by, self.user)
+        self.assertEqual(chemical.balance_checkpoints.get().quantity, 2.5)
+
+    def test_ndjson_import(self):
+        row = {
+            'name': 'Sodium Chloride', 'quantity': 500, 'description': 'Table salt',
+            'vendor': 'Sigma-Aldrich', 'hazard_information': 'Irritant', 'molecular_formula': 'NaCl',
+            'reactivity_group': 'Other', 'chemical_type': 'Inorganic', 'chemical_state': 'Solid',
+            'location': 'Cabinet A-1', 'expires': '2030-01-01',
+        }
+        content = '\n'.join([json.dumps(row), 'not json', json.dumps(dict(row, name='Potassium Chloride'))])
+        response = self.upload('chemicals.ndjson', content)
+
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+
+    def test_export_round_trips_filtered_chemicals(self):
+        location = Locations.objects.get()
+        make_chemical(self.user, location, name='Acetone', chemical_state='Liquid')
+        make_chemical(self.user, location, name='Sodium Chloride')
+
+        response = self.client.get('/api/chemical/export/', {'format': 'csv', 'chemical_state': 'Liquid'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual([(row['name'], row['unit'], row['location']) for row in rows], [('Acetone', 'L', 'Cabinet A-1')])
+
+        response = self.client.get('/api/chemical/export/', {'format': 'ndjson'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertCountEqual([json.loads(line)['name'] for line in lines], ['Acetone', 'Sodium Chloride'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ChemicalFacetTests(AdminAPITestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.cabinet = Locations.objects.create(name='Cabinet A-1')
+        self.shelf = Locations.objects.create(name='Shelf B-2')
+        make_chemical(self.user, self.cabinet, name='Acetone', chemical_type='Organic', chemical_state='Liquid')
+        make_chemical(self.user, self.cabinet, name='Ethanol', chemical_type='Organic', chemical_state='Liquid')
+        make_chemical(self.user, self.shelf, name='Sodium Chloride')
+
+    def test_facets_count_the_filtered_list(self):
+        response = self.client.get('/api/chemical/', {'chemical_type': 'Organic', 'facets': 'chemical_state,location'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['facets']['chemical_state'], [{'value': 'Liquid', 'count': 2}])
+        self.assertEqual(
+            response.data['facets']['location'],
+            [{'value': self.cabinet.id, 'name': 'Cabinet A-1', 'count': 2}],
+        )
+
+    def test_facets_are_cached_until_data_changes(self):
+        self.client.get('/api/chemical/', {'facets': 'all'})
+        # Validator aggregate, the page and the location registry version
+        with self.assertNumQueries(3):
+            self.client.get('/api/chemical/', {'facets': 'all'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_chemical(self.user, self.shelf, name='Potassium Chloride')
+        response = self.client.get('/api/chemical/', {'facets': 'chemical_type'})
+        self.assertEqual(response.data['facets']['chemical_type'], [
+            {'value': 'Inorganic', 'count': 2}, {'value': 'Organic', 'count': 2},
+        ])
+
+    def test_unknown_facet(self):
+        response = self.client.get('/api/chemical/', {'facets': 'vendor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LocationHierarchyTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.building = Locations.objects.create(name='Building 3')
+        self.room = Locations.objects.create(name='Room 301', parent=self.building)
+        self.cabinet = Locations.objects.create(name='Cabinet A-1', parent=self.room)
+        self.other = Locations.objects.create(name='Building 4')
+
+    def test_moving_a_location_moves_its_subtree(self):
+        self.room.parent = self.other
+        self.room.save()
+
+        self.cabinet.refresh_from_db()
+        self.assertEqual(self.cabinet.path, f'{self.other.id.hex}/{self.room.id.hex}/{self.cabinet.id.hex}/')
+        self.assertEqual(self.cabinet.depth, 2)
+
+        self.room.delete()
+        self.cabinet.refresh_from_db()
+        self.assertIsNone(self.cabinet.parent)
+        self.assertEqual((self.cabinet.path, self.cabinet.depth), (f'{self.cabinet.id.hex}/', 0))
+
+    def test_cannot_move_inside_own_subtree(self):
+        response = self.client.patch(f'/api/location/{self.building.id}/', {'parent': str(self.cabinet.id)})
+        self.assertEqual(response.status_code, 400)
+
+    def test_subtree_filter_and_counts(self):
+        make_chemical(self.user, self.cabinet, name='Acetone')
+        make_chemical(self.user, self.room, name='Ethanol')
+        make_chemical(self.user, self.other, name='Sodium Chloride')
+
+        with self.assertNumQueries(2):  # the location's path, then the range query
+            names = [chemical.name for chemical in Chemicals.objects.filter(
+                pk__in=ChemicalFilter({'within': str(self.building.id)}, Chemicals.objects.all()).qs
+            )]
+        self.assertCountEqual(names, ['Acetone', 'Ethanol'])
+
+        counts = {row['name']: (row['chemicals'], row['subtree_chemicals']) for row in subtree_chemical_counts()}
+        self.assertEqual(counts, {
+            'Building 3': (0, 2), 'Room 301': (1, 2), 'Cabinet A-1': (1, 1), 'Building 4': (1, 1),
+        })
+
+    def test_location_names_come_from_the_registry(self):
+        make_chemical(self.user, self.cabinet, name='Acetone')
+        self.client.get('/api/chemical/')
+
+        self.cabinet.name = 'Cabinet A-2'
+        self.cabinet.save()
+        response = self.client.get('/api/chemical/')
+        self.assertEqual(response.data['results'][0]['location_name'], 'Cabinet A-2')
+
+        # Names are read from the process-local registry without a join
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/chemical/')
+        self.assertFalse(any('"inventory_locations"."name"' in query['sql'] for query in queries))
+
+
+class IdempotencyKeyTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.location = Locations.objects.create(name='Cabinet A-1')
+        self.chemical = make_chemical(self.user, self.location, quantity=100)
+
+    def use(self, quantity, key):
+        return self.client.post(
+            '/api/chemical/activities/bulk/',
+            [{'chemical': str(self.chemical.id), 'action': 'used', 'quantity': quantity}],
+            format='json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.use(10, 'retry-1')
+        retry = self.use(10, 'retry-1')
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertJSONEqual(retry.content, first.content.decode())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.chemical.refresh_from_db()
+        self.assertEqual(self.chemical.quantity, 90)
+        self.assertEqual(ChemicalActivity.objects.count(), 1)
+
+    def test_key_reused_for_a_different_request(self):
+        self.use(10, 'retry-1')
+        self.assertEqual(self.use(20, 'retry-1').status_code, 422)
+        self.assertEqual(self.use(20, 'retry-2').status_code, 201)
+
+
+class ChemicalSearchTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.location = Locations.objects.create(name='Cabinet A-1')
+        make_chemical(self.user, self.location, name='Sulfuric Acid', molecular_formula='H2SO4',
+                      description='Strong acid')
+        make_chemical(self.user, self.location)  # Sodium Chloride, NaCl
+        make_chemical(self.user, self.location, name='Tert-Butanol', molecular_formula='C4H10O',
+                      description='Solvent')
+
+    def search(self, value, **params):
+        response = self.client.get('/api/chemical/', {'search': value, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def names(self, value):
+        return [row['name'] for row in self.search(value)['results']]
+
+    def test_words_match_by_prefix(self):
+        self.assertEqual(self.names('sulf'), ['Sulfuric Acid'])
+        self.assertEqual(self.names('acid strong'), ['Sulfuric Acid'])
+
+    def test_formula_fragments_match_by_substring(self):
+        self.assertEqual(self.names('SO4'), ['Sulfuric Acid'])
+        self.assertEqual(self.names('Cl'), ['Sodium Chloride'])
+        self.assertEqual(self.names('-'), ['Tert-Butanol'])
+        self.assertEqual(self.names('xyz'), [])
+
+    def test_paging_across_tied_ranks(self):
+        for index in range(7):
+            make_chemical(self.user, self.location, name=f'Acetone {index}', molecular_formula='C3H6O')
+
+        seen, params = [], {'page_size': 2}
+        while True:
+            page = self.search('acetone', **params)
+            seen.extend(row['id'] for row in page['results'])
+            if not page['next']:
+                break
+            params['cursor'] = parse_qs(urlparse(page['next']).query)['cursor'][0]
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_index_serves_word_searches(self):
+        with self.assertNumQueries(1):
+            queryset = search_chemicals(Chemicals.objects.all(), 'sulf acid')
+        plan = queryset.explain()
+        self.assertIn('inventory_chemicals_fts VIRTUAL TABLE INDEX', plan)
+        self.assertNotIn('SCAN inventory_chemicals\n', plan + '\n')
+        # No per-row subquery for the rank
+        self.assertNotIn('CORRELATED', plan)
+
+        with self.assertNumQueries(1):
+            self.assertEqual([chemical.name for chemical in queryset.all()], ['Sulfuric Acid'])
+
+
+class KeysetPaginationTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        location = Locations.objects.create(name='Cabinet A-1')
+        for index in range(5):
+            make_chemical(self.user, location, name=f'Chemical {index}')
+        # Every row ties on created_at, so the order falls to the id
+        Chemicals.objects.update(created_at=timezone.now())
+        self.expected = [str(pk) for pk in Chemicals.objects.order_by('-created_at', '-id').values_list('id', flat=True)]
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_follow_the_full_ordering_without_offsets(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.get('/api/chemical/', {'page_size': 2})
+            second = self.get(first['next'])
+            third = self.get(second['next'])
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+        self.assertIsNone(third['next'])
+
+        pages = [first, second, third]
+        self.assertEqual([row['id'] for page in pages for row in page['results']], self.expected)
+
+        back = self.get(third['previous'])
+        self.assertEqual([row['id'] for row in back['results']], self.expected[2:4])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/chemical/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_edited_cursor_values(self):
+        def cursor(position):
+            return base64.urlsafe_b64encode(json.dumps({'p': position}).encode()).decode()
+
+        for url, position in [
+            ('/api/chemical/', ['not-a-date', 1]),
+            ('/api/chemical/', [None, None]),
+            ('/api/chemical/', [{'a': 1}, 1]),
+            ('/api/chemical/', [timezone.now().isoformat(), 'not-a-uuid']),
+            ('/api/location/', ['x', 'y']),
+            ('/api/location/', [['x'], str(uuid.uuid4())]),
+        ]:
+            with self.subTest(url=url, position=position):
+                response = self.client.get(url, {'cursor': cursor(position)})
+                self.assertEqual(response.status_code, 404)
+
+        # The rank of a search cursor is checked too
+        position = ['x', timezone.now().isoformat(), self.expected[0]]
+        response = self.client.get('/api/chemical/', {'search': 'chemical', 'cursor': cursor(position)})
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryOptimizerTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.chemical = make_chemical(self.user, Locations.objects.create(name='Cabinet A-1'))
+
+    def test_detail_loads_only_the_rendered_creator_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/chemical/{self.chemical.id}/')
+        self.assertEqual(response.data['created_by_name'], 'John Admin')
+
+        chemical_query = next(
+            query['sql'] for query in queries.captured_queries
+            if 'FROM "inventory_chemicals"' in query['sql'] and 'COUNT' not in query['sql']
+        )
+        self.assertIn('JOIN "users_users"', chemical_query)
+        self.assertIn('"users_users"."first_name"', chemical_query)
+        self.assertNotIn('"users_users"."password"', chemical_query)
+
+    def test_list_skips_unrendered_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/chemical/')
+        chemical_queries = [
+            query['sql'] for query in queries.captured_queries
+            if 'FROM "inventory_chemicals"' in query['sql'] and 'COUNT' not in query['sql']
+        ]
+        self.assertEqual(len(chemical_queries), 1)
+        self.assertNotIn('"hazard_information"', chemical_queries[0])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConditionalGetTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.location = Locations.objects.create(name='Cabinet A-1')
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get('/api/location/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        self.assertEqual(self.client.get('/api/location/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.location.name = 'Cabinet A-2'
+        self.location.save()
+        changed = self.client.get('/api/location/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_deletion_changes_the_etag(self):
+        Locations.objects.create(name='Shelf B-2')
+        etag = self.client.get('/api/location/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.delete()
+        self.assertEqual(self.client.get('/api/location/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ExcelReportTests(AdminAPITestCase):
+    def test_inventory_report_workbook(self):
+        location = Locations.objects.create(name='Cabinet A-1')
+        make_chemical(self.user, location, name='Acetone')
+        make_chemical(self.user, location, name='Ethanol')
+        today = timezone.localdate().isoformat()
+
+        response = self.client.get(
+            '/api/reports/inventory/', {'format': 'excel', 'start_date': today, 'end_date': today}
+        )
+        self.assertEqual(response.status_code, 200)
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        values = [row for row in workbook.active.iter_rows(values_only=True)]
+        header = values.index(next(row for row in values if row and row[0] == 'Chemical Name'))
+        self.assertEqual(sorted(row[0] for row in values[header + 1:] if row[0]), ['Acetone', 'Ethanol'])
+
+
+@override_settings(REPORT_JOB_LOCAL_WORKERS=0, REPORT_JOB_TIMEOUT_MINUTES=30)
+class ReportJobTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        make_chemical(self.user, Locations.objects.create(name='Cabinet A-1'), name='Acetone')
+
+    def enqueue(self):
+        response = self.client.get('/api/reports/expiry/', {'async': '1', 'format': 'excel', 'days': 30})
+        self.assertEqual(response.status_code, 202)
+        return ReportJob.objects.get(pk=response.data['id'])
+
+    def test_queued_report_is_run_and_downloaded(self):
+        job = self.enqueue()
+        self.assertEqual((job.status, job.export_format, job.parameters), (ReportJob.PENDING, 'excel', {'days': 30}))
+
+        self.assertEqual(claim_next_job(), job.pk)
+        self.assertFalse(claim_job(job.pk))
+        self.assertEqual(run_job(job.pk).status, ReportJob.COMPLETED)
+
+        response = self.client.get(f'/api/reports/jobs/{job.pk}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response.close()
+
+    def test_jobs_past_their_lease_are_claimed_again(self):
+        job = self.enqueue()
+        self.assertTrue(claim_job(job.pk))
+        self.assertIsNone(claim_next_job())
+
+        ReportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(minutes=31))
+        self.assertEqual(claim_next_job(), job.pk)
+        self.assertIsNone(claim_next_job())
+
+        ReportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(minutes=31))
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=30)), 1)
+        self.assertEqual(ReportJob.objects.get(pk=job.pk).status, ReportJob.PENDING)
+
+    def test_format_param_still_selects_renderers_elsewhere(self):
+        self.assertEqual(self.client.get(f'/api/reports/jobs/{self.enqueue().pk}/', {'format': 'json'}).status_code, 200)
+        self.assertEqual(self.client.get('/api/chemical/', {'format': 'pdf'}).status_code, 404)
+
+
+class InventoryReportTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.chemical = make_chemical(self.user, Locations.objects.create(name='Cabinet A-1'), quantity=0)
+        long_ago = timezone.now() - timedelta(days=10)
+        Chemicals.objects.filter(pk=self.chemical.pk).update(created_at=long_ago)
+        self.chemical.balance_checkpoints.update(as_of=long_ago)
+
+        # Enough activity since the checkpoint for a replay to be worth saving
+        ChemicalActivity.objects.bulk_create([
+            ChemicalActivity(chemical=self.chemical, user=self.user, action='restocked', quantity=1)
+            for _ in range(100)
+        ])
+        ChemicalActivity.objects.update(timestamp=timezone.now() - timedelta(days=5))
+        self.params = {
+            'start_date': (timezone.localdate() - timedelta(days=2)).isoformat(),
+            'end_date': (timezone.localdate() - timedelta(days=1)).isoformat(),
+        }
+
+    def test_ids_are_validated(self):
+        response = self.client.get('/api/reports/inventory/', {**self.params, 'location': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Invalid location. Use a UUID.'})
+
+        response = self.client.get('/api/reports/usage/', {**self.params, 'user_id': '1'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requests_do_not_write_checkpoints(self):
+        response = self.client.get('/api/reports/inventory/', {**self.params, 'format': 'excel'})
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        self.assertEqual(self.chemical.balance_checkpoints.count(), 1)
+
+        report = build_report('inventory', parse_inventory_params(self.params))
+        self.assertEqual([row[3] for row in report.rows], ['100.0 g'])
+        # The opening balance; the closing one then replays nothing
+        self.assertEqual(sorted(self.chemical.balance_checkpoints.values_list('quantity', flat=True)), [0, 100])
+
+
+class PDFReportTests(TestCase):
+    headers = ['Date & Time', 'Chemical', 'Action', 'Notes']
+
+    def rows(self):
+        for index in range(150):
+            # Every fifth row has multi-line notes, so rows differ in height
+            notes = 'Titration\nrepeated\ntwice' if index % 5 == 0 else 'N/A'
+            yield ['2024-01-01 09:00', f'Chemical {index}', 'Used', notes]
+
+    def test_each_table_chunk_fills_one_page(self):
+        doc = _StreamingDocTemplate(io.BytesIO(), pagesize=(792, 612), leftMargin=36, rightMargin=36,
+                                    topMargin=36, bottomMargin=36)
+        rows = self.rows()
+        tables = list(_pdf_elements(doc, 'Usage', self.headers, rows, '2024-01-01', '2024-01-31'))[3:]
+        self.assertGreater(len(tables), 2)
+        self.assertIsNone(next(rows, None))
+
+        output = io.BytesIO()
+        write_pdf_report(output, 'Usage', self.headers, self.rows(), '2024-01-01', '2024-01-31')
+        pdf = output.getvalue()
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        # A chunk that overflowed its page would split onto an extra one
+        self.assertEqual(len(re.findall(rb'/Type /Page\b', pdf)), len(tables))
+
+    def test_empty_report(self):
+        output = io.BytesIO()
+        write_pdf_report(output, 'Usage', self.headers, iter([]), '2024-01-01', '2024-01-31')
+        self.assertEqual(len(re.findall(rb'/Type /Page\b', output.getvalue())), 1)
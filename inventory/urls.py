@@ -6,6 +6,7 @@ from .views import (
     ChemicalViewSet,
     #get_dashboard_stats,
     get_dashboard_overview,
+    get_dashboard_cache_stats,
     generate_report
 )
 
@@ -19,6 +20,7 @@ urlpatterns = [
     
     #path('dashboard/stats/', get_dashboard_stats, name='dashboard-stats'),
     path('dashboard/overview/', get_dashboard_overview, name='dashboard-overview'),
+    path('dashboard/cache-stats/', get_dashboard_cache_stats, name='dashboard-cache-stats'),
     
     # Reports - old endpoint (keeping for backward compatibility)
     path('reports/generate/', generate_report, name='generate_report'),
@@ -1,17 +1,32 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters import rest_framework as filters
-from .models import Chemicals, Locations, ChemicalActivity
-from .serializers import ChemicalSerializer, ChemicalListSerializer, LocationSerializer
+from chemoventry.mixins import ConditionalGetMixin, QueryOptimizerMixin, optimize_queryset
+from chemoventry.negotiation import ExportContentNegotiation
+from .models import Chemicals, Locations, ChemicalActivity, ChemicalUsageDaily
+from .serializers import ChemicalSerializer, ChemicalListSerializer, LocationSerializer, ChemicalActivitySerializer
+from .pagination import KeysetPagination, LocationPagination
+from .search import search_chemicals
+from .balances import checkpoint_chemical
+from .caching import cache_stats, get_last_deletion, get_or_refresh
+from .sync import InvalidSyncToken, get_changes
+from .imports import IMPORT_FORMATS, ImportFileError, guess_import_format, import_chemicals, read_rows
+from .exports import EXPORT_CONTENT_TYPES, EXPORT_STREAMS
+from .facets import FACETS, InvalidFacet, chemical_facets, parse_facets
+from .locations import subtree_chemical_counts
+from .idempotency import IdempotencyMixin
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
 from django.db.models import Q, Count, Sum, F
+from django.db.models.functions import TruncMonth
+from django.conf import settings
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 import random
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
@@ -19,14 +34,25 @@ import openpyxl
 from openpyxl.styles import Font, PatternFill
 from io import BytesIO
 
-class LocationViewSet(viewsets.ModelViewSet):
+USAGE_ACTIONS = ['used', 'removed']
+USAGE_TREND_MONTHS = 6
+MAX_BULK_ACTIVITIES = 10000
+SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 5000
+
+
+class LocationViewSet(IdempotencyMixin, ConditionalGetMixin, QueryOptimizerMixin, viewsets.ModelViewSet):
     queryset = Locations.objects.all()
     serializer_class = LocationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = LocationPagination
 
     def get_queryset(self):
         return Locations.objects.all()
 
+    def get_last_deleted(self):
+        return get_last_deletion(Locations)
+
     @extend_schema(
         tags=['Location'],
         description='List all Locations',
@@ -76,33 +102,54 @@ class ChemicalFilter(filters.FilterSet):
     expires_before = filters.DateFilter(field_name='expires', lookup_expr='lte')
     expires_after = filters.DateFilter(field_name='expires', lookup_expr='gte')
     search = filters.CharFilter(method='filter_search')
+    within = filters.UUIDFilter(method='filter_within')
 
     def filter_search(self, queryset, name, value):
-        return queryset.filter(
-            Q(name__icontains=value) |
-            Q(description__icontains=value) |
-            Q(molecular_formula__icontains=value)
-        )
+        return search_chemicals(queryset, value)
+
+    def filter_within(self, queryset, name, value):
+        # The location and everything below it, as one range on the path index
+        location = Locations.objects.filter(pk=value).only('path').first()
+        if location is None:
+            return queryset.none()
+        return queryset.filter(location.subtree_filter('location__'))
 
     class Meta:
         model = Chemicals
         fields = ['chemical_type', 'chemical_state', 'reactivity_group', 'location']
 
 
-class ChemicalViewSet(viewsets.ModelViewSet):
+class ChemicalViewSet(IdempotencyMixin, ConditionalGetMixin, QueryOptimizerMixin, viewsets.ModelViewSet):
     queryset = Chemicals.objects.all()
     serializer_class = ChemicalSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [filters.DjangoFilterBackend]
     filterset_class = ChemicalFilter
+    pagination_class = KeysetPagination
+    # location_name is rendered from the related location
+    last_modified_fields = ('updated_at', 'location__updated_at')
+
+    def get_last_deleted(self):
+        return get_last_deletion(Chemicals)
 
     def get_serializer_class(self):
         if self.action == 'list':
             return ChemicalListSerializer
+        if self.action == 'bulk_activities':
+            return ChemicalActivitySerializer
         return ChemicalSerializer
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    def perform_update(self, serializer):
+        previous_quantity = serializer.instance.quantity
+        chemical = serializer.save()
+        if chemical.quantity != previous_quantity:
+            # Set directly rather than through an activity, so the ledger
+            # can't account for it
+            checkpoint_chemical(chemical)
+
     @extend_schema(
         tags=['Chemicals'],
         description='List all Chemicals',
@@ -118,11 +165,24 @@ class ChemicalViewSet(viewsets.ModelViewSet):
             OpenApiParameter('expires_before', OpenApiTypes.DATE),
             OpenApiParameter('expires_after', OpenApiTypes.DATE),
             OpenApiParameter('search', OpenApiTypes.STR),
+            OpenApiParameter('within', OpenApiTypes.UUID,
+                description='Only chemicals stored in this location or any location below it'),
+            OpenApiParameter('facets', OpenApiTypes.STR,
+                description=f'Comma-separated facets to count over the filtered list, or "all": {", ".join(FACETS)}'),
         ],
         responses={200: ChemicalListSerializer}
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        try:
+            facets = parse_facets(request.query_params.get('facets'))
+        except InvalidFacet as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = super().list(request, *args, **kwargs)
+        if facets and response.status_code == 200:
+            queryset = self.filter_queryset(self.get_queryset())
+            response.data['facets'] = chemical_facets(queryset, request.query_params, facets)
+        return response
     
     @extend_schema(
         tags=['Chemicals'],
@@ -156,104 +216,181 @@ class ChemicalViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
 
-
-@extend_schema(
-    tags=['Dashboard'],
-    description='Get dashboard statistics',
-    responses={200: {
-        'type': 'object',
-        'properties': {
-            'total_chemicals': {'type': 'integer'},
-            'total_locations': {'type': 'integer'},
-            'expiring_soon': {'type': 'integer'},
-            'low_quantity': {'type': 'integer'},
-            'chemical_types': {
-                'type': 'object',
-                'properties': {
-                    'Organic': {'type': 'integer'},
-                    'Inorganic': {'type': 'integer'},
-                    'Both': {'type': 'integer'}
+    @extend_schema(
+        tags=['Chemicals'],
+        description='Record a batch of chemical activities and apply them to stock levels in one transaction',
+        request=ChemicalActivitySerializer(many=True),
+        responses={201: {
+            'type': 'object',
+            'properties': {
+                'created': {'type': 'integer'},
+                'chemicals': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'id': {'type': 'string', 'format': 'uuid'},
+                            'quantity': {'type': 'number', 'format': 'float'}
+                        }
+                    }
                 }
-            },
-            'chemical_states': {
+            }
+        }}
+    )
+    @action(detail=False, methods=['post'], url_path='activities/bulk')
+    def bulk_activities(self, request):
+        serializer = self.get_serializer(
+            data=request.data, many=True, allow_empty=False, max_length=MAX_BULK_ACTIVITIES
+        )
+        serializer.is_valid(raise_exception=True)
+        activities = serializer.save(user=request.user)
+
+        chemical_ids = {activity.chemical_id for activity in activities}
+        quantities = Chemicals.objects.filter(pk__in=chemical_ids).order_by().values('id', 'quantity')
+        return Response({
+            'created': len(activities),
+            'chemicals': list(quantities),
+        }, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        tags=['Chemicals'],
+        description='Stream the chemicals matching the list filters as CSV (default) or NDJSON',
+        parameters=[
+            OpenApiParameter('format', OpenApiTypes.STR, enum=['csv', 'ndjson']),
+            OpenApiParameter('chemical_type', OpenApiTypes.STR,
+                enum=['Organic', 'Inorganic', 'Both']),
+            OpenApiParameter('chemical_state', OpenApiTypes.STR,
+                enum=['Solid', 'Liquid', 'Gas', 'Plasma', 'Other']),
+            OpenApiParameter('reactivity_group', OpenApiTypes.STR,
+                enum=['Alkali', 'Alkaline Earth', 'Transition Metal', 'Lanthanide',
+                      'Actinide', 'Metal', 'Nonmetal', 'Halogen', 'Noble Gas', 'Other']),
+            OpenApiParameter('location', OpenApiTypes.UUID),
+            OpenApiParameter('expires_before', OpenApiTypes.DATE),
+            OpenApiParameter('expires_after', OpenApiTypes.DATE),
+            OpenApiParameter('search', OpenApiTypes.STR),
+            OpenApiParameter('within', OpenApiTypes.UUID,
+                description='Only chemicals stored in this location or any location below it'),
+        ],
+        responses={(200, 'text/csv'): OpenApiTypes.STR, (200, 'application/x-ndjson'): OpenApiTypes.STR}
+    )
+    @action(detail=False, methods=['get'], content_negotiation_class=ExportContentNegotiation)
+    def export(self, request):
+        export_format = request.query_params.get('format', 'csv').lower()
+        if export_format not in EXPORT_STREAMS:
+            return Response({"error": "Invalid format. Use 'csv' or 'ndjson'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            EXPORT_STREAMS[export_format](queryset),
+            content_type=EXPORT_CONTENT_TYPES[export_format],
+        )
+        filename = f"chemicals_{timezone.localdate():%Y%m%d}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @extend_schema(
+        tags=['Chemicals'],
+        description='Import chemicals from a CSV or NDJSON file. Columns/keys are the Chemical fields, with '
+                    'location given by name. Invalid rows are reported and skipped; the rest are created.',
+        request={
+            'multipart/form-data': {
                 'type': 'object',
                 'properties': {
-                    'Solid': {'type': 'integer'},
-                    'Liquid': {'type': 'integer'},
-                    'Gas': {'type': 'integer'},
-                    'Plasma': {'type': 'integer'},
-                    'Other': {'type': 'integer'}
-                }
-            },
-            'chemicals_by_location': {
-                'type': 'array',
-                'items': {
-                    'type': 'object',
-                    'properties': {
-                        'location': {'type': 'string'},
-                        'count': {'type': 'integer'}
+                    'file': {'type': 'string', 'format': 'binary'},
+                    'file_format': {'type': 'string', 'enum': IMPORT_FORMATS,
+                                    'description': 'Defaults to the file extension'}
+                },
+                'required': ['file']
+            }
+        },
+        responses={200: {
+            'type': 'object',
+            'properties': {
+                'created': {'type': 'integer'},
+                'failed': {'type': 'integer'},
+                'errors': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'row': {'type': 'integer'},
+                            'errors': {'type': 'object'}
+                        }
                     }
                 }
             }
-        }
-    }}
-)
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_dashboard_overview(request):
-    """
-    Get an overview of the chemical inventory dashboard including:
-    - Total number of chemicals
-    - Total number of locations
-    - Number of chemicals expiring soon
-    - Number of chemicals with low quantity
-    - Distribution of chemicals by type and state
-    - Distribution of chemicals by location
-    """
-    # Get basic counts
-    total_chemicals = Chemicals.objects.count()
-    total_locations = Locations.objects.count()
-    
-    # Get expiring soon count (within next 30 days)
-    thirty_days_from_now = timezone.now().date() + timedelta(days=30)
-    expiring_soon = Chemicals.objects.filter(expires__lte=thirty_days_from_now).count()
-    
-    # Get low quantity count (less than 10% of max_quantity)
-    low_quantity = Chemicals.objects.filter(
-        current_quantity__lte=0.1 * F('max_quantity')
-    ).count()
-    
-    # Get chemical types distribution
-    chemical_types = Chemicals.objects.values('chemical_type').annotate(
-        count=Count('id')
+        }}
     )
-    types_dict = {item['chemical_type']: item['count'] for item in chemical_types}
-    
-    # Get chemical states distribution
-    chemical_states = Chemicals.objects.values('chemical_state').annotate(
-        count=Count('id')
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload a CSV or NDJSON file as 'file'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.data.get('file_format') or guess_import_format(upload.name, upload.content_type)
+        if file_format not in IMPORT_FORMATS:
+            return Response({"error": "Invalid file format. Use 'csv' or 'ndjson'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = import_chemicals(read_rows(upload.file, file_format), request.user)
+        except ImportFileError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+    @extend_schema(
+        tags=['Chemicals'],
+        description='Chemicals created or updated, and ids of chemicals deleted, since a sync token. '
+                    'Omit "since" for a full sync; keep calling with the returned token while has_more is true. '
+                    'When reset is true the token had expired and a full sync was returned.',
+        parameters=[
+            OpenApiParameter('since', OpenApiTypes.STR, description='Token from the previous sync'),
+            OpenApiParameter('limit', OpenApiTypes.INT,
+                description=f'Maximum chemicals per response (default {SYNC_PAGE_SIZE}, max {MAX_SYNC_PAGE_SIZE})'),
+        ],
+        responses={200: {
+            'type': 'object',
+            'properties': {
+                'changes': {'type': 'array', 'items': {'type': 'object'}},
+                'deleted': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'id': {'type': 'string', 'format': 'uuid'},
+                            'deleted_at': {'type': 'string', 'format': 'date-time'}
+                        }
+                    }
+                },
+                'token': {'type': 'string'},
+                'has_more': {'type': 'boolean'},
+                'reset': {'type': 'boolean'}
+            }
+        }}
     )
-    states_dict = {item['chemical_state']: item['count'] for item in chemical_states}
-    
-    # Get chemicals by location
-    chemicals_by_location = Locations.objects.annotate(
-        chemical_count=Count('chemicals')
-    ).values('name', 'chemical_count')
-    
-    response_data = {
-        'total_chemicals': total_chemicals,
-        'total_locations': total_locations,
-        'expiring_soon': expiring_soon,
-        'low_quantity': low_quantity,
-        'chemical_types': types_dict,
-        'chemical_states': states_dict,
-        'chemicals_by_location': [
-            {'location': item['name'], 'count': item['chemical_count']}
-            for item in chemicals_by_location
-        ]
-    }
-    
-    return Response(response_data)
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', SYNC_PAGE_SIZE)), MAX_SYNC_PAGE_SIZE)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit must be positive"}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = optimize_queryset(Chemicals.objects.all(), ChemicalSerializer, extra_fields=('updated_at',))
+        try:
+            chemicals, deleted, token, has_more, reset = get_changes(
+                request.query_params.get('since'), limit, queryset
+            )
+        except InvalidSyncToken as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'changes': ChemicalSerializer(chemicals, many=True, context=self.get_serializer_context()).data,
+            'deleted': [{'id': row['chemical_id'], 'deleted_at': row['deleted_at']} for row in deleted],
+            'token': token,
+            'has_more': has_more,
+            'reset': reset,
+        })
 
 
 @extend_schema(
@@ -289,6 +426,21 @@ def get_dashboard_overview(request):
                         'usage': {'type': 'number'}
                     }
                 }
+            },
+            'locations': {
+                'type': 'array',
+                'description': 'Every location in tree order, with chemicals stored in it and in its whole subtree',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'id': {'type': 'string', 'format': 'uuid'},
+                        'name': {'type': 'string'},
+                        'parent': {'type': 'string', 'format': 'uuid', 'nullable': True},
+                        'depth': {'type': 'integer'},
+                        'chemicals': {'type': 'integer'},
+                        'subtree_chemicals': {'type': 'integer'}
+                    }
+                }
             }
         }
     }}
@@ -296,28 +448,47 @@ def get_dashboard_overview(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_dashboard_overview(request):
-    today = timezone.now().date()
+    # The payload is the same for every user, so it is computed once and
+    # shared through the cache; the date is part of the key because the
+    # expiry counts and monthly buckets depend on it.
+    today = timezone.localdate()
+    overview = get_or_refresh(
+        f'inventory:dashboard-overview:{today.isoformat()}',
+        lambda: _compute_dashboard_overview(today),
+        ttl=settings.DASHBOARD_CACHE_TTL,
+        max_stale=settings.DASHBOARD_CACHE_MAX_STALE,
+    )
+    return Response(overview)
+
+
+def _compute_dashboard_overview(today):
     current_month_start = today.replace(day=1)
-    last_month_start = (current_month_start - timedelta(days=1)).replace(day=1)
-    six_months_ago = today - timedelta(days=180)
-
-    # Basic stats
-    total_chemicals = Chemicals.objects.count()
-    expired_chemicals = Chemicals.objects.filter(expires__lt=today).count()
-    low_stock_alerts = Chemicals.objects.filter(quantity__lt=100).count()
-
-    # Calculate monthly usage
-    current_month_usage = ChemicalActivity.objects.filter(
-        timestamp__gte=current_month_start,
-        action__in=['used', 'removed']
-    ).aggregate(total=Sum('quantity'))['total'] or 0
-
-    last_month_usage = ChemicalActivity.objects.filter(
-        timestamp__gte=last_month_start,
-        timestamp__lt=current_month_start,
-        action__in=['used', 'removed']
-    ).aggregate(total=Sum('quantity'))['total'] or 0
+    last_month_start = _shift_month(current_month_start, -1)
+    trend_months = [_shift_month(current_month_start, -i) for i in range(USAGE_TREND_MONTHS - 1, -1, -1)]
 
+    # Basic stats in a single pass over the chemicals table
+    stats = Chemicals.objects.aggregate(
+        total_chemicals=Count('id'),
+        expired_chemicals=Count('id', filter=Q(expires__lt=today)),
+        low_stock_alerts=Count('id', filter=Q(quantity__lt=100)),
+    )
+
+    # Monthly usage for the whole trend window from the daily rollup, so the
+    # cost follows the number of days rather than the number of activities.
+    # order_by() drops the default ordering so it doesn't leak into GROUP BY.
+    monthly_usage = ChemicalUsageDaily.objects.filter(
+        day__gte=trend_months[0],
+        day__lt=_shift_month(current_month_start, 1),
+        action__in=USAGE_ACTIONS,
+    ).annotate(
+        month=TruncMonth('day')
+    ).values('month').annotate(
+        total=Sum('quantity')
+    ).order_by()
+    usage_by_month = {row['month']: row['total'] or 0 for row in monthly_usage}
+
+    current_month_usage = usage_by_month.get(current_month_start, 0)
+    last_month_usage = usage_by_month.get(last_month_start, 0)
     monthly_usage_change = ((current_month_usage - last_month_usage) / last_month_usage * 100) if last_month_usage > 0 else 0
 
     # Get recent activity
@@ -339,32 +510,51 @@ def get_dashboard_overview(request):
             'timestamp': activity.timestamp
         })
 
-    # Calculate usage trends
-    usage_trends = []
-    for i in range(5, -1, -1):
-        month_date = today - timedelta(days=30 * i)
-        month_start = month_date.replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        monthly_usage = ChemicalActivity.objects.filter(
-            timestamp__date__range=[month_start, month_end],
-            action__in=['used', 'removed']
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-        
-        usage_trends.append({
-            'month': month_date.strftime('%b'),
-            'usage': float(f"{monthly_usage:.2f}")
-        })
+    usage_trends = [
+        {
+            'month': month.strftime('%b'),
+            'usage': float(f"{usage_by_month.get(month, 0):.2f}")
+        }
+        for month in trend_months
+    ]
 
-    return Response({
-        'total_chemicals': total_chemicals,
-        'expired_chemicals': expired_chemicals,
-        'low_stock_alerts': low_stock_alerts,
+    return {
+        'total_chemicals': stats['total_chemicals'],
+        'expired_chemicals': stats['expired_chemicals'],
+        'low_stock_alerts': stats['low_stock_alerts'],
         'monthly_usage': current_month_usage,
         'monthly_usage_change': monthly_usage_change,
         'recent_activity': activity_list,
-        'usage_trends': usage_trends
-    })
+        'usage_trends': usage_trends,
+        'locations': subtree_chemical_counts(),
+    }
+
+
+@extend_schema(
+    tags=['Dashboard'],
+    description='Dashboard cache hit/miss counters (admin only)',
+    responses={200: {
+        'type': 'object',
+        'properties': {
+            'hits': {'type': 'integer'},
+            'stale': {'type': 'integer'},
+            'misses': {'type': 'integer'},
+            'refreshes': {'type': 'integer'},
+            'hit_ratio': {'type': 'number', 'format': 'float'}
+        }
+    }}
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_dashboard_cache_stats(request):
+    if request.user.role != 'admin':
+        return Response({"error": "Only admins can view cache statistics"}, status=status.HTTP_403_FORBIDDEN)
+    return Response(cache_stats())
+
+
+def _shift_month(month_start, months):
+    year, month = divmod(month_start.month - 1 + months, 12)
+    return date(month_start.year + year, month + 1, 1)
 
 
 @extend_schema(
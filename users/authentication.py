@@ -0,0 +1,98 @@
+"""
+JWT authentication with a short-lived per-process user cache.
+
+``JWTAuthentication`` loads the user from the database on every request.
+``CachedJWTAuthentication`` keeps the loaded user in process memory for
+``AUTH_USER_CACHE_TTL`` seconds, keyed by user id and the token's ``ver``
+claim (``Users.token_version`` when the token was issued).
+
+Every save or deletion of a user replaces the user's stamp in the shared
+cache once it commits, and a cached user is only used while the stamp it
+was loaded under is current. So changes reach every process at once:
+changing the password or deactivating a user raises ``token_version``, and
+the reload rejects every older token. A stamp missing from the shared cache
+(e.g. culled) is replaced, which also forces a reload.
+"""
+import copy
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Users
+
+TOKEN_VERSION_CLAIM = 'ver'
+STAMP_KEY_PREFIX = 'users:auth-stamp:'
+
+# (user id, token version) -> (expires at, stamp, user)
+_users = {}
+_users_lock = threading.Lock()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed(_("Token contained no recognizable user identification"))
+        key = (str(user_id), validated_token.get(TOKEN_VERSION_CLAIM, 0))
+
+        # Read before the user is loaded, so a change committed in between
+        # leaves the entry with an outdated stamp
+        stamp = get_stamp(key[0])
+        entry = _users.get(key)
+        if entry is not None and entry[0] > time.monotonic() and entry[1] == stamp:
+            # A copy, so nothing set on request.user leaks into other requests
+            return copy.copy(entry[2])
+
+        user = super().get_user(validated_token)
+        if user.token_version != key[1]:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_not_valid")
+
+        with _users_lock:
+            _users[key] = (time.monotonic() + settings.AUTH_USER_CACHE_TTL, stamp, user)
+            if len(_users) > settings.AUTH_USER_CACHE_SIZE:
+                _prune()
+        return copy.copy(user)
+
+
+def get_stamp(user_id):
+    key = STAMP_KEY_PREFIX + user_id
+    stamp = cache.get(key)
+    if stamp is None:
+        stamp = uuid.uuid4().hex
+        if not cache.add(key, stamp, timeout=None):
+            stamp = cache.get(key, stamp)
+    return stamp
+
+
+def _prune():
+    now = time.monotonic()
+    for key, (expires_at, _stamp, _user) in list(_users.items()):
+        if expires_at <= now:
+            del _users[key]
+    # Still full of live entries: start over rather than grow without bound
+    if len(_users) > settings.AUTH_USER_CACHE_SIZE:
+        _users.clear()
+
+
+@receiver(post_save, sender=Users)
+@receiver(post_delete, sender=Users)
+def evict_user(sender, instance, using, **kwargs):
+    user_id = str(instance.pk)
+    with _users_lock:
+        for key in [key for key in _users if key[0] == user_id]:
+            del _users[key]
+    # Other processes drop theirs on their next use of it
+    transaction.on_commit(
+        lambda: cache.set(STAMP_KEY_PREFIX + user_id, uuid.uuid4().hex, timeout=None), using=using
+    )
@@ -0,0 +1,86 @@
+"""
+Refresh-token blacklist.
+
+Revoked refresh tokens are stored in ``RevokedToken`` by their ``jti``.
+Each process keeps the ``jti`` of every unexpired revoked token in memory,
+so ``is_revoked`` is a set lookup. The set is topped up with newly revoked
+tokens at most every ``REVOKED_TOKEN_SYNC_INTERVAL`` seconds, and tokens
+past their expiry are dropped from it.
+
+Rotation does not depend on that sync: ``revoke`` inserts into a unique
+index, so a refresh token can be used once, even when it is replayed to
+another process before the sync. ``manage.py prune_revoked_tokens`` deletes
+expired rows.
+"""
+import threading
+import time
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+
+# Revocations may commit a little after their revoked_at
+SYNC_OVERLAP = timedelta(minutes=1)
+
+# jti -> expiry
+_revoked = {}
+_synced_at = None
+_next_sync = 0
+_lock = threading.Lock()
+
+
+def is_revoked(jti):
+    if time.monotonic() >= _next_sync:
+        _sync()
+    return jti in _revoked
+
+
+def revoke(jti, expires_at):
+    """
+    Revoke the token ``jti``. Returns ``False`` if it already was, in which
+    case it must not be honoured.
+    """
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+    except IntegrityError:
+        _revoked[jti] = expires_at
+        return False
+    transaction.on_commit(partial(_revoked.__setitem__, jti, expires_at))
+    return True
+
+
+def _sync():
+    global _synced_at, _next_sync
+    with _lock:
+        if time.monotonic() < _next_sync:
+            return
+        now = timezone.now()
+        rows = RevokedToken.objects.filter(expires_at__gt=now)
+        if _synced_at is not None:
+            rows = rows.filter(revoked_at__gte=_synced_at - SYNC_OVERLAP)
+        _revoked.update(rows.values_list('jti', 'expires_at'))
+
+        for jti in [jti for jti, expires_at in _revoked.items() if expires_at <= now]:
+            del _revoked[jti]
+        _synced_at = now
+        _next_sync = time.monotonic() + settings.REVOKED_TOKEN_SYNC_INTERVAL
+
+
+def reset():
+    """Forget the in-memory set; it is reloaded in full on next use."""
+    global _synced_at, _next_sync
+    with _lock:
+        _revoked.clear()
+        _synced_at = None
+        _next_sync = 0
+
+
+def prune_revoked_tokens():
+    """Delete revoked tokens that have expired. Returns the number deleted."""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
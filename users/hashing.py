@@ -0,0 +1,70 @@
+"""
+Password hashing across a process pool, for creating many users at once.
+
+Every hash costs the full work factor of the password hasher, so hashing
+hundreds of passwords one after another takes minutes. Each web process
+starts one pool of ``USER_PROVISIONING_WORKERS`` on first use and keeps it,
+so concurrent uploads share it rather than each starting their own. Worker
+processes import this module before Django is set up, so it must not import
+models.
+"""
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+# Fewer passwords than this are hashed in process; starting workers costs more
+MIN_PARALLEL_HASHES = 16
+
+_pool = None
+_pool_workers = None
+_lock = threading.Lock()
+
+
+def hash_passwords(passwords):
+    """``make_password`` each of ``passwords``, across processes when there are many."""
+    workers = min(settings.USER_PROVISIONING_WORKERS, len(passwords))
+    if len(passwords) < MIN_PARALLEL_HASHES or workers < 2:
+        return [make_password(password) for password in passwords]
+
+    chunksize = max(len(passwords) // (workers * 4), 1)
+    try:
+        return list(_get_pool().map(make_password, passwords, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a new pool next time
+        shutdown_pool()
+        raise
+
+
+def _get_pool():
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is None or _pool_workers != settings.USER_PROVISIONING_WORKERS:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Spawned rather than forked: the web process may be running threads
+            _pool = ProcessPoolExecutor(
+                settings.USER_PROVISIONING_WORKERS, mp_context=get_context('spawn'), initializer=_setup_worker
+            )
+            _pool_workers = settings.USER_PROVISIONING_WORKERS
+        return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _pool_workers = None, None
+
+
+def _setup_worker():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chemoventry.settings')
+    django.setup()
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.provisioning import (
+    PROVISION_FORMATS,
+    ProvisionFileError,
+    guess_provision_format,
+    provision_users,
+    read_rows,
+)
+
+
+class Command(BaseCommand):
+    help = "Create users in bulk from a CSV or JSON file (email, first_name, last_name, password, role)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON file of users')
+        parser.add_argument('--format', choices=PROVISION_FORMATS, dest='file_format',
+                            help='File format (default: from the file extension)')
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or guess_provision_format(options['path'])
+        if file_format is None:
+            raise CommandError("Cannot tell the file format from its extension; pass --format")
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                rows = read_rows(stream, file_format)
+        except (OSError, ProvisionFileError) as e:
+            raise CommandError(str(e))
+        result = provision_users(rows)
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        if result['failed'] > len(result['errors']):
+            self.stderr.write(f"... and {result['failed'] - len(result['errors'])} more invalid row(s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} user(s), skipped {result['failed']} invalid row(s)"
+        ))
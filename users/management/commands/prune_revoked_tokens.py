@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from users.blacklist import prune_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete revoked refresh tokens that have expired (run periodically)"
+
+    def handle(self, *args, **options):
+        deleted = prune_revoked_tokens()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired revoked token(s)"))
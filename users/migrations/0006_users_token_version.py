@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_alter_users_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='users',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:00
+
+from django.db import migrations, models
+
+
+def backfill_search_fields(apps, schema_editor):
+    from users.search import SEARCH_FIELDS, normalize_search
+    Users = apps.get_model('users', 'Users')
+    users = list(Users.objects.using(schema_editor.connection.alias).only(*SEARCH_FIELDS))
+    for user in users:
+        for field in SEARCH_FIELDS:
+            max_length = Users._meta.get_field(f'{field}_search').max_length
+            setattr(user, f'{field}_search', normalize_search(getattr(user, field))[:max_length])
+    Users.objects.using(schema_editor.connection.alias).bulk_update(
+        users, [f'{field}_search' for field in SEARCH_FIELDS], batch_size=500
+    )
+
+
+def install_search_indexes(apps, schema_editor):
+    from users.search import install_search_indexes
+    install_search_indexes(schema_editor.connection)
+
+
+def uninstall_search_indexes(apps, schema_editor):
+    from users.search import uninstall_search_indexes
+    uninstall_search_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='users',
+            name='email_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='users',
+            name='first_name_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='users',
+            name='last_name_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_search_fields, migrations.RunPython.noop),
+        migrations.RunPython(install_search_indexes, uninstall_search_indexes),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, PermissionsMixin, BaseUserManager
+from django.utils import timezone
 import uuid
 
+from .search import SEARCH_FIELDS, normalize_search
+
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -56,6 +59,14 @@ class Users(AbstractUser, PermissionsMixin):
     )
     join_date = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    # Carried in JWTs as the "ver" claim; raising it invalidates every token
+    # issued before (see users.authentication)
+    token_version = models.PositiveIntegerField(default=0)
+    # Lower-cased copies of the names and email for indexed search, kept
+    # current by save() (see users.search)
+    first_name_search = models.CharField(max_length=100, db_index=True, default='', editable=False)
+    last_name_search = models.CharField(max_length=100, db_index=True, default='', editable=False)
+    email_search = models.CharField(max_length=254, db_index=True, default='', editable=False)
     username = None
 
     objects = CustomUserManager()
@@ -76,3 +87,42 @@ class Users(AbstractUser, PermissionsMixin):
 
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}"
+
+    def revoke_tokens(self):
+        """Invalidate every token issued so far, once saved."""
+        self.token_version += 1
+
+    def set_search_fields(self):
+        for field in SEARCH_FIELDS:
+            search_field = self._meta.get_field(f'{field}_search')
+            setattr(self, search_field.attname, normalize_search(getattr(self, field))[:search_field.max_length])
+
+    def save(self, *args, **kwargs):
+        self.set_search_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not SEARCH_FIELDS.isdisjoint(update_fields):
+            kwargs['update_fields'] = {*update_fields, *(f'{field}_search' for field in SEARCH_FIELDS)}
+
+        # Deactivating a user logs them out everywhere
+        if not self._state.adding and not self.is_active and (
+            type(self).objects.filter(pk=self.pk, is_active=True).exists()
+        ):
+            self.revoke_tokens()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'token_version'}
+        super().save(*args, **kwargs)
+
+
+class RevokedToken(models.Model):
+    """
+    A refresh token that may no longer be used, by its ``jti`` claim. Kept
+    until the token would have expired anyway. See ``users.blacklist``.
+    """
+    id = models.UUIDField(unique=True, default=uuid.uuid4, primary_key=True)
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.jti
@@ -1,9 +1,14 @@
 from rest_framework import permissions
 
+
+def is_admin(user):
+    return user.role == 'admin' or user.role == 'administrator'
+
+
 class IsOwnerOrAdmin(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         # Allow administrators to access any user
-        if request.user.role == 'admin' or request.user.role == 'administrator':
+        if is_admin(request.user):
             return True
         # Allow users to access their own profile
-        return obj.id == request.user.id 
\ No newline at end of file
+        return obj.id == request.user.id
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Bulk creation of user accounts from CSV or JSON.
+
+Each row has ``email``, ``first_name``, ``last_name``, ``password`` and
+optionally ``role`` (default attendant). Rows are validated first, and
+emails that are taken are found with one ``IN`` query. The passwords of the
+valid rows are then hashed across a process pool, since every hash costs
+the full PBKDF2 work factor, and the accounts are inserted with
+``bulk_create`` in one transaction. Invalid rows are reported and skipped.
+
+An account created with one of the emails while the file was being
+processed makes the bulk insert fail. The rows are then inserted one at a
+time, and the ones that conflict are reported like other taken emails.
+"""
+import csv
+import io
+import json
+
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from .hashing import hash_passwords
+from .models import Users
+from .search import normalize_search
+from .serializers import UserProvisionSerializer
+
+PROVISION_FORMATS = ['csv', 'json']
+PROVISION_BATCH_SIZE = 500
+
+# Rows beyond this many failures are still counted, but not described
+MAX_REPORTED_ERRORS = 1000
+
+EMAIL_TAKEN = {'email': ['A user with this email already exists.']}
+
+
+class ProvisionFileError(ValueError):
+    pass
+
+
+def guess_provision_format(filename, content_type=None):
+    if filename.lower().endswith('.json') or content_type == 'application/json':
+        return 'json'
+    if filename.lower().endswith('.csv') or content_type == 'text/csv':
+        return 'csv'
+    return None
+
+
+def read_rows(stream, file_format):
+    """Return the records of a binary ``stream`` as a list of dicts (or ``None``s for non-objects)."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'csv':
+            rows = list(csv.DictReader(text))
+            for row in rows:
+                row.pop(None, None)  # values beyond the header
+            return rows
+        rows = json.load(text)
+    except (csv.Error, UnicodeDecodeError, ValueError) as e:
+        raise ProvisionFileError(f"Could not read the file: {e}")
+    finally:
+        # Leave the underlying file open for the caller
+        text.detach()
+    if not isinstance(rows, list):
+        raise ProvisionFileError("The JSON file must hold a list of users")
+    return [row if isinstance(row, dict) else None for row in rows]
+
+
+def provision_users(rows):
+    """
+    Validate ``rows`` and create a user for each valid one. Returns
+    ``{'created', 'failed', 'errors'}``, where ``errors`` lists the first
+    ``MAX_REPORTED_ERRORS`` failures by row number (from 1).
+    """
+    result = {'created': 0, 'failed': 0, 'errors': []}
+
+    def reject(number, errors):
+        result['failed'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'row': number, 'errors': errors})
+
+    # One serializer validates every row, so its fields are only built once
+    serializer = UserProvisionSerializer()
+    valid, seen = [], set()
+    for number, row in enumerate(rows, start=1):
+        try:
+            if row is None:
+                raise serializers.ValidationError({'non_field_errors': ['Row is not an object.']})
+            data = serializer.run_validation(row)
+        except serializers.ValidationError as e:
+            reject(number, e.detail)
+            continue
+        email = normalize_search(data['email'])
+        if email in seen:
+            reject(number, {'email': ['Duplicate email in this file.']})
+            continue
+        seen.add(email)
+        valid.append((number, data))
+
+    # Emails are compared case-insensitively, through the indexed search copy
+    taken = set(Users.objects.filter(email_search__in=seen).order_by().values_list('email_search', flat=True))
+    users = []
+    for number, data in valid:
+        if normalize_search(data['email']) in taken:
+            reject(number, EMAIL_TAKEN)
+        else:
+            users.append((number, data))
+
+    passwords = hash_passwords([data.pop('password') for _, data in users])
+    accounts = []
+    for (number, data), password in zip(users, passwords):
+        user = Users(password=password, **data)
+        user.set_search_fields()
+        accounts.append((number, user))
+
+    try:
+        with transaction.atomic():
+            Users.objects.bulk_create([user for _, user in accounts], batch_size=PROVISION_BATCH_SIZE)
+        result['created'] = len(accounts)
+    except IntegrityError:
+        # Someone took one of the emails since they were checked
+        for number, user in accounts:
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+            except IntegrityError:
+                reject(number, EMAIL_TAKEN)
+            else:
+                result['created'] += 1
+    result['errors'].sort(key=lambda error: error['row'])
+    return result
@@ -0,0 +1,93 @@
+"""
+Indexed user search for the user list and the autocomplete endpoint.
+
+``Users`` keeps lower-cased, accent-stripped copies of ``first_name``,
+``last_name`` and ``email`` (``*_search``), each with a B-tree index. Each
+search term must match one of them:
+
+- by prefix everywhere, written as a range so the B-tree index is used
+  (on PostgreSQL the columns use the "C" collation for that).
+- on PostgreSQL, anywhere in the value for terms of three or more
+  characters, through the ``gin_trgm_ops`` indexes installed by the
+  migration.
+
+The copies are kept current by ``Users.save()``; writes that bypass it
+(``QuerySet.update()``, ``bulk_create()``) must call
+``Users.set_search_fields()`` or fill them in themselves.
+"""
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q
+
+SEARCH_FIELDS = frozenset({'first_name', 'last_name', 'email'})
+
+# Trigram indexes only help with terms at least this long
+TRIGRAM_MIN_LENGTH = 3
+
+USER_SEARCH_LIMIT = 10
+MAX_USER_SEARCH_LIMIT = 50
+
+_POSTGRES_INSTALL = [
+    f'ALTER TABLE users_users ALTER COLUMN {field}_search TYPE varchar({length}) COLLATE "C"'
+    for field, length in [('email', 254), ('first_name', 100), ('last_name', 100)]
+] + ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+    f"""
+    CREATE INDEX IF NOT EXISTS users_users_{field}_search_trgm
+    ON users_users USING GIN ({field}_search gin_trgm_ops)
+    """
+    for field in sorted(SEARCH_FIELDS)
+]
+
+_POSTGRES_UNINSTALL = [
+    f"DROP INDEX IF EXISTS users_users_{field}_search_trgm" for field in sorted(SEARCH_FIELDS)
+]
+
+
+def normalize_search(value):
+    """Lower-case ``value`` and strip its accents."""
+    value = unicodedata.normalize('NFKD', value or '').lower()
+    return ''.join(char for char in value if not unicodedata.combining(char))
+
+
+def install_search_indexes(connection):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for statement in _POSTGRES_INSTALL:
+                cursor.execute(statement)
+
+
+def uninstall_search_indexes(connection):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for statement in _POSTGRES_UNINSTALL:
+                cursor.execute(statement)
+
+
+def search_users(queryset, value):
+    """Restrict ``queryset`` to users matching every term of ``value``."""
+    terms = re.findall(r'[\w.@+-]+', normalize_search(value))
+    if not terms:
+        return queryset.none()
+
+    trigrams = connections[queryset.db].vendor == 'postgresql'
+    for term in terms:
+        condition = Q()
+        for field in sorted(SEARCH_FIELDS):
+            if trigrams and len(term) >= TRIGRAM_MIN_LENGTH:
+                condition |= Q(**{f'{field}_search__contains': term})
+            else:
+                condition |= prefix_range(f'{field}_search', term)
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def prefix_range(field, prefix):
+    """
+    ``Q`` for the values of ``field`` starting with ``prefix``, written as a
+    range so it can use the index: every such value sorts before ``prefix``
+    with its last character replaced by the next one.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
@@ -1,16 +1,46 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from .authentication import TOKEN_VERSION_CLAIM
+from .blacklist import is_revoked, revoke
 
 User = get_user_model()
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        return token
+
     def validate(self, attrs):
         data = super().validate(attrs)
         data['user'] = UserSerializers(self.user).data
         return data
     
+class BlacklistTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh with ``users.blacklist`` in place of the token_blacklist app."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        jti = refresh[api_settings.JTI_CLAIM]
+        if is_revoked(jti):
+            raise TokenError('Token is blacklisted')
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION and not revoke(jti, datetime_from_epoch(refresh['exp'])):
+                raise TokenError('Token is blacklisted')
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
 class UserSerializers(serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
     
@@ -18,6 +48,7 @@ class UserSerializers(serializers.ModelSerializer):
         model = User
         fields = ['id', 'email', 'first_name', 'last_name', 'full_name', 'role', 'join_date', 'is_active']
         read_only_fields = ['id', 'join_date']
+        method_field_sources = {'full_name': ['first_name', 'last_name']}
 
     def get_full_name(self, obj):
         return obj.get_full_name()
@@ -32,6 +63,21 @@ class PasswordChangeSerializer(serializers.Serializer):
             raise serializers.ValidationError({"new_password": "Password fields didn't match."})
         return attrs
 
+class UserProvisionSerializer(serializers.Serializer):
+    """One row of a bulk provisioning file; email uniqueness is checked by the caller."""
+    email = serializers.EmailField(max_length=254)
+    first_name = serializers.CharField(max_length=100)
+    last_name = serializers.CharField(max_length=100)
+    role = serializers.ChoiceField(choices=User.ROLE_CHOICES, default='attendant', allow_blank=True)
+    password = serializers.CharField(write_only=True, validators=[validate_password])
+
+    def validate_email(self, value):
+        return User.objects.normalize_email(value)
+
+    def validate_role(self, value):
+        # An empty CSV cell means the default
+        return value or 'attendant'
+
 class RegistrationSerializers(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     confirm_password = serializers.CharField(write_only=True, required=True)
@@ -1,3 +1,378 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.throttling import SimpleRateThrottle
+
+from chemoventry.throttling import UserRateThrottle
+from inventory.models import IdempotencyKey
+from . import authentication, blacklist, hashing, provisioning
+from .models import RevokedToken, Users
+from .search import search_users
+
+
+def make_user(**kwargs):
+    fields = {
+        'email': 'admin@chemoventry.com',
+        'password': 'admin123',
+        'first_name': 'John',
+        'last_name': 'Admin',
+        'role': 'admin',
+    }
+    fields.update(kwargs)
+    return Users.objects.create_user(**fields)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        authentication._users.clear()
+        cache.clear()
+        caches['throttle'].clear()
+        self.user = make_user()
+        self.client = APIClient()
+
+    def login(self, password='admin123'):
+        response = self.client.post(
+            '/api/users/token/', {'email': self.user.email, 'password': password}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def me(self, access):
+        return self.client.get('/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_user_is_loaded_once_per_ttl(self):
+        access = self.login()['access']
+        self.assertEqual(self.me(access).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.me(access)
+        self.assertEqual(response.data['email'], self.user.email)
+
+    def test_saving_a_user_evicts_it(self):
+        access = self.login()['access']
+        self.me(access)
+        Users.objects.filter(pk=self.user.pk).update(first_name='Jane')
+        self.assertEqual(self.me(access).data['first_name'], 'John')
+
+        user = Users.objects.get(pk=self.user.pk)
+        user.save()
+        self.assertEqual(self.me(access).data['first_name'], 'Jane')
+
+    def test_password_change_revokes_older_tokens(self):
+        access = self.login()['access']
+        self.me(access)
+        response = self.client.post(
+            '/api/users/change_password/',
+            {'old_password': 'admin123', 'new_password': 'N3w-passw0rd!', 'confirm_password': 'N3w-passw0rd!'},
+            format='json',
+            HTTP_AUTHORIZATION=f'Bearer {access}',
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.me(access).status_code, 401)
+        self.assertEqual(self.me(response.data['access']).status_code, 200)
+        self.assertEqual(self.me(self.login('N3w-passw0rd!')['access']).status_code, 200)
+
+    def test_revocation_reaches_other_processes(self):
+        access = self.login()['access']
+        self.me(access)
+        # The entry as another process would still hold it
+        other_process = dict(authentication._users)
+
+        user = Users.objects.get(pk=self.user.pk)
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['is_active'])
+        authentication._users.update(other_process)
+        self.assertEqual(self.me(access).status_code, 401)
+
+    def test_culled_stamp_forces_a_reload(self):
+        access = self.login()['access']
+        self.me(access)
+        Users.objects.filter(pk=self.user.pk).update(first_name='Jane')
+        cache.delete(authentication.STAMP_KEY_PREFIX + str(self.user.pk))
+        self.assertEqual(self.me(access).data['first_name'], 'Jane')
+
+    def test_profile_update_keeps_changes_missed_by_the_cache(self):
+        access = self.login()['access']
+        self.me(access)
+        Users.objects.filter(pk=self.user.pk).update(last_name='Hopper')
+        response = self.client.patch(
+            '/api/users/me/', {'first_name': 'Grace'}, format='json', HTTP_AUTHORIZATION=f'Bearer {access}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['last_name'], 'Hopper')
+        user = Users.objects.get(pk=self.user.pk)
+        self.assertEqual((user.first_name, user.last_name), ('Grace', 'Hopper'))
+
+    def test_new_tokens_are_not_stored_for_replay(self):
+        access = self.login()['access']
+        response = self.client.post(
+            '/api/users/change_password/',
+            {'old_password': 'admin123', 'new_password': 'N3w-passw0rd!', 'confirm_password': 'N3w-passw0rd!'},
+            format='json',
+            HTTP_AUTHORIZATION=f'Bearer {access}',
+            HTTP_IDEMPOTENCY_KEY='password-1',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        # Other writes are still stored
+        self.client.patch(
+            '/api/users/me/', {'first_name': 'Grace'}, format='json',
+            HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}', HTTP_IDEMPOTENCY_KEY='profile-1',
+        )
+        self.assertEqual(IdempotencyKey.objects.get().response_body['first_name'], 'Grace')
+        self.assertFalse(any(
+            response.data[name] in json.dumps(body)
+            for body in IdempotencyKey.objects.values_list('response_body', flat=True)
+            for name in ('access', 'refresh')
+        ))
+
+    def test_deactivation_revokes_tokens(self):
+        access = self.login()['access']
+        self.me(access)
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.me(access).status_code, 401)
+
+
+class RefreshTokenBlacklistTests(TestCase):
+    def setUp(self):
+        blacklist.reset()
+        caches['throttle'].clear()
+        self.user = make_user()
+        self.client = APIClient()
+        response = self.client.post(
+            '/api/users/token/', {'email': self.user.email, 'password': 'admin123'}, format='json'
+        )
+        self.refresh = response.data['refresh']
+
+    def use(self, refresh):
+        return self.client.post('/api/users/token/refresh/', {'refresh': refresh}, format='json')
+
+    def test_refresh_token_can_be_used_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.use(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], self.refresh)
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+        # Known revoked: rejected from memory
+        with self.assertNumQueries(0):
+            self.assertEqual(self.use(self.refresh).status_code, 401)
+        self.assertEqual(self.use(response.data['refresh']).status_code, 200)
+
+    def test_replay_to_another_process_is_rejected(self):
+        self.assertEqual(self.use(self.refresh).status_code, 200)
+        blacklist.reset()
+        caches['throttle'].clear()
+        blacklist._next_sync = float('inf')  # revocation not synced yet
+        self.assertEqual(self.use(self.refresh).status_code, 401)
+
+    def test_expired_tokens_are_pruned(self):
+        RevokedToken.objects.create(jti='old', expires_at=timezone.now() - timedelta(minutes=1))
+        RevokedToken.objects.create(jti='current', expires_at=timezone.now() + timedelta(days=1))
+        self.assertEqual(blacklist.prune_revoked_tokens(), 1)
+        self.assertTrue(blacklist.is_revoked('current'))
+        self.assertFalse(blacklist.is_revoked('old'))
+
+
+class SlidingWindowThrottleTests(TestCase):
+    def setUp(self):
+        caches['throttle'].clear()
+        self.client = APIClient()
+
+    def login(self):
+        return self.client.post(
+            '/api/users/token/', {'email': 'nobody@chemoventry.com', 'password': 'wrong'}, format='json'
+        )
+
+    @patch.dict(SimpleRateThrottle.THROTTLE_RATES, {'auth': '3/hour'})
+    def test_login_attempts_are_limited_per_ip(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, 401)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        other_ip = self.client.post(
+            '/api/users/token/', {'email': 'nobody@chemoventry.com', 'password': 'wrong'},
+            format='json', REMOTE_ADDR='10.0.0.2',
+        )
+        self.assertEqual(other_ip.status_code, 401)
+
+    @patch.dict(SimpleRateThrottle.THROTTLE_RATES, {'auth': '3/hour'})
+    def test_forwarded_for_cannot_be_spoofed(self):
+        # The proxy appends the real address; earlier entries are the client's
+        for spoofed in ['1.1.1.1', '2.2.2.2', '3.3.3.3']:
+            response = self.client.post(
+                '/api/users/token/', {'email': 'nobody@chemoventry.com', 'password': 'wrong'},
+                format='json', HTTP_X_FORWARDED_FOR=f'{spoofed}, 10.0.0.4',
+            )
+            self.assertEqual(response.status_code, 401)
+        response = self.client.post(
+            '/api/users/token/', {'email': 'nobody@chemoventry.com', 'password': 'wrong'},
+            format='json', HTTP_X_FORWARDED_FOR='4.4.4.4, 10.0.0.4',
+        )
+        self.assertEqual(response.status_code, 429)
+
+    @patch.dict(SimpleRateThrottle.THROTTLE_RATES, {'user': '10/min'})
+    def test_previous_window_counts_by_its_overlap(self):
+        throttle = UserRateThrottle()
+        request = self.client.get('/').wsgi_request
+        request.user = None
+        request.META['REMOTE_ADDR'] = '10.0.0.3'
+
+        with patch.object(throttle, 'timer', return_value=6000.0):  # a window start
+            for _ in range(10):
+                self.assertTrue(throttle.allow_request(request, None))
+            self.assertFalse(throttle.allow_request(request, None))
+
+        # 45s into the next window a quarter of the previous one overlaps:
+        # 10 * 0.25 = 2.5, so 8 more requests fit
+        with patch.object(throttle, 'timer', return_value=6105.0):
+            for _ in range(8):
+                self.assertTrue(throttle.allow_request(request, None))
+            self.assertFalse(throttle.allow_request(request, None))
+            # 10 * (1 - t/60) + 8 < 10 once t > 48s
+            self.assertEqual(throttle.wait(), 3)
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        caches['throttle'].clear()
+        self.admin = make_user()
+        self.ada = make_user(email='ada.lovelace@uni.edu', first_name='Ada', last_name='Lovelace', role='attendant')
+        self.zoe = make_user(email='zoe@uni.edu', first_name='Zoë', last_name='Lovett', role='attendant')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def search(self, value):
+        return set(search_users(Users.objects.all(), value).values_list('email', flat=True))
+
+    def test_terms_match_name_and_email_prefixes(self):
+        self.assertEqual(self.search('lov'), {'ada.lovelace@uni.edu', 'zoe@uni.edu'})
+        self.assertEqual(self.search('LOV ada'), {'ada.lovelace@uni.edu'})
+        self.assertEqual(self.search('zoe'), {'zoe@uni.edu'})
+        self.assertEqual(self.search('ada.love'), {'ada.lovelace@uni.edu'})
+        self.assertEqual(self.search('   '), set())
+
+    def test_search_columns_follow_saves(self):
+        self.zoe.last_name = 'Hopper'
+        self.zoe.save(update_fields=['last_name'])
+        self.assertEqual(self.search('hop'), {'zoe@uni.edu'})
+        self.assertEqual(self.search('lov'), {'ada.lovelace@uni.edu'})
+
+    def test_prefix_search_uses_the_indexes(self):
+        plan = search_users(Users.objects.all(), 'lov').explain()
+        self.assertNotIn('SCAN users_users', plan)
+        self.assertIn('INDEX', plan)
+
+    def test_endpoint_is_bounded(self):
+        response = self.client.get('/api/users/search/', {'q': 'lov', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['email'] for user in response.data], ['ada.lovelace@uni.edu'])
+
+        response = self.client.get('/api/users/search/', {'q': 'lov', 'limit': 1000})
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(self.client.get('/api/users/search/', {'q': 'lov', 'limit': 'x'}).status_code, 400)
+
+    def test_attendants_only_find_themselves(self):
+        self.client.force_authenticate(self.ada)
+        response = self.client.get('/api/users/search/', {'q': 'lov'})
+        self.assertEqual([user['email'] for user in response.data], ['ada.lovelace@uni.edu'])
+
+
+class BulkProvisioningTests(TestCase):
+    def setUp(self):
+        caches['throttle'].clear()
+        self.admin = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def row(self, email, **kwargs):
+        return {'email': email, 'first_name': 'Lab', 'last_name': 'User', 'password': 'Str0ng-pass!', **kwargs}
+
+    def test_json_rows_are_created_and_invalid_ones_reported(self):
+        rows = [
+            self.row('one@uni.edu'),
+            self.row('two@uni.edu', role='admin'),
+            self.row('ADMIN@chemoventry.com'),  # the domain is normalized, the user exists
+            self.row('one@UNI.edu'),
+            self.row('three@uni.edu', password='123'),
+            'not an object',
+        ]
+        # The existing emails, then one insert (wrapped in a savepoint here)
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/users/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4, 5, 6])
+
+        user = Users.objects.get(email='two@uni.edu')
+        self.assertEqual(user.role, 'admin')
+        self.assertTrue(user.check_password('Str0ng-pass!'))
+        self.assertEqual(user.last_name_search, 'user')
+
+    def test_csv_upload(self):
+        upload = SimpleUploadedFile(
+            'users.csv',
+            b'email,first_name,last_name,password,role\r\nfour@uni.edu,Ada,Lovelace,Str0ng-pass!,\r\n',
+            content_type='text/csv',
+        )
+        response = self.client.post('/api/users/bulk/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data, {'created': 1, 'failed': 0, 'errors': []})
+        self.assertEqual(Users.objects.get(email='four@uni.edu').role, 'attendant')
+
+    def test_admin_only(self):
+        attendant = make_user(email='lab@uni.edu', first_name='Lab', last_name='User', role='attendant')
+        self.client.force_authenticate(attendant)
+        response = self.client.post('/api/users/bulk/', [self.row('five@uni.edu')], format='json')
+        self.assertEqual(response.status_code, 403)
+
+        administrator = make_user(email='head@uni.edu', first_name='Head', last_name='User', role='administrator')
+        self.client.force_authenticate(administrator)
+        response = self.client.post('/api/users/bulk/', [self.row('five@uni.edu')], format='json')
+        self.assertEqual(response.data['created'], 1)
+
+    def test_retried_upload_is_replayed(self):
+        rows = [self.row('one@uni.edu')]
+        first = self.client.post('/api/users/bulk/', rows, format='json', HTTP_IDEMPOTENCY_KEY='upload-1')
+        retry = self.client.post('/api/users/bulk/', rows, format='json', HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.assertEqual(retry.data, {'created': 1, 'failed': 0, 'errors': []})
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_emails_taken_during_the_upload_are_reported(self):
+        def hash_and_race(passwords):
+            make_user(email='two@uni.edu', first_name='Quick', last_name='User', role='attendant')
+            return hashing.hash_passwords(passwords)
+
+        rows = [self.row('one@uni.edu'), self.row('two@uni.edu'), self.row('three@uni.edu')]
+        with patch.object(provisioning, 'hash_passwords', side_effect=hash_and_race):
+            response = self.client.post('/api/users/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['errors'], [{'row': 2, 'errors': provisioning.EMAIL_TAKEN}])
+        self.assertEqual(Users.objects.get(email='two@uni.edu').first_name, 'Quick')
+        self.assertTrue(Users.objects.filter(email='three@uni.edu').exists())
+
+    @override_settings(USER_PROVISIONING_WORKERS=2)
+    @patch.object(hashing, 'MIN_PARALLEL_HASHES', 1)
+    def test_passwords_are_hashed_in_worker_processes(self):
+        self.addCleanup(hashing.shutdown_pool)
+        hashes = hashing.hash_passwords(['first-password', 'second-password'])
+        self.assertTrue(check_password('first-password', hashes[0]))
+        self.assertTrue(check_password('second-password', hashes[1]))
+
+        # The pool outlives the call
+        pool = hashing._pool
+        hashing.hash_passwords(['third-password', 'fourth-password'])
+        self.assertIs(hashing._pool, pool)
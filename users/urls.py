@@ -1,9 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     UserView,
     CustomTokenObtainPairView,
+    CustomTokenRefreshView,
     RegistrationView
 )
 
@@ -14,7 +14,7 @@ router.register(r'reg', RegistrationView, basename='registration')  # Corrected
 urlpatterns = [
     # Authentication endpoints
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
     
     # Router URLs
     path('', include(router.urls)),
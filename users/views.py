@@ -1,17 +1,28 @@
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action, permission_classes
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from .serializers import (
     UserSerializers, 
     CustomTokenObtainPairSerializer,
+    BlacklistTokenRefreshSerializer,
     RegistrationSerializers,
     PasswordChangeSerializer
 )
-from .permissions import IsOwnerOrAdmin
+from .permissions import IsOwnerOrAdmin, is_admin
+from .provisioning import (
+    PROVISION_FORMATS,
+    ProvisionFileError,
+    guess_provision_format,
+    provision_users,
+    read_rows,
+)
+from .search import MAX_USER_SEARCH_LIMIT, USER_SEARCH_LIMIT, search_users
+from chemoventry.mixins import QueryOptimizerMixin, optimize_queryset
+from inventory.idempotency import IdempotencyMixin
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 from django.contrib.auth.tokens import default_token_generator
@@ -21,6 +32,7 @@ User = get_user_model()
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_scope = 'auth'
 
     @extend_schema(
         tags=['Authentication'],
@@ -45,14 +57,27 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
-class UserView(viewsets.ModelViewSet):
+class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = BlacklistTokenRefreshSerializer
+
+    @extend_schema(
+        tags=['Authentication'],
+        description='Exchange a refresh token for a new access token and refresh token. '
+                    'Each refresh token can be used once.'
+    )
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+class UserView(IdempotencyMixin, QueryOptimizerMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializers
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    # Its response carries a new token pair, which must not be stored
+    idempotency_exempt_actions = ('change_password',)
 
     def get_queryset(self):
         queryset = User.objects.all()
-        if self.request.user.role != 'admin' and self.request.user.role != 'administrator':
+        if not is_admin(self.request.user):
             return User.objects.filter(id=self.request.user.id)
         
         # Search functionality
@@ -60,11 +85,7 @@ class UserView(viewsets.ModelViewSet):
         role = self.request.query_params.get('role', None)
         
         if search:
-            queryset = queryset.filter(
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search) |
-                Q(email__icontains=search)
-            )
+            queryset = search_users(queryset, search)
         
         if role:
             queryset = queryset.filter(role=role)
@@ -81,7 +102,103 @@ class UserView(viewsets.ModelViewSet):
     )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
+
+    @extend_schema(
+        tags=['Users'],
+        description='Autocomplete users by name or email. Every word of q must start a first name, '
+                    'last name or email (on PostgreSQL, words of 3+ characters may also appear inside them).',
+        parameters=[
+            OpenApiParameter('q', OpenApiTypes.STR, required=True, description='Search text'),
+            OpenApiParameter('limit', OpenApiTypes.INT,
+                             description=f'Maximum results (default {USER_SEARCH_LIMIT}, max {MAX_USER_SEARCH_LIMIT})'),
+            OpenApiParameter('role', OpenApiTypes.STR, enum=['attendant', 'admin', 'administrator']),
+        ],
+        responses={200: UserSerializers(many=True)}
+    )
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', USER_SEARCH_LIMIT)), MAX_USER_SEARCH_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = search_users(self.get_queryset(), request.query_params.get('q', ''))
+        users = optimize_queryset(queryset.order_by('last_name_search', 'first_name_search', 'id'), UserSerializers)
+        return Response(UserSerializers(users[:limit], many=True).data)
     
+    @extend_schema(
+        tags=['Users'],
+        description='Create many users at once (admin only), from a JSON list or an uploaded CSV or JSON file. '
+                    'Each user has email, first_name, last_name, password and optionally role. '
+                    'Invalid rows are reported and skipped; the rest are created.',
+        request={
+            'application/json': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'email': {'type': 'string'},
+                        'first_name': {'type': 'string'},
+                        'last_name': {'type': 'string'},
+                        'password': {'type': 'string'},
+                        'role': {'type': 'string', 'enum': ['attendant', 'admin']}
+                    },
+                    'required': ['email', 'first_name', 'last_name', 'password']
+                }
+            },
+            'multipart/form-data': {
+                'type': 'object',
+                'properties': {
+                    'file': {'type': 'string', 'format': 'binary'},
+                    'file_format': {'type': 'string', 'enum': PROVISION_FORMATS,
+                                    'description': 'Defaults to the file extension'}
+                },
+                'required': ['file']
+            }
+        },
+        responses={200: {
+            'type': 'object',
+            'properties': {
+                'created': {'type': 'integer'},
+                'failed': {'type': 'integer'},
+                'errors': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'row': {'type': 'integer'},
+                            'errors': {'type': 'object'}
+                        }
+                    }
+                }
+            }
+        }}
+    )
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, MultiPartParser])
+    def bulk(self, request):
+        if not is_admin(request.user):
+            return Response({'error': 'Only admins can create users in bulk'}, status=status.HTTP_403_FORBIDDEN)
+
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': "Upload a CSV or JSON file as 'file'"}, status=status.HTTP_400_BAD_REQUEST)
+            file_format = request.data.get('file_format') or guess_provision_format(upload.name, upload.content_type)
+            if file_format not in PROVISION_FORMATS:
+                return Response({'error': "Invalid file format. Use 'csv' or 'json'"}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                rows = read_rows(upload.file, file_format)
+            except ProvisionFileError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data, list):
+            rows = [row if isinstance(row, dict) else None for row in request.data]
+        else:
+            return Response({'error': 'Send a JSON list of users'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(provision_users(rows))
+
     @extend_schema(
         tags=['Users'],
         description='Get or update current user profile'
@@ -92,7 +209,10 @@ class UserView(viewsets.ModelViewSet):
             serializer = self.get_serializer(request.user)
             return Response(serializer.data)
         elif request.method == 'PATCH':
-            serializer = self.get_serializer(request.user, data=request.data, partial=True)
+            # request.user may come from the authentication cache; save over
+            # the current row, not a possibly stale copy of it
+            user = User.objects.get(pk=request.user.pk)
+            serializer = self.get_serializer(user, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
                 return Response(serializer.data)
@@ -100,7 +220,8 @@ class UserView(viewsets.ModelViewSet):
     
     @extend_schema(
         tags=['Users'],
-        description='Change user password',
+        description='Change user password. Every token issued before stops working; '
+                    'the response carries a new token pair.',
         request=PasswordChangeSerializer
     )
     @action(detail=False, methods=['post'])
@@ -109,7 +230,7 @@ class UserView(viewsets.ModelViewSet):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
-        user = request.user
+        user = User.objects.get(pk=request.user.pk)
         if not user.check_password(serializer.validated_data['old_password']):
             return Response(
                 {'old_password': 'Wrong password.'},
@@ -117,8 +238,14 @@ class UserView(viewsets.ModelViewSet):
             )
             
         user.set_password(serializer.validated_data['new_password'])
+        user.revoke_tokens()
         user.save()
-        return Response({'message': 'Password updated successfully'})
+        refresh = CustomTokenObtainPairSerializer.get_token(user)
+        return Response({
+            'message': 'Password updated successfully',
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        })
 
     @extend_schema(
         tags=['Users'],
@@ -152,6 +279,7 @@ class RegistrationView(viewsets.ModelViewSet):
     queryset = User.objects.none()  # Don't expose user list to unauthenticated users
     serializer_class = RegistrationSerializers
     http_method_names = ['post']  # Only allow POST method
+    throttle_scope = 'auth'
 
     @extend_schema(
         tags=['Authentication'],